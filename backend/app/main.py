@@ -1,14 +1,26 @@
+import os
+import sys
+# Modules shared by the backend services live in backend/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import threading
 import json
+import time
 import asyncio
 import logging
-import queue
+import uuid
+import functools
+from typing import Optional
 from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from core.config import settings
 from utils.utils import utility_service
 from services.status import status_service
 from services.response import response_service
+from services.room import room_registry
+from services.admission import admission_controller
+from common.metrics import metrics
 # from services.translation import translation_service  # ensure this runs as needed
 # from services.language_detection import language_detection  # ensure this runs as needed
 
@@ -23,7 +35,7 @@ logger = logging.getLogger(__name__)
 async def lifespan(app : FastAPI):
     await utility_service.start_background_tasks()
     yield
-    utility_service.close_background_tasks()
+    await utility_service.close_background_tasks()
     
 
 app = FastAPI(title="Real-Time Translation Network",lifespan=lifespan)
@@ -37,61 +49,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-#Utility we will think about 
-def get_status_message(timeout=0.5):
-    try:
-        return status_service.status_message_queue.get(timeout=timeout)
-    except queue.Empty:
-        return None
-
-
 @app.get("/")
 async def root():
     logger.info("Root endpoint accessed.")
     return {"message": "Real-Time Translation Network API"}
 
-@app.get("/status")
-def send_status():
-    logger.info("Sending status message...")
+@app.get("/status/stream")
+async def stream_status(request_id: str):
+    """Server-Sent Events stream of the status events of one request id."""
+
+    async def events():
+        frames = asyncio.Queue(maxsize=settings.STATUS_SUBSCRIBER_BACKLOG)
+        status_service.subscribe(request_id, frames)
+        try:
+            while True:
+                try:
+                    status = await asyncio.wait_for(frames.get(), timeout=settings.WS_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(status)}\n\n"
+        finally:
+            status_service.unsubscribe(request_id, frames)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+def get_metrics(format: str = "json"):
+    """Latency histograms and counters; `?format=prometheus` for the text exposition format"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus())
+    return metrics.snapshot()
+
+async def forward_stream(send, frames: asyncio.Queue) -> dict:
+    """Forward partial translation frames through `send` and return the final one, or the first error."""
+    while True:
+        frame = await asyncio.wait_for(frames.get(), timeout=settings.TRANSLATION_RESPONSE_TIMEOUT)
+        # An error ends the stream whether or not it is marked final, e.g. a failed detection
+        if frame.get("final") or "error" in frame:
+            return frame
+        await send(frame)
+
+async def forward_status(websocket: WebSocket, frames: asyncio.Queue):
+    """Push the status events of this socket's requests as they arrive."""
+    while True:
+        await websocket.send_json(await frames.get())
+
+async def run_request(message: dict, send, status_frames: asyncio.Queue, received_at: Optional[float] = None) -> dict:
+    """Send one request through the pipeline and return its result (or error) frame."""
+    request_id = message['id']
+    stream = bool(message.get('stream'))
+    pending = response_service.register(request_id, stream=stream)
+    status_service.subscribe(request_id, status_frames)
+    try:
+        response = await utility_service.start_langauge_detection(message, received_at)
+        logger.debug("Response from language detection service: %s", response)
+        if response.get("status") == "error":
+            metrics.inc("requests_total", outcome="detection_error")
+            return {"error": response.get("message", "Language detection failed.")}
+        if stream:
+            result = await forward_stream(send, pending)
+        else:
+            # Gives up when the request's deadline passes, which is also when the pipeline drops it
+            timeout = settings.TRANSLATION_RESPONSE_TIMEOUT
+            if received_at is not None:
+                timeout = max(0.0, received_at + timeout - time.time())
+            result = await asyncio.wait_for(pending, timeout=timeout)
+        metrics.inc("requests_total", outcome="error" if "error" in result else "translated")
+        # Receive to result, before the result frames are sent
+        metrics.observe_since("request_seconds", received_at)
+        return result
+    except asyncio.CancelledError:
+        # The socket closed (or the server is shutting down); whatever is still queued downstream
+        # is dropped there once its deadline passes
+        logger.info(f"Request {request_id} was cancelled.")
+        metrics.inc("requests_total", outcome="cancelled")
+        raise  # Important: re-raise it so FastAPI can shut down cleanly
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out waiting for translation response: {request_id}")
+        metrics.inc("requests_total", outcome="timeout")
+        return {"error": "No translation response available."}
+    except Exception as e:
+        logger.error(f"Error while processing translation response: {e}")
+        return {"error": "An error occurred while processing the translation response."}
+    finally:
+        response_service.discard(request_id)
+        # Trailing events such as "Translation Completed." still reach the socket
+        asyncio.get_running_loop().call_later(
+            settings.STATUS_GRACE_PERIOD, status_service.unsubscribe, request_id, status_frames
+        )
+
+async def handle_message(websocket: WebSocket, room_id: str, message: dict, status_frames: asyncio.Queue,
+                         received_at: float):
+    """Translate one admitted chat message and deliver the result to the sender or to the room."""
+    if message.get('target_langs'):
+        # The client asked for several languages itself, it gets them all in one result
+        message['id'] = uuid.uuid4().hex
+        message.setdefault('target_lang', message['target_langs'][0])
+        result = await run_request(message, websocket.send_json, status_frames, received_at)
+        logger.debug(f"Result: {result}")
+        with metrics.timer("websocket_send_seconds"):
+            await websocket.send_json(result)
+        metrics.observe_since("end_to_end_seconds", received_at)
+        return
+
+    target_langs = list(room_registry.languages(room_id))
+    if message.get('stream'):
+        # Streams carry one language each: one pipeline run per distinct target language
+        requests = [
+            {**message, 'id': uuid.uuid4().hex, 'target_lang': target_lang}
+            for target_lang in target_langs
+        ]
+    else:
+        # A single multi-target request: one detection, one result message for the whole room
+        requests = [{**message, 'id': uuid.uuid4().hex, 'target_lang': target_langs[0], 'target_langs': target_langs}]
+    results = await asyncio.gather(*(
+        run_request(request, functools.partial(room_registry.broadcast, room_id, request['target_lang']),
+                    status_frames, received_at)
+        for request in requests
+    ))
+    for request, result in zip(requests, results):
+        logger.debug(f"Result: {result}")
+        if "error" in result:
+            await websocket.send_json(result)
+            continue
+        translations = result.pop('translations', None) or {request['target_lang']: result.get('translation_text')}
+        for target_lang, translation_text in translations.items():
+            frame = {**result, 'target_lang': target_lang, 'translation_text': translation_text}
+            await room_registry.broadcast(room_id, target_lang, frame)
+        metrics.observe_since("end_to_end_seconds", received_at)
+
+async def run_admitted(websocket: WebSocket, work):
+    """Run a message handler as a background task of its socket, logging its failure instead of losing it."""
     try:
-        # Attempt to get a message without blocking
-        message = status_service.status_message_queue.get_nowait()
-        return message
-    except queue.Empty:
-        logger.info("Status message queue is empty.")
-        return {"status": "No status message available."}
-    # message = get_status_message()
+        await work
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling message: {e!r}")
+        if websocket.client_state.name != "DISCONNECTED":
+            try:
+                await websocket.send_json({"error": "An error occurred while processing the message."})
+            except Exception:
+                pass
 
 @app.websocket("/ws/chat/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str):
+async def websocket_endpoint(websocket: WebSocket, room_id: str, lang: Optional[str] = None):
     await websocket.accept()
     logger.info(f"WebSocket connection established for room: {room_id}")
+    room_registry.join(room_id, websocket, lang or settings.DEFAULT_TARGET_LANG)
+    status_frames = asyncio.Queue(maxsize=settings.STATUS_SUBSCRIBER_BACKLOG)
+    status_forwarder = asyncio.create_task(forward_status(websocket, status_frames))
+    admission = admission_controller.connect()
+    # Admitted messages are handled concurrently, at most ADMISSION_SOCKET_MAX_IN_FLIGHT at a time
+    handlers = set()
     try:
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received message: {data} in room: {room_id}")
+            received_at = time.time()
+            metrics.inc("messages_received_total")
+            logger.info(f"Received message in room: {room_id}")
+            logger.debug(f"Message body: {data}")
             message = json.loads(data)
-            message['id'] = 1
-            response = await utility_service.start_langauge_detection(message)
-            logger.info("Response from language detection service: %s", response)
-
-            try:
-                loop = asyncio.get_running_loop()
-                message = await loop.run_in_executor(None, response_service.translation_response_queue.get)
-            except asyncio.CancelledError:
-                logger.info("WebSocket task was cancelled during shutdown.")
-                raise  # Important: re-raise it so FastAPI can shut down cleanly
-            except queue.Empty:
-                logger.warning("Translation response queue is empty.")
-                message = {"error": "No translation response available."}
-            except Exception as e:
-                logger.error(f"Error while processing translation response: {e}")
-                message = {"error": "An error occurred while processing the translation response."}
-
-
-            print("----- RESP: {}".format(message))
-            # Process the message (kick off the pipeline)
-            await websocket.send_json(message)
+            # A message's target_lang is also the sender's reading language from now on
+            if message.get('target_lang'):
+                room_registry.set_language(room_id, websocket, message['target_lang'])
+            if message.get('type') == "join":
+                await websocket.send_json({"type": "system", "message": f"Reading room {room_id} in {message.get('target_lang')}."})
+                continue
+
+            busy = admission_controller.admit(room_id, admission)
+            if busy is not None:
+                # Rejected before any work is queued; the sender may retry after `retry_after` seconds
+                await websocket.send_json({**busy, "text": message.get('text')})
+                continue
+            handler = asyncio.create_task(run_admitted(websocket, admission_controller.track(
+                admission, handle_message(websocket, room_id, message, status_frames, received_at)
+            )))
+            handlers.add(handler)
+            handler.add_done_callback(handlers.discard)
     except Exception as e:
         logger.error(f"Error in websocket: {e}")
         if not websocket.client_state.name == "DISCONNECTED":
@@ -100,6 +236,12 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
             except RuntimeError as close_err:
                 logger.warning(f"WebSocket already closed: {close_err}")
     finally:
+        for handler in handlers:
+            handler.cancel()
+        room_registry.leave(room_id, websocket)
+        if room_id not in room_registry.rooms:
+            admission_controller.forget_room(room_id)
+        status_forwarder.cancel()
         logger.info(f"WebSocket connection closed for room: {room_id}")
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Deque, Dict, Optional, Tuple
+from core.config import settings
+from services.amqp import amqp_client
+from common.metrics import metrics
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `burst`; a rate of 0 never limits."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Spend a token; returns 0 on success, otherwise the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SocketAdmission:
+    """Admission state of one WebSocket: its token bucket and the requests it has in flight."""
+
+    def __init__(self) -> None:
+        self.bucket = TokenBucket(settings.ADMISSION_CONNECTION_RATE, settings.ADMISSION_CONNECTION_BURST)
+        self.in_flight = 0
+
+
+class AdmissionController:
+    """
+    Decides, before any work is queued, whether the gateway takes a chat message.
+    Cheap local checks run on every message: the socket's requests in flight, its token bucket
+    and its room's token bucket. Global load shedding looks at the depth of the pipeline queues
+    (sampled in the background) and at latency: it sheds while recent requests took longer than
+    ADMISSION_MAX_WAIT and a new one would wait as long, i.e. the gateway's requests in flight
+    divided by the rate at which requests recently finished. Overload thus turns into fast
+    "busy" rejections instead of ever longer waits.
+    """
+
+    QUEUES = (settings.INGESTION_QUEUE, settings.DETECTION_QUEUE, settings.TRANSLATION_QUEUE)
+
+    def __init__(self) -> None:
+        self.rooms: Dict[str, TokenBucket] = {}
+        self.in_flight = 0
+        # (finished_at, seconds) of recent requests, pruned to ADMISSION_WINDOW
+        self.finished: Deque[Tuple[float, float]] = deque()
+        # Requests finished per second and their p90 latency, None until enough have finished to tell
+        self.throughput: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.queue_depth: Optional[int] = None
+        self.overload: Optional[str] = None
+        self.sampler: Optional[asyncio.Task] = None
+
+    def connect(self) -> SocketAdmission:
+        return SocketAdmission()
+
+    def admit(self, room_id: str, socket: SocketAdmission) -> Optional[Dict]:
+        """
+        None if the message is admitted, otherwise the busy frame to answer it with.
+        An admitted message counts as in flight right away, so messages read before its handler
+        runs see it; track() releases it.
+        """
+        if settings.ADMISSION_SOCKET_MAX_IN_FLIGHT and socket.in_flight >= settings.ADMISSION_SOCKET_MAX_IN_FLIGHT:
+            return self.reject("socket_in_flight", "Too many messages awaiting translation on this connection.", 1.0)
+        if self.overload is not None:
+            return self.reject(self.overload, "The translation service is overloaded.", settings.ADMISSION_SAMPLE_INTERVAL)
+        if settings.ADMISSION_MAX_IN_FLIGHT and self.in_flight >= settings.ADMISSION_MAX_IN_FLIGHT:
+            return self.reject("in_flight", "The translation service is overloaded.", settings.ADMISSION_SAMPLE_INTERVAL)
+        if settings.ADMISSION_MAX_WAIT and self.throughput and self.latency > settings.ADMISSION_MAX_WAIT \
+                and self.in_flight / self.throughput > settings.ADMISSION_MAX_WAIT:
+            return self.reject("expected_wait", "The translation service is overloaded.",
+                               self.in_flight / self.throughput - settings.ADMISSION_MAX_WAIT)
+        wait = socket.bucket.take()
+        if wait:
+            return self.reject("connection_rate", "You are sending messages too fast.", wait)
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = TokenBucket(settings.ADMISSION_ROOM_RATE, settings.ADMISSION_ROOM_BURST)
+        wait = room.take()
+        if wait:
+            return self.reject("room_rate", "This room is receiving messages too fast.", wait)
+        socket.in_flight += 1
+        self.in_flight += 1
+        return None
+
+    def reject(self, reason: str, message: str, retry_after: float) -> Dict:
+        metrics.inc("requests_rejected_total", reason=reason)
+        return {"type": "busy", "reason": reason, "message": message, "error": message,
+                "retry_after": round(retry_after, 3)}
+
+    async def track(self, socket: SocketAdmission, work: Awaitable):
+        """Run an admitted request and release its in-flight slot once it finishes"""
+        start = time.monotonic()
+        try:
+            return await work
+        finally:
+            socket.in_flight -= 1
+            self.in_flight -= 1
+            now = time.monotonic()
+            self.finished.append((now, now - start))
+
+    def forget_room(self, room_id: str):
+        """Drop the bucket of a room nobody is in any more"""
+        self.rooms.pop(room_id, None)
+
+    def update_latency(self):
+        """Throughput and p90 latency of the requests finished within the window"""
+        now = time.monotonic()
+        while self.finished and self.finished[0][0] < now - settings.ADMISSION_WINDOW:
+            self.finished.popleft()
+        if len(self.finished) < settings.ADMISSION_MIN_SAMPLES:
+            self.throughput = self.latency = None
+            return
+        self.throughput = len(self.finished) / max(settings.ADMISSION_SAMPLE_INTERVAL, now - self.finished[0][0])
+        ordered = sorted(seconds for _, seconds in self.finished)
+        self.latency = ordered[int(0.9 * (len(ordered) - 1))]
+
+    async def sample(self):
+        """Re-evaluate global load shedding every ADMISSION_SAMPLE_INTERVAL seconds"""
+        while True:
+            try:
+                depths = [await amqp_client.queue_depth(queue) for queue in self.QUEUES]
+                self.queue_depth = sum(depths)
+            except Exception as e:
+                logger.warning(f"Could not read queue depths: {e!r}")
+                self.queue_depth = None
+            self.update_latency()
+            overload = None
+            if settings.ADMISSION_MAX_QUEUE_DEPTH and self.queue_depth is not None \
+                    and self.queue_depth > settings.ADMISSION_MAX_QUEUE_DEPTH:
+                overload = "queue_depth"
+            if overload != self.overload:
+                if overload:
+                    logger.warning(f"Shedding load: {self.queue_depth} messages queued, "
+                                   f"{self.in_flight} requests in flight")
+                else:
+                    logger.info("Queues drained, admitting messages again.")
+                self.overload = overload
+            await asyncio.sleep(settings.ADMISSION_SAMPLE_INTERVAL)
+
+    def start(self):
+        if self.sampler is None or self.sampler.done():
+            self.sampler = asyncio.create_task(self.sample())
+
+    async def stop(self):
+        if self.sampler is not None:
+            self.sampler.cancel()
+            try:
+                await self.sampler
+            except asyncio.CancelledError:
+                pass
+            self.sampler = None
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import aio_pika
+from core.config import settings
+from common.metrics import metrics, stamp_headers
+from common import deadline
+from common.transport import get_transport
+from common.schema import MessageCodec, Schema, SchemaError
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[Dict], Awaitable[None]]
+
+
+class AsyncAmqpClient:
+    """
+    Event-loop native RabbitMQ consumer and publisher.
+    One connection is shared by all consumers, each consumer gets its own channel
+    with its own prefetch window, and messages are delivered straight into coroutines.
+    """
+
+    def __init__(self, url: str = settings.RABBITMQ_URL, connect: Optional[Callable] = None) -> None:
+        self.url = url
+        # aio_pika.connect_robust, or the in-process broker's equivalent (see TRANSPORT)
+        self.connect_factory = connect or get_transport(settings.TRANSPORT, url).aio_connect
+        self.codec = MessageCodec(settings.MESSAGE_ENCODING)
+        self.connection = None
+        self.publish_channel = None
+        # Passive declares of a missing queue close their channel, so they get their own
+        self.probe_channel = None
+        self.declared = set()
+        self.consumers: List[Tuple[object, str]] = []
+
+    async def connect(self):
+        """Open the shared connection if it is not open yet."""
+        if self.connection is None or self.connection.is_closed:
+            logger.info("Setting up async RabbitMQ connection")
+            self.connection = await self.connect_factory(self.url)
+            logger.info("Async RabbitMQ connection established")
+        return self.connection
+
+    async def consume(self, queue_name: str, schema: Schema, handler: MessageHandler,
+                      prefetch_count: int = settings.RABBITMQ_PREFETCH_COUNT):
+        """Declare `queue_name` on a fresh channel and feed every message, decoded and validated against `schema`, to `handler`."""
+        connection = await self.connect()
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=prefetch_count)
+        queue = await channel.declare_queue(queue_name)
+
+        async def on_message(message):
+            # Acked once the handler returns, rejected (not requeued) if it raises
+            async with message.process(requeue=False, ignore_processed=True):
+                metrics.observe_dwell(queue_name, message.headers)
+                try:
+                    data = self.codec.decode(schema, message.body, message.headers)
+                except SchemaError as e:
+                    logger.error(f"Dropping undecodable message from {queue_name}: {e}")
+                    return
+                try:
+                    await handler(data)
+                except Exception as e:
+                    # A redelivery would fail the same way, so the message is not requeued
+                    metrics.inc("consumer_errors_total", queue=queue_name)
+                    logger.error(f"Handler failed on a message from {queue_name}, rejecting it: {e!r}")
+                    await message.reject(requeue=False)
+
+        consumer_tag = await queue.consume(on_message)
+        self.consumers.append((queue, consumer_tag))
+        logger.info(f"Consuming from {queue_name} with prefetch {prefetch_count}")
+
+    async def publish(self, queue_name: str, schema: Schema, payload: Dict, headers: Optional[Dict] = None):
+        """
+        Publish `payload`, encoded with the shared `schema`, to `queue_name` through the default exchange,
+        stamped with its publish time. A payload whose headers carry a deadline expires in the queue once it passes.
+        While the robust connection is reconnecting the publish is retried with exponential backoff,
+        so a broker restart delays the message instead of failing it.
+        """
+        body, headers = self.codec.encode(schema, payload, headers)
+        headers = stamp_headers(headers)
+        for attempt in range(settings.RABBITMQ_PUBLISH_RETRIES + 1):
+            try:
+                await self.publish_once(queue_name, body, headers)
+                return
+            except Exception as e:
+                if attempt == settings.RABBITMQ_PUBLISH_RETRIES:
+                    raise
+                delay = min(settings.RABBITMQ_PUBLISH_MAX_BACKOFF, settings.RABBITMQ_PUBLISH_BACKOFF * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Publish to {queue_name} failed ({e}); retrying in {delay:.2f}s")
+                self.publish_channel = None
+                await asyncio.sleep(delay)
+
+    async def publish_once(self, queue_name: str, body: bytes, headers: Dict):
+        if self.publish_channel is None or self.publish_channel.is_closed:
+            connection = await self.connect()
+            self.publish_channel = await connection.channel()
+            self.declared.clear()
+        if queue_name not in self.declared:
+            await self.publish_channel.declare_queue(queue_name)
+            self.declared.add(queue_name)
+        await self.publish_channel.default_exchange.publish(
+            aio_pika.Message(body=body, content_type=self.codec.content_type, headers=headers,
+                             expiration=deadline.ttl(headers)),
+            routing_key=queue_name,
+        )
+
+    async def queue_depth(self, queue_name: str) -> int:
+        """Messages ready in `queue_name`, read with a passive declare."""
+        if self.probe_channel is None or self.probe_channel.is_closed:
+            connection = await self.connect()
+            self.probe_channel = await connection.channel()
+        queue = await self.probe_channel.declare_queue(queue_name, passive=True)
+        return queue.declaration_result.message_count
+
+    async def close(self):
+        """Cancel all consumers and close the connection."""
+        logger.info("Closing async RabbitMQ connection...")
+        for queue, consumer_tag in self.consumers:
+            try:
+                await queue.cancel(consumer_tag)
+            except Exception as e:
+                logger.error(f"Error cancelling consumer {consumer_tag}: {e}")
+        self.consumers.clear()
+        if self.connection is not None and not self.connection.is_closed:
+            await self.connection.close()
+        logger.info("Async RabbitMQ connection closed.")
+
+
+amqp_client = AsyncAmqpClient()
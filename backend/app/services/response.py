@@ -5,22 +5,26 @@ import json
 import requests
 import redis
 import pika
-from typing import Dict
-from queue import Queue
-# import asyncio
+from typing import Dict, Tuple
+import asyncio
 from core.config import settings
+from common.metrics import metrics
+from common.transport import get_transport
+from common.schema import MessageCodec, TRANSLATION_RESULT
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class ProcessResponseService:
     def __init__(self) -> None:
-        self.translation_response_queue = Queue()
+        self.pending: Dict[str, Tuple[asyncio.AbstractEventLoop, object]] = {}
         self.stop_event = Event()
         self.request = {}
         self.response = {}
         logger.info("Initializing response service")
-        self.setup_rabbitmq()
+        self.codec = MessageCodec(settings.MESSAGE_ENCODING)
+        self.connection = None
+        # The blocking connection is only opened by the threaded consumer, see consume()
         # self.setup_redis() #NOT USING REDIS FOR THE TIME BEING
     
 
@@ -29,9 +33,7 @@ class ProcessResponseService:
         """Setup RabbitMQ connection and channel."""
         try:
             logger.info("Setting up RabbitMQ connection")
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
+            self.connection = get_transport(settings.TRANSPORT, settings.RABBITMQ_URL).blocking_connection()
             self.channel = self.connection.channel()
             self.channel.queue_declare(queue=settings.TRANSLATION_QUEUE)
             logger.info("RabbitMQ setup completed")
@@ -39,20 +41,63 @@ class ProcessResponseService:
             logger.error(f"Failed to setup RabbitMQ: {e}")
             raise
 
+    def register(self, request_id: str, stream: bool = False):
+        """
+        Register a request whose translation should come back to the calling event loop.
+        Returns a future for a single result, or an asyncio.Queue of frames when streaming.
+        """
+        loop = asyncio.get_running_loop()
+        sink = asyncio.Queue() if stream else loop.create_future()
+        self.pending[request_id] = (loop, sink)
+        return sink
+
+    def discard(self, request_id: str):
+        """Forget a pending request, e.g. once it is answered or its socket is gone."""
+        self.pending.pop(request_id, None)
+
+    def dispatch(self, response: Dict):
+        """Hand a translation response over to the event loop waiting on its request id."""
+        entry = self._pending_for(response)
+        if entry is not None:
+            loop, sink = entry
+            loop.call_soon_threadsafe(self._deliver, sink, response)
+
+    async def on_message(self, response: Dict):
+        """Async consumer handler; runs on the same loop as the waiting sockets."""
+        entry = self._pending_for(response)
+        if entry is not None:
+            self._deliver(entry[1], response)
+
+    def _pending_for(self, response: Dict):
+        request_id = response.get('id')
+        entry = self.pending.get(str(request_id))
+        if entry is None:
+            logger.warning(f"No pending request for translation response id: {request_id}")
+        return entry
+
+    @staticmethod
+    def _deliver(sink, response: Dict):
+        if isinstance(sink, asyncio.Queue):
+            sink.put_nowait(response)
+        elif not sink.done():
+            sink.set_result(response)
+
     def consume(self):
         """
         Consume messages from the RabbitMQ translation queue.
         When a message is received from translation, it given as a status response to the user.
         """
+        if self.connection is None:
+            self.setup_rabbitmq()
         while not self.stop_event.is_set():
             try:
                 def callback(ch, method, properties, body):
-                    logger.info(f"Received message from translation queue: {body}")
+                    logger.debug(f"Received message from translation queue: {body}")
+                    metrics.observe_dwell(settings.TRANSLATION_QUEUE, properties.headers)
                     try:
-                        # Assuming the body is a JSON-encoded string
-                        request_data = json.loads(body.decode())
-                        self.translation_response_queue.put(request_data)
-                        logger.info(f"Message added to the translation queue: {request_data}")
+                        request_data = self.codec.decode(TRANSLATION_RESULT, body, properties.headers)
+                        self.dispatch(request_data)
+                        logger.info(f"Translation response dispatched for request: {request_data.get('id')}")
                     except Exception as e:
                         logger.error(f"Error adding  message: {e}")
                         # ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -80,6 +125,8 @@ class ProcessResponseService:
     def close(self):
         """Close RabbitMQ connection"""
         logger.info("Closing RabbitMQ connection...")
+        if self.connection is None:
+            return
         try:
             self.connection.close()
             logger.info("RabbitMQ connection closed.")
@@ -0,0 +1,51 @@
+import logging
+from typing import Dict, List
+from fastapi import WebSocket
+from core.config import settings
+from common.metrics import metrics
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RoomRegistry:
+    """Members of each chat room and the language each of them wants to read messages in."""
+
+    def __init__(self) -> None:
+        self.rooms: Dict[str, Dict[WebSocket, str]] = {}
+
+    def join(self, room_id: str, websocket: WebSocket, target_lang: str = settings.DEFAULT_TARGET_LANG):
+        self.rooms.setdefault(room_id, {})[websocket] = target_lang
+        logger.info(f"Socket joined room {room_id} reading {target_lang} ({len(self.rooms[room_id])} members)")
+
+    def leave(self, room_id: str, websocket: WebSocket):
+        members = self.rooms.get(room_id)
+        if members is None:
+            return
+        members.pop(websocket, None)
+        if not members:
+            self.rooms.pop(room_id, None)
+
+    def set_language(self, room_id: str, websocket: WebSocket, target_lang: str):
+        members = self.rooms.get(room_id)
+        if members is not None and websocket in members:
+            members[websocket] = target_lang
+
+    def languages(self, room_id: str) -> Dict[str, List[WebSocket]]:
+        """Group the room's members by target language; each language needs one translation."""
+        groups: Dict[str, List[WebSocket]] = {}
+        for websocket, target_lang in self.rooms.get(room_id, {}).items():
+            groups.setdefault(target_lang, []).append(websocket)
+        return groups
+
+    async def broadcast(self, room_id: str, target_lang: str, frame: Dict):
+        """Send a frame to every member of the room reading `target_lang`."""
+        for websocket in self.languages(room_id).get(target_lang, []):
+            try:
+                with metrics.timer("websocket_send_seconds"):
+                    await websocket.send_json(frame)
+            except Exception as e:
+                logger.warning(f"Failed to deliver to a member of room {room_id}: {e}")
+
+
+room_registry = RoomRegistry()
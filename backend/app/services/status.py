@@ -5,22 +5,27 @@ import json
 import requests
 import redis
 import pika
-from typing import Dict
-from queue import Queue
-# import asyncio
+from typing import Dict, Optional, Set, Tuple
+import asyncio
 from core.config import settings
+from common.metrics import metrics
+from common.transport import get_transport
+from common.schema import MessageCodec, STATUS
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class StatusService:
     def __init__(self) -> None:
-        self.status_message_queue = Queue()
+        # Request id -> (loop, queue) pairs of the sockets and streams waiting on it
+        self.subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
         self.stop_event = Event()
         self.request = {}
         self.response = {}
         logger.info("Initializing ProcessMessageService")
-        self.setup_rabbitmq()
+        self.codec = MessageCodec(settings.MESSAGE_ENCODING)
+        self.connection = None
+        # The blocking connection is only opened by the threaded consumer, see consume()
         # self.setup_redis() #NOT USING REDIS FOR THE TIME BEING
     
 
@@ -29,9 +34,7 @@ class StatusService:
         """Setup RabbitMQ connection and channel."""
         try:
             logger.info("Setting up RabbitMQ connection")
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
+            self.connection = get_transport(settings.TRANSPORT, settings.RABBITMQ_URL).blocking_connection()
             self.channel = self.connection.channel()
             self.channel.queue_declare(queue=settings.STATUS_QUEUE)
             logger.info("RabbitMQ setup completed")
@@ -121,20 +124,53 @@ class StatusService:
         """
         pass
 
+    def subscribe(self, key: str, frames: asyncio.Queue):
+        """Deliver the status events of request id `key` into `frames`."""
+        self.subscribers.setdefault(key, set()).add((asyncio.get_running_loop(), frames))
+
+    def unsubscribe(self, key: str, frames: asyncio.Queue):
+        sinks = self.subscribers.get(key)
+        if sinks is None:
+            return
+        sinks.difference_update({sink for sink in sinks if sink[1] is frames})
+        if not sinks:
+            self.subscribers.pop(key, None)
+
+    def publish(self, status: Dict, threadsafe: bool = False):
+        """Push a status event to the subscribers of its request id only."""
+        for loop, frames in set(self.subscribers.get(str(status.get('id')), ())):
+            if threadsafe:
+                loop.call_soon_threadsafe(self._deliver, frames, status)
+            else:
+                self._deliver(frames, status)
+
+    @staticmethod
+    def _deliver(frames: asyncio.Queue, status: Dict):
+        try:
+            frames.put_nowait(status)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping status event for slow subscriber: {status}")
+
+    async def on_message(self, status: Dict):
+        """Async consumer handler for status messages."""
+        self.publish(status)
+
     def consume(self):
         """
         Consume messages from the RabbitMQ status queue.
         When a message is received from translation, it given as a status response to the user.
         """
+        if self.connection is None:
+            self.setup_rabbitmq()
         while not self.stop_event.is_set():
             try:
                 def callback(ch, method, properties, body):
-                    logger.info(f"Received message from status queue: {body}")
+                    logger.debug(f"Received message from status queue: {body}")
+                    metrics.observe_dwell(settings.STATUS_QUEUE, properties.headers)
                     try:
-                        # Assuming the body is a JSON-encoded string
-                        request_data = json.loads(body.decode())
-                        self.status_message_queue.put(request_data)
-                        logger.info(f"Message added to queue: {request_data}")
+                        request_data = self.codec.decode(STATUS, body, properties.headers)
+                        self.publish(request_data, threadsafe=True)
+                        logger.info(f"Status message pushed to subscribers: {request_data.get('id')}")
                     except Exception as e:
                         logger.error(f"Error adding status message: {e}")
                         # ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -186,6 +222,8 @@ class StatusService:
     def close(self):
         """Close RabbitMQ connection"""
         logger.info("Closing RabbitMQ connection...")
+        if self.connection is None:
+            return
         try:
             self.connection.close()
             logger.info("RabbitMQ connection closed.")
@@ -0,0 +1,92 @@
+import unicodedata
+from typing import Optional
+
+# Unicode blocks whose script is written by a single language for practical purposes
+SCRIPT_RANGES = [
+    ((0x3040, 0x30FF), "ja"),   # Hiragana, Katakana
+    ((0x31F0, 0x31FF), "ja"),   # Katakana phonetic extensions
+    ((0xAC00, 0xD7AF), "ko"),   # Hangul syllables
+    ((0x1100, 0x11FF), "ko"),   # Hangul jamo
+    ((0x3130, 0x318F), "ko"),   # Hangul compatibility jamo
+    ((0x0E00, 0x0E7F), "th"),
+    ((0x0370, 0x03FF), "el"),
+    ((0x0590, 0x05FF), "he"),
+    ((0x10A0, 0x10FF), "ka"),
+    ((0x0530, 0x058F), "hy"),
+    ((0x0980, 0x09FF), "bn"),
+    ((0x0A00, 0x0A7F), "pa"),
+    ((0x0A80, 0x0AFF), "gu"),
+    ((0x0B80, 0x0BFF), "ta"),
+    ((0x0C00, 0x0C7F), "te"),
+    ((0x0C80, 0x0CFF), "kn"),
+    ((0x0D00, 0x0D7F), "ml"),
+    ((0x0D80, 0x0DFF), "si"),
+    ((0x0E80, 0x0EFF), "lo"),
+    ((0x1000, 0x109F), "my"),
+    ((0x1780, 0x17FF), "km"),
+    ((0x4E00, 0x9FFF), "han"),  # resolved below: Japanese if kana is present, else Chinese
+    ((0x0600, 0x06FF), "arabic"),  # resolved below by script-specific letters
+]
+
+PERSIAN_LETTERS = set("پچژگکی")
+URDU_LETTERS = set("ٹڈڑںےھۓ")
+
+
+class ScriptClassifier:
+    """
+    Resolve a language from its writing system alone, without calling the detection service.
+    Returns None whenever the script is shared by several languages (Latin, Cyrillic, ...).
+    """
+
+    def __init__(self, min_share: float = 0.6, min_letters: int = 2):
+        self.min_share = min_share
+        self.min_letters = min_letters
+
+    @staticmethod
+    def script_of(char: str) -> Optional[str]:
+        code = ord(char)
+        for (low, high), script in SCRIPT_RANGES:
+            if low <= code <= high:
+                return script
+        return None
+
+    def classify(self, text: str) -> Optional[str]:
+        counts, letters = {}, 0
+        for char in text or "":
+            if not unicodedata.category(char).startswith("L"):
+                continue
+            letters += 1
+            script = self.script_of(char)
+            if script is not None:
+                counts[script] = counts.get(script, 0) + 1
+        if letters < self.min_letters or not counts:
+            return None
+
+        if "ja" in counts:
+            # Kana only occurs in Japanese, and Japanese mixes it with Han
+            counts["ja"] += counts.pop("han", 0)
+        elif "ko" in counts:
+            counts["ko"] += counts.pop("han", 0)
+        script, count = max(counts.items(), key=lambda item: item[1])
+        if count / letters < self.min_share:
+            return None
+        if script == "han":
+            return "zh"
+        if script == "arabic":
+            return self.classify_arabic(text)
+        return script
+
+    @staticmethod
+    def classify_arabic(text: str) -> Optional[str]:
+        chars = set(text)
+        if chars & URDU_LETTERS:
+            return "ur"
+        if chars & PERSIAN_LETTERS:
+            return "fa"
+        # Teh marbuta and Arabic yeh/kaf are rare in Persian and Urdu text
+        if chars & set("ةيك"):
+            return "ar"
+        return None
+
+
+script_classifier = ScriptClassifier()
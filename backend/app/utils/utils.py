@@ -1,10 +1,20 @@
 import logging
 import threading
+import asyncio
+import random
+import time
+from typing import Optional
 from core.config import settings
-import requests
+import httpx
 # from services.translation import translation_service
 from services.status import status_service
 from services.response import response_service
+from services.amqp import amqp_client
+from services.admission import admission_controller
+from utils.script import script_classifier
+from common.metrics import metrics, DEADLINE_HEADER, RECEIVED_AT_HEADER
+from common.languages import supported_hint
+from common.schema import STATUS, TRANSLATION_REQUEST, TRANSLATION_RESULT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,17 +24,123 @@ class UtilityService:
         logger.info("Initializing UtilityService...")
         self.statusservice_thread = None
         self.response_thread = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.detection_slots: Optional[asyncio.Semaphore] = None
 
-    async def start_langauge_detection(self, request: dict) -> dict:
-        """ Starting Language detection by calling Language Detection Service endpoint. """
+    def open_http_client(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+        """Create the shared keep-alive client used for the language detection hop."""
+        if self.http_client is None or self.http_client.is_closed:
+            self.http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.LANGUAGE_DETECTION_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.LANGUAGE_DETECTION_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LANGUAGE_DETECTION_MAX_CONNECTIONS,
+                ),
+                headers={"Content-Type": "application/json"},
+                transport=transport,
+            )
+            self.detection_slots = asyncio.Semaphore(settings.LANGUAGE_DETECTION_CONCURRENCY)
+        return self.http_client
+
+    async def close_http_client(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def post_with_retry(self, url: str, payload: dict, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        POST with a bounded number of in-flight calls, retrying with full jitter only when the request
+        never reached the service. /detect-language publishes the request onward before it replies,
+        so a call that timed out or failed after being sent may already be on its way to translation.
+        """
+        client = self.open_http_client()
+        attempts = settings.LANGUAGE_DETECTION_RETRIES + 1
+        for attempt in range(attempts):
+            try:
+                async with self.detection_slots:
+                    return await client.post(url, json=payload, headers=headers)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt + 1 == attempts:
+                    raise
+                logger.warning(f"Attempt {attempt + 1} to connect to {url} failed: {e!r}")
+            await asyncio.sleep(random.uniform(0, settings.LANGUAGE_DETECTION_BACKOFF * (2 ** attempt)))
+
+    def resolve_language(self, request: dict) -> Optional[dict]:
+        """Source language known without the detection service: a supported client hint, or an unambiguous script."""
+        hint = request.get("source_lang")
+        source_lang = supported_hint(hint, settings.CLIENT_SOURCE_LANGUAGES)
+        if source_lang is not None:
+            return {"source_lang": source_lang, "detected_by": "client"}
+        if hint:
+            logger.warning(f"Ignoring unsupported source_lang hint {hint!r}, detecting the language instead")
+        source_lang = script_classifier.classify(request.get("text"))
+        if source_lang is not None:
+            return {"source_lang": source_lang, "detected_by": "script"}
+        return None
+
+    async def skip_langauge_detection(self, request: dict, detection: dict, headers: Optional[dict] = None) -> dict:
+        """Send a request straight to the translation stage, bypassing the detection service."""
+        message = {
+            "id": request.get('id'),
+            "text": request.get('text'),
+            "source_lang": detection["source_lang"],
+            "target_lang": request.get('target_lang'),
+            "target_langs": request.get('target_langs'),
+            "stream": request.get('stream', False),
+        }
+        try:
+            await amqp_client.publish(settings.DETECTION_QUEUE, TRANSLATION_REQUEST, message, headers)
+            logger.info(f"Skipped language detection ({detection['detected_by']}): {detection['source_lang']}")
+            return {"status": "success", "data": {"message": "Language detection skipped.", **detection}}
+        except Exception as e:
+            logger.error(f"Error publishing to detection queue: {e!r}")
+            return {"status": "error", "message": str(e)}
+
+    async def queue_langauge_detection(self, request: dict, headers: Optional[dict] = None) -> dict:
+        """Hand the request to the detection service's ingestion queue and return without waiting on it."""
+        try:
+            await amqp_client.publish(settings.INGESTION_QUEUE, TRANSLATION_REQUEST, request, headers)
+            logger.info("Request queued for language detection.")
+            return {"status": "success", "data": {"message": "Queued for language detection."}}
+        except Exception as e:
+            logger.error(f"Error publishing to ingestion queue: {e!r}")
+            return {"status": "error", "message": str(e)}
+
+    async def start_langauge_detection(self, request: dict, received_at: Optional[float] = None) -> dict:
+        """
+        Starting Language detection by calling Language Detection Service endpoint.
+        `received_at` is when the gateway received the message; it travels through the pipeline in the AMQP headers,
+        together with the request's deadline: TRANSLATION_RESPONSE_TIMEOUT later, nobody waits for the result any more.
+        """
         logger.info("Starting language detection...")
+        start = time.perf_counter()
+        headers = {DEADLINE_HEADER: (received_at or time.time()) + settings.TRANSLATION_RESPONSE_TIMEOUT}
+        if received_at is not None:
+            headers[RECEIVED_AT_HEADER] = received_at
+        detection = self.resolve_language(request)
+        if detection is None and settings.PIPELINE_MODE == "combined":
+            detection = {"source_lang": None, "detected_by": "translation"}
+        if detection is not None:
+            response = await self.skip_langauge_detection(request, detection, headers)
+            metrics.observe("gateway_dispatch_seconds", time.perf_counter() - start, route="direct")
+            return response
+        # Any hint left is one resolve_language rejected; the detection service must not trust it either
+        request = {key: value for key, value in request.items() if key != "source_lang"}
+        if settings.DETECTION_INGESTION_MODE == "queue":
+            response = await self.queue_langauge_detection(request, headers)
+            metrics.observe("gateway_dispatch_seconds", time.perf_counter() - start, route="queue")
+            return response
         try:
             # Call the language detection service here
             logger.debug(f"Request payload for language detection: {request}")
             external_service_url = settings.LANGUAGE_DETECTION_URL
-            headers = {"Content-Type": "application/json"}
-            logger.debug(f"Calling external service at {external_service_url} with headers {headers}")
-            response = requests.post(external_service_url, json=request, headers=headers)
+            logger.debug(f"Calling external service at {external_service_url}")
+            with metrics.timer("detection_http_seconds"):
+                http_headers = {"X-Deadline": str(headers[DEADLINE_HEADER])}
+                if received_at is not None:
+                    http_headers["X-Received-At"] = str(received_at)
+                response = await self.post_with_retry(external_service_url, request, headers=http_headers)
+            metrics.observe("gateway_dispatch_seconds", time.perf_counter() - start, route="http")
 
             if response.status_code == 200:
                 logger.info("Successfully called external language detection service")
@@ -36,7 +152,7 @@ class UtilityService:
                 logger.error(f"Response: {response.text}")
                 return {"status": "error", "message": "External service call failed"}
         except Exception as e:
-            logger.error(f"Error in language detection: {e}")
+            logger.error(f"Error in language detection: {e!r}")
             return {"status": "error", "message": str(e)}
         
     def start_response_consumer(self):
@@ -58,6 +174,14 @@ class UtilityService:
 
     async def start_background_tasks(self):
         logger.info("Starting background tasks...")
+        self.open_http_client()
+        admission_controller.start()
+        if settings.RABBITMQ_CONSUMER_MODE == "asyncio":
+            await amqp_client.consume(settings.STATUS_QUEUE, STATUS, status_service.on_message)
+            await amqp_client.consume(settings.TRANSLATION_QUEUE, TRANSLATION_RESULT, response_service.on_message)
+            logger.info("Async consumers started successfully.")
+            return
+
         self.statusservice_thread = threading.Thread(
             target=self.start_status_consumer, daemon=True
         )
@@ -69,8 +193,17 @@ class UtilityService:
         self.response_thread.start()
         logger.info("Background tasks started successfully.")
 
-    def close_background_tasks(self):
+    async def close_background_tasks(self):
         logger.info("Stopping background tasks...")
+        await admission_controller.stop()
+        await self.close_http_client()
+        try:
+            # Also holds the publisher channel in threaded mode
+            await amqp_client.close()
+        except Exception as e:
+            logger.error(f"Error while stopping async consumers: {e}")
+        if settings.RABBITMQ_CONSUMER_MODE == "asyncio":
+            return
         try:
             status_service.stop_event.set()  # Signal the process message consumer to stop
             logger.info("Signaled 'Status Service' consumer to stop.")
@@ -84,5 +217,4 @@ class UtilityService:
         except Exception as e:
             logger.error(f"Error while stopping background tasks: {e}")
 
-
 utility_service = UtilityService()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Event-loop lag while many sockets call the language detection hop at once.
+
+The detection service is replaced by an in-process httpx transport that answers
+after a fixed delay, so this runs offline. `--mode blocking` reproduces the old
+behaviour (a synchronous call inside the coroutine) for comparison.
+
+    cd backend && python benchmarks/detection_lag.py --sockets 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx  # noqa: E402
+from utils.utils import utility_service  # noqa: E402
+from core.config import settings  # noqa: E402
+
+
+class DelayedDetectionTransport(httpx.AsyncBaseTransport):
+    """Pretends to be /detect-language, answering after `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def handle_async_request(self, request):
+        await asyncio.sleep(self.latency)
+        return httpx.Response(200, json={"message": "Language detection process completed.", "source_lang": "en"})
+
+
+async def monitor_lag(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    """Record how late the loop wakes up compared to the requested sleep."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def blocking_detection(request: dict, latency: float) -> dict:
+    time.sleep(latency)  # what requests.post did to the loop
+    return {"status": "success", "data": {"source_lang": "en"}}
+
+
+async def socket(messages: int, mode: str, latency: float):
+    for i in range(messages):
+        request = {"text": f"hello {i}", "target_lang": "es"}
+        if mode == "blocking":
+            await blocking_detection(request, latency)
+        else:
+            await utility_service.start_langauge_detection(request)
+
+
+async def run(args) -> dict:
+    # This benchmark measures the HTTP detection hop, not queue ingestion
+    settings.DETECTION_INGESTION_MODE = "http"
+    settings.PIPELINE_MODE = "two_stage"
+    utility_service.open_http_client(transport=DelayedDetectionTransport(args.latency))
+    lag, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lag, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(socket(args.messages, args.mode, args.latency) for _ in range(args.sockets)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    await utility_service.close_http_client()
+
+    lag.sort()
+    total = args.sockets * args.messages
+    return {
+        "mode": args.mode,
+        "sockets": args.sockets,
+        "messages": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(total / elapsed, 1),
+        "loop_lag_ms": {
+            "mean": round(statistics.fmean(lag) * 1000, 3) if lag else None,
+            "p99": round(lag[int(len(lag) * 0.99) - 1] * 1000, 3) if lag else None,
+            "max": round(lag[-1] * 1000, 3) if lag else None,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5, help="messages sent per socket")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated detection latency in seconds")
+    parser.add_argument("--mode", choices=["async", "blocking"], default="async")
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
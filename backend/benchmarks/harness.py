@@ -0,0 +1,60 @@
+"""
+Offline stand-ins for the pieces of the pipeline that need the network.
+
+FakeModel answers like OpenAiUtilityService (and the detection service's model)
+after a configurable latency with jitter. The broker needs no stand-in: the
+benchmarks run every service in one process over the in-process transport, see
+backend/monolith.py.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+class FakeModel:
+    """Model stand-in: every call sleeps `latency` seconds, give or take `jitter`."""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, stream_chunks: int = 4):
+        self.latency = latency
+        self.jitter = jitter
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+
+    def detect(self, text: str) -> str:
+        self.wait()
+        return "en"
+
+    def translate(self, source_lang: str = "en", target_lang: str = "fr", text: str = None) -> str:
+        self.wait()
+        return f"[{target_lang}] {text}"
+
+    def translate_stream(self, source_lang: str = "en", target_lang: str = "fr", text: str = None) -> Iterator[str]:
+        translation = self.translate(source_lang, target_lang, text)
+        size = max(1, len(translation) // self.stream_chunks)
+        for start in range(0, len(translation), size):
+            yield translation[start:start + size]
+
+    def translate_batch(self, source_lang: str = "en", target_lang: str = "fr", texts: List[str] = None) -> List[str]:
+        self.wait()
+        return [f"[{target_lang}] {text}" for text in texts]
+
+    def translate_multi(self, source_lang: str = "en", target_langs: List[str] = None, text: str = None) -> Dict[str, str]:
+        self.wait()
+        return {target_lang: f"[{target_lang}] {text}" for target_lang in target_langs}
+
+    def detect_and_translate(self, target_lang: str = "fr", text: str = None) -> Tuple[str, str]:
+        self.wait()
+        return "en", f"[{target_lang}] {text}"
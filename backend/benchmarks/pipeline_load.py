@@ -0,0 +1,209 @@
+"""
+End-to-end load test of the whole pipeline, runnable offline.
+
+The gateway, language detection and translation services run in this process as in
+monolith.py, over the in-process transport, and the model is a stub with configurable
+latency and jitter. The gateway is served by uvicorn on a local port, and N WebSocket
+clients each send messages to /ws/chat/{room_id} and wait for their translation.
+
+Reports throughput, end-to-end latency percentiles, gateway event-loop lag and
+memory per idle connection as JSON, so runs can be compared between versions.
+
+    cd backend && python benchmarks/pipeline_load.py --clients 100 --messages 5 --latency 0.2 --jitter 0.05
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import BACKEND_DIR, FakeModel  # noqa: E402
+import monolith  # noqa: E402
+
+
+def configure_environment(args):
+    """Settings are read from the environment when each service's config is imported"""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["TRANSLATION_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ["TRANSLATION_CACHE_DB_PATH"] = ""
+    os.environ["PIPELINE_MODE"] = args.pipeline
+    os.environ["TRANSPORT"] = "inprocess"
+    os.environ["DETECTION_INGESTION_MODE"] = "queue"
+    os.environ["RABBITMQ_CONSUMER_MODE"] = "asyncio"
+    os.environ["TRANSLATION_WORKERS"] = str(args.workers)
+
+
+def build_app(fake: FakeModel):
+    """Import the three services and point their models at the stub; the consumers start with the app"""
+    services = monolith.load_services()
+    for _, detector in services["language_detection"]["utils.detectors"].detector_chain.tiers:
+        if hasattr(detector, "model"):
+            detector.model = fake
+    services["translation"]["services.translation"].model = fake
+    return monolith.create_app(services)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def monitor_lag(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    """Record how late the loop wakes up compared to the requested sleep."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+def process_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+async def client(websocket, index: int, messages: int, target_lang: str, latencies: List[float], errors: List[str]):
+    """Send messages one at a time, each waiting for its own translation (room mates' messages are skipped)"""
+    for i in range(messages):
+        text = f"Hello there, this is client {index} sending message number {i}."
+        started = time.perf_counter()
+        await websocket.send(json.dumps({"text": text, "target_lang": target_lang}))
+        while True:
+            frame = json.loads(await websocket.recv())
+            if "error" in frame:
+                errors.append(frame["error"])
+                break
+            if "translation_text" in frame and frame.get("text") == text:
+                latencies.append(time.perf_counter() - started)
+                break
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+
+async def run(args, app, metrics) -> Dict:
+    import uvicorn
+    import websockets
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    # Idle connections first, to measure what each one costs
+    tracemalloc.start()
+    traced_before, rss_before = tracemalloc.get_traced_memory()[0], process_rss()
+    sockets = []
+    for index in range(args.clients):
+        room_id = f"room-{index // args.room_size}"
+        sockets.append(await websockets.connect(f"ws://127.0.0.1:{port}/ws/chat/{room_id}?lang={args.target_lang}",
+                                                max_size=None, ping_interval=None))
+    await asyncio.sleep(0.2)
+    traced_after, rss_after = tracemalloc.get_traced_memory()[0], process_rss()
+    tracemalloc.stop()
+
+    latencies, errors, lag, stop = [], [], [], asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lag, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(websocket, index, args.messages, args.target_lang, latencies, errors)
+                           for index, websocket in enumerate(sockets)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    for websocket in sockets:
+        await websocket.close()
+    server.should_exit = True
+    await serving
+
+    latencies.sort()
+    lag.sort()
+    stages = {
+        name: [{**series["labels"], "p50_ms": round(series["p50"] * 1000, 3), "p99_ms": round(series["p99"] * 1000, 3)}
+               for series in all_series if series["p50"] is not None]
+        for name, all_series in metrics.snapshot()["histograms"].items()
+    }
+    return {
+        "completed": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+        "loop_lag_ms": {
+            "mean": round(statistics.fmean(lag) * 1000, 3) if lag else None,
+            "p99": percentile(lag, 0.99),
+            "max": round(lag[-1] * 1000, 3) if lag else None,
+        },
+        # Client and server sides of each socket live in this process, so both are counted
+        "memory_per_connection_kb": {
+            "python_heap": round((traced_after - traced_before) / args.clients / 1024, 2),
+            "rss": round((rss_after - rss_before) / args.clients / 1024, 2) if rss_before and rss_after else None,
+        },
+        "stages": stages,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent WebSocket clients")
+    parser.add_argument("--messages", type=int, default=5, help="messages sent per client")
+    parser.add_argument("--room-size", type=int, default=1, help="clients sharing each chat room")
+    parser.add_argument("--target-lang", default="es")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="stub model latency jitter in seconds")
+    parser.add_argument("--pipeline", choices=["two_stage", "combined"], default="two_stage")
+    parser.add_argument("--workers", type=int, default=8, help="translation worker threads")
+    parser.add_argument("--cache", action="store_true", help="keep the translation memory enabled")
+    parser.add_argument("--verbose", action="store_true", help="keep the services' INFO logging")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    fake = FakeModel(args.latency, args.jitter)
+    app = build_app(fake)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    from common.metrics import metrics
+    from common.transport import get_transport
+    results = asyncio.run(run(args, app, metrics))
+
+    print(json.dumps({
+        "revision": git_revision(),
+        "config": vars(args),
+        **results,
+        "model_calls": fake.calls,
+        "broker_messages": get_transport("inprocess").broker.published,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import time
+from typing import Dict, Optional
+from common.metrics import metrics, DEADLINE_HEADER
+
+# Deadlines are absolute epoch times set by the gateway, so hosts are assumed to share a synchronised clock,
+# as the latency metrics already do
+
+
+def remaining(headers: Optional[Dict]) -> Optional[float]:
+    """Seconds left until the request's deadline, None for a message without one"""
+    deadline = (headers or {}).get(DEADLINE_HEADER)
+    if deadline is None:
+        return None
+    return float(deadline) - time.time()
+
+
+def expired(headers: Optional[Dict], stage: Optional[str] = None) -> bool:
+    """Whether nobody waits for the request any more; counted in expired_requests_total{stage} when `stage` is given"""
+    left = remaining(headers)
+    if left is None or left > 0:
+        return False
+    if stage is not None:
+        metrics.inc("expired_requests_total", stage=stage)
+    return True
+
+
+def ttl(headers: Optional[Dict]) -> Optional[float]:
+    """
+    Per-message TTL, in seconds, for a message carrying a deadline.
+    RabbitMQ drops the message once it expires in the queue, before any consumer spends work on it.
+    """
+    left = remaining(headers)
+    return None if left is None else max(0.0, left)
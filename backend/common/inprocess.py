@@ -0,0 +1,357 @@
+import asyncio
+import functools
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import pika
+import pika.exceptions
+from common.metrics import stamp_headers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    """
+    Named queues with competing consumers, each consumer limited by its prefetch window.
+    Consumers are either blocking channels (delivered on their connection's thread, like
+    pika's BlockingConnection) or asyncio consumers (delivered on their event loop).
+    Messages still travel as encoded bodies with headers, so services cannot tell it from RabbitMQ.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.queues: Dict[str, Deque[Tuple[bytes, Dict]]] = {}
+        self.consumers: Dict[str, List] = {}
+        self.published = 0
+
+    def declare(self, queue: str):
+        with self.lock:
+            self.queues.setdefault(queue, deque())
+            self.consumers.setdefault(queue, [])
+
+    def publish(self, queue: str, body, headers: Optional[Dict] = None):
+        if isinstance(body, str):
+            body = body.encode()
+        with self.lock:
+            self.declare(queue)
+            self.queues[queue].append((body, dict(headers or {})))
+            self.published += 1
+        self.dispatch(queue)
+
+    def requeue(self, queue: str, messages: List[Tuple[bytes, Dict]]):
+        """Put unacknowledged messages back at the front of `queue`, oldest first"""
+        with self.lock:
+            self.declare(queue)
+            self.queues[queue].extendleft(reversed(messages))
+        self.dispatch(queue)
+
+    def subscribe(self, queue: str, consumer):
+        with self.lock:
+            self.declare(queue)
+            self.consumers[queue].append(consumer)
+        self.dispatch(queue)
+
+    def unsubscribe(self, queue: str, consumer):
+        with self.lock:
+            if consumer in self.consumers.get(queue, []):
+                self.consumers[queue].remove(consumer)
+
+    def dispatch(self, queue: str):
+        """Hand queued messages to consumers that have room in their prefetch window"""
+        with self.lock:
+            messages, consumers = self.queues.get(queue), self.consumers.get(queue)
+            while messages and consumers:
+                ready = [consumer for consumer in consumers if consumer.has_capacity()]
+                if not ready:
+                    return
+                for consumer in ready:
+                    if not messages:
+                        return
+                    body, headers = messages.popleft()
+                    consumer.deliver(body, headers)
+
+
+class BlockingConsumer:
+    def __init__(self, channel: "BlockingChannel", queue: str, callback: Callable, auto_ack: bool) -> None:
+        self.channel = channel
+        self.queue = queue
+        self.callback = callback
+        self.auto_ack = auto_ack
+
+    def has_capacity(self) -> bool:
+        if not self.channel.is_open:
+            return False
+        return self.auto_ack or not self.channel.prefetch or len(self.channel.unacked) < self.channel.prefetch
+
+    def deliver(self, body: bytes, headers: Dict):
+        self.channel.receive(self, body, headers)
+
+
+class BlockingChannel:
+    """The parts of pika's BlockingChannel the services use; callbacks run in process_data_events()."""
+
+    def __init__(self, connection: "BlockingConnection") -> None:
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch = 0
+        self.tags = itertools.count(1)
+        # Delivery tag -> (queue, body, headers), requeued if the channel closes before the ack
+        self.unacked: Dict[int, Tuple[str, bytes, Dict]] = {}
+        self.consumers: List[BlockingConsumer] = []
+        self.is_open = True
+
+    def queue_declare(self, queue: str, **kwargs):
+        self.broker.declare(queue)
+
+    def basic_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False, **kwargs):
+        consumer = BlockingConsumer(self, queue, on_message_callback, auto_ack)
+        self.consumers.append(consumer)
+        self.broker.subscribe(queue, consumer)
+
+    def basic_publish(self, exchange: str, routing_key: str, body, properties=None, **kwargs):
+        self.broker.publish(routing_key, body, getattr(properties, "headers", None))
+
+    def receive(self, consumer: BlockingConsumer, body: bytes, headers: Dict):
+        tag = next(self.tags)
+        if not consumer.auto_ack:
+            self.unacked[tag] = (consumer.queue, body, headers)
+        method = SimpleNamespace(delivery_tag=tag, routing_key=consumer.queue)
+        properties = pika.BasicProperties(headers=headers)
+        self.connection.add_callback_threadsafe(functools.partial(consumer.callback, self, method, properties, body))
+
+    def basic_ack(self, delivery_tag: int, multiple: bool = False):
+        self.settle(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int, multiple: bool = False, requeue: bool = True):
+        message = self.settle(delivery_tag)
+        if requeue and message is not None:
+            queue, body, headers = message
+            self.broker.requeue(queue, [(body, headers)])
+
+    def settle(self, delivery_tag: int) -> Optional[Tuple[str, bytes, Dict]]:
+        with self.broker.lock:
+            message = self.unacked.pop(delivery_tag, None)
+        if message is not None:
+            self.broker.dispatch(message[0])
+        return message
+
+    def close(self):
+        """Stop consuming and hand unacknowledged messages back to their queues"""
+        with self.broker.lock:
+            self.is_open = False
+            for consumer in self.consumers:
+                self.broker.unsubscribe(consumer.queue, consumer)
+            unacked, self.unacked = list(self.unacked.values()), {}
+        for queue in {queue for queue, _, _ in unacked}:
+            self.broker.requeue(queue, [(body, headers) for name, body, headers in unacked if name == queue])
+
+
+class BlockingConnection:
+    """Stands in for pika.BlockingConnection: callbacks and timers run on the thread calling process_data_events()."""
+
+    def __init__(self, broker: InProcessBroker) -> None:
+        self.broker = broker
+        self.condition = threading.Condition()
+        self.callbacks: Deque[Callable] = deque()
+        self.timers: List[Tuple[float, int, Callable]] = []
+        self.timer_ids = itertools.count(1)
+        self.channels: List[BlockingChannel] = []
+        self.is_open = True
+        self.is_closed = False
+
+    def channel(self) -> BlockingChannel:
+        channel = BlockingChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback: Callable):
+        if self.is_closed:
+            raise pika.exceptions.ConnectionWrongStateError("Connection is closed")
+        with self.condition:
+            self.callbacks.append(callback)
+            self.condition.notify()
+
+    def call_later(self, delay: float, callback: Callable) -> int:
+        timer_id = next(self.timer_ids)
+        with self.condition:
+            self.timers.append((time.monotonic() + delay, timer_id, callback))
+            self.condition.notify()
+        return timer_id
+
+    def remove_timeout(self, timer_id: int):
+        with self.condition:
+            self.timers = [timer for timer in self.timers if timer[1] != timer_id]
+
+    def process_data_events(self, time_limit: float = 0):
+        deadline = time.monotonic() + (time_limit or 0)
+        with self.condition:
+            while not self.callbacks and not self.due_timers() and time.monotonic() < deadline:
+                wake = min([deadline] + [at for at, _, _ in self.timers])
+                self.condition.wait(max(0.0, wake - time.monotonic()))
+            callbacks, self.callbacks = list(self.callbacks), deque()
+            due = self.due_timers()
+            self.timers = [timer for timer in self.timers if timer not in due]
+        for callback in callbacks:
+            callback()
+        for _, _, callback in due:
+            callback()
+
+    def due_timers(self) -> List[Tuple[float, int, Callable]]:
+        now = time.monotonic()
+        return [timer for timer in self.timers if timer[0] <= now]
+
+    def close(self):
+        if self.is_closed:
+            return
+        for channel in self.channels:
+            channel.close()
+        self.is_open = False
+        self.is_closed = True
+
+
+class Publisher:
+    """
+    Same interface as common.publisher.Publisher; a message is confirmed as soon as it is queued.
+    Queues have no per-message TTL, the consumers' own deadline checks drop expired requests.
+    """
+
+    def __init__(self, broker: InProcessBroker, queues: List[str] = None, **options) -> None:
+        self.broker = broker
+        for queue in queues or []:
+            broker.declare(queue)
+
+    def start(self, wait: bool = True) -> bool:
+        return True
+
+    def publish(self, routing_key: str, body, headers: Optional[Dict] = None,
+                exchange: str = '', content_type: str = "application/json",
+                ordering_key: Optional[str] = None) -> Future:
+        # Every queue is one FIFO here, so messages are in publish order whatever their key
+        self.broker.publish(routing_key, body, stamp_headers(headers))
+        confirmed = Future()
+        confirmed.set_result(True)
+        return confirmed
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+class AioMessage:
+    def __init__(self, consumer: "AioConsumer", body: bytes, headers: Dict) -> None:
+        self.consumer = consumer
+        self.body = body
+        self.headers = headers
+        self.requeued = False
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        try:
+            yield
+        except Exception:
+            if requeue:
+                await self.reject(requeue=True)
+            raise
+        finally:
+            with self.consumer.broker.lock:
+                self.consumer.in_flight -= 1
+            self.consumer.broker.dispatch(self.consumer.queue)
+
+    async def reject(self, requeue: bool = False):
+        """Settle the message without processing it; it goes back to the front of its queue if `requeue`"""
+        if requeue and not self.requeued:
+            self.requeued = True
+            self.consumer.broker.requeue(self.consumer.queue, [(self.body, self.headers)])
+
+
+class AioConsumer:
+    def __init__(self, broker: InProcessBroker, queue: str, callback: Callable, prefetch: int) -> None:
+        self.broker = broker
+        self.queue = queue
+        self.callback = callback
+        self.prefetch = prefetch
+        self.in_flight = 0
+        self.loop = asyncio.get_running_loop()
+
+    def has_capacity(self) -> bool:
+        return not self.prefetch or self.in_flight < self.prefetch
+
+    def deliver(self, body: bytes, headers: Dict):
+        self.in_flight += 1
+        message = AioMessage(self, body, headers)
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self.callback(message)))
+
+
+class AioQueue:
+    def __init__(self, channel: "AioChannel", name: str) -> None:
+        self.channel = channel
+        self.name = name
+        self.consumers: Dict[str, AioConsumer] = {}
+
+    @property
+    def declaration_result(self) -> SimpleNamespace:
+        with self.channel.broker.lock:
+            return SimpleNamespace(message_count=len(self.channel.broker.queues.get(self.name, ())),
+                                   consumer_count=len(self.channel.broker.consumers.get(self.name, ())))
+
+    async def consume(self, callback: Callable) -> str:
+        consumer = AioConsumer(self.channel.broker, self.name, callback, self.channel.prefetch)
+        consumer_tag = f"ctag-{self.name}-{id(consumer)}"
+        self.consumers[consumer_tag] = consumer
+        self.channel.broker.subscribe(self.name, consumer)
+        return consumer_tag
+
+    async def cancel(self, consumer_tag: str):
+        consumer = self.consumers.pop(consumer_tag, None)
+        if consumer is not None:
+            self.channel.broker.unsubscribe(self.name, consumer)
+
+
+class AioExchange:
+    def __init__(self, broker: InProcessBroker) -> None:
+        self.broker = broker
+
+    async def publish(self, message, routing_key: str):
+        self.broker.publish(routing_key, message.body, message.headers)
+
+
+class AioChannel:
+    """The parts of an aio-pika channel the gateway uses."""
+
+    def __init__(self, broker: InProcessBroker) -> None:
+        self.broker = broker
+        self.prefetch = 0
+        self.is_closed = False
+        self.default_exchange = AioExchange(broker)
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch = prefetch_count
+
+    async def declare_queue(self, name: str, passive: bool = False, **kwargs) -> AioQueue:
+        if not passive:
+            self.broker.declare(name)
+        return AioQueue(self, name)
+
+
+class AioConnection:
+    def __init__(self, broker: InProcessBroker) -> None:
+        self.broker = broker
+        self.is_closed = False
+
+    async def channel(self) -> AioChannel:
+        return AioChannel(self.broker)
+
+    async def close(self):
+        self.is_closed = True
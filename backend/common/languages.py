@@ -0,0 +1,19 @@
+from typing import Iterable, Optional
+
+# ISO 639-1 codes langid identifies, i.e. every language the detection service can answer with
+LANGID_LANGUAGES = (
+    "af", "am", "an", "ar", "as", "az", "be", "bg", "bn", "br", "bs", "ca", "cs", "cy", "da", "de", "dz",
+    "el", "en", "eo", "es", "et", "eu", "fa", "fi", "fo", "fr", "ga", "gl", "gu", "he", "hi", "hr", "ht",
+    "hu", "hy", "id", "is", "it", "ja", "jv", "ka", "kk", "km", "kn", "ko", "ku", "ky", "la", "lb", "lo",
+    "lt", "lv", "mg", "mk", "ml", "mn", "mr", "ms", "mt", "nb", "ne", "nl", "nn", "no", "oc", "or", "pa",
+    "pl", "ps", "pt", "qu", "ro", "ru", "rw", "se", "si", "sk", "sl", "sq", "sr", "sv", "sw", "ta", "te",
+    "th", "tl", "tr", "ug", "uk", "ur", "vi", "vo", "wa", "xh", "zh", "zu",
+)
+
+
+def supported_hint(hint, languages: Iterable[str]) -> Optional[str]:
+    """A client's source_lang hint as a code from `languages`, or None when it names no supported language"""
+    if not isinstance(hint, str):
+        return None
+    code = hint.strip().lower()
+    return code if code in languages else None
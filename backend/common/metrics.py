@@ -0,0 +1,145 @@
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+# AMQP headers carrying pipeline timestamps (epoch seconds) from hop to hop
+PUBLISHED_AT_HEADER = "x-published-at"
+# When the gateway received the chat message; copied unchanged through every hop
+RECEIVED_AT_HEADER = "x-received-at"
+# Epoch seconds after which nobody waits for the request's result any more; also copied through every hop
+DEADLINE_HEADER = "x-deadline"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative latency buckets plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 2048) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Counters and latency histograms of the process, keyed by name and labels."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(max(0.0, seconds))
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe how long the block takes, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def observe_since(self, name: str, timestamp, **labels):
+        """Observe the time elapsed since an epoch timestamp taken by this or another service"""
+        try:
+            self.observe(name, time.time() - float(timestamp), **labels)
+        except (TypeError, ValueError):
+            pass  # Message published without the timestamp header
+
+    def observe_dwell(self, queue: str, headers: Optional[Dict]):
+        """Time a message spent in `queue`, from the publish timestamp in its headers"""
+        if headers:
+            self.observe_since("queue_dwell_seconds", headers.get(PUBLISHED_AT_HEADER), queue=queue)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: [{"labels": dict(key), **histogram.snapshot()} for key, histogram in series.items()]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format"""
+        def render(labels: Dict) -> str:
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+        lines = []
+        with self.lock:
+            for name, series in self.counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{render(dict(key))} {value}")
+            for name, series in self.histograms.items():
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    labels, cumulative = dict(key), 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{render({**labels, 'le': le})} {cumulative}")
+                    lines.append(f"{name}_sum{render(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{render(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def stamp_headers(headers: Optional[Dict] = None, received_at: Optional[float] = None) -> Dict:
+    """
+    Headers for an outgoing message: a fresh publish time, with everything else in `headers`
+    (the gateway receive time, the deadline, the schema version) carried along.
+    """
+    stamped = {**(headers or {}), PUBLISHED_AT_HEADER: time.time()}
+    if received_at is not None:
+        stamped[RECEIVED_AT_HEADER] = received_at
+    return stamped
+
+
+metrics = MetricsRegistry()
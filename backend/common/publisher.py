@@ -0,0 +1,265 @@
+import logging
+import random
+import functools
+import itertools
+import threading
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional
+import pika
+import pika.spec
+from common.metrics import stamp_headers
+from common import deadline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ChannelState:
+    """A pooled channel with the publishes it is still waiting to have confirmed."""
+
+    def __init__(self, channel) -> None:
+        self.channel = channel
+        self.next_tag = 1
+        self.outstanding: "OrderedDict[int, Dict]" = OrderedDict()
+
+
+class Publisher:
+    """
+    Thread-safe RabbitMQ publisher shared by every thread of a service.
+
+    One I/O thread owns a pika SelectConnection and a pool of channels in confirm mode.
+    publish() can be called from any thread: it puts the message in the outbox and
+    returns a Future resolved when the broker confirms it. The I/O thread drains the
+    outbox in bulk, and the broker acknowledges confirms in batches (multiple=True).
+
+    When the broker goes away the I/O thread reconnects with exponential backoff.
+    Publishes keep collecting in the outbox meanwhile, and unconfirmed messages are put
+    back at its front, so a broker restart delays messages instead of losing them.
+    At most `max_pending` messages are buffered or unconfirmed; publish() waits up to
+    `publish_timeout` for room beyond that and then raises.
+
+    RabbitMQ keeps messages in order only within a channel. Messages are spread over the
+    pool round-robin, except those sharing an ordering key (e.g. a request id), which
+    always go out on the same channel and so reach their queue in publish order.
+    """
+
+    def __init__(self, url: str, queues: List[str] = None, channels: int = 2,
+                 max_pending: int = 10000, connect_timeout: float = 10.0, publish_timeout: float = 5.0,
+                 backoff: float = 0.5, max_backoff: float = 30.0) -> None:
+        self.url = url
+        self.queues = queues or []
+        self.channel_count = channels
+        self.max_pending = max_pending
+        self.connect_timeout = connect_timeout
+        self.publish_timeout = publish_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connection = None
+        self.thread = None
+        self.states: List[ChannelState] = []
+        self.round_robin = None
+        self.ready = threading.Event()
+        self.wake = threading.Event()
+        self.closing = False
+        self.attempt = 0
+        self.outbox: Deque[Dict] = deque()
+        # Messages in the outbox plus messages published but not yet confirmed
+        self.pending = 0
+        self.condition = threading.Condition()
+
+    def start(self, wait: bool = True) -> bool:
+        """Start the I/O thread, optionally waiting for the first connection; publishes are buffered until then"""
+        if self.thread is None or not self.thread.is_alive():
+            self.closing = False
+            self.wake.clear()
+            self.thread = threading.Thread(target=self.run, name="amqp-publisher", daemon=True)
+            self.thread.start()
+        if not wait:
+            return self.ready.is_set()
+        if self.ready.wait(self.connect_timeout):
+            logger.info(f"Publisher ready with {len(self.states)} channels.")
+            return True
+        logger.warning("Broker unreachable; buffering publishes until it is back.")
+        return False
+
+    def publish(self, routing_key: str, body, headers: Optional[Dict] = None,
+                exchange: str = '', content_type: str = "application/json",
+                ordering_key: Optional[str] = None) -> Future:
+        """
+        Queue a message for publishing from any thread; the Future resolves on broker confirm.
+        Messages with the same `ordering_key` are published on one channel, in the order of their publish() calls.
+        The message is stamped with its publish time, keeping the gateway receive time and deadline from `headers`;
+        a message with a deadline expires in its queue once the deadline passes.
+        """
+        headers = stamp_headers(headers)
+        expires_in = deadline.ttl(headers)
+        properties = pika.BasicProperties(
+            content_type=content_type, headers=headers,
+            expiration=str(int(expires_in * 1000)) if expires_in is not None else None,
+        )
+        if self.thread is None or not self.thread.is_alive():
+            self.start(wait=False)
+        confirmed = Future()
+        message = {"exchange": exchange, "routing_key": routing_key, "body": body,
+                   "properties": properties, "confirmed": confirmed, "ordering_key": ordering_key}
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pending < self.max_pending, self.publish_timeout):
+                raise ConnectionError(f"Publisher outbox is full ({self.pending} messages pending)")
+            self.pending += 1
+            self.outbox.append(message)
+        self._schedule_drain()
+        return confirmed
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every message published so far is confirmed."""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.flush(timeout=self.connect_timeout)
+        self.closing = True
+        self.wake.set()
+        try:
+            self.connection.ioloop.add_callback_threadsafe(self._shutdown)
+        except Exception:
+            pass  # Not connected, the I/O thread is waiting out a backoff
+        self.thread.join(timeout=self.connect_timeout)
+        self.thread = None
+        with self.condition:
+            dropped, self.outbox = list(self.outbox), deque()
+        for message in dropped:
+            message["confirmed"].set_exception(ConnectionError("Publisher closed before the message was sent"))
+        self._release(len(dropped))
+        logger.info("Publisher connection closed.")
+
+    def _schedule_drain(self):
+        if not self.ready.is_set():
+            return  # Drained once the channels are back
+        try:
+            self.connection.ioloop.add_callback_threadsafe(self._drain)
+        except Exception:
+            pass  # The connection just went away, reconnecting drains the outbox
+
+    # Everything below runs on the I/O thread
+
+    def run(self):
+        """Keep a connection open until close(), reconnecting with exponential backoff and jitter"""
+        while not self.closing:
+            self.states = []
+            try:
+                self.connection = pika.SelectConnection(
+                    pika.URLParameters(self.url),
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_error,
+                    on_close_callback=self._on_connection_closed,
+                )
+                self.connection.ioloop.start()  # Returns once the connection is gone
+            except Exception as e:
+                logger.error(f"Publisher connection failed: {e}")
+            self.ready.clear()
+            if self.closing:
+                break
+            delay = min(self.max_backoff, self.backoff * 2 ** self.attempt) * random.uniform(0.5, 1.0)
+            self.attempt += 1
+            logger.warning(f"Reconnecting publisher in {delay:.2f}s (attempt {self.attempt}).")
+            self.wake.wait(delay)
+
+    def _shutdown(self):
+        try:
+            self.connection.close()
+        except Exception:
+            self.connection.ioloop.stop()
+
+    def _on_connection_open(self, connection):
+        for _ in range(self.channel_count):
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        logger.error(f"Publisher connection failed: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        logger.warning(f"Publisher connection closed: {reason}")
+        self.ready.clear()
+        # Unconfirmed messages may never have reached a queue; send them again first thing
+        unconfirmed = [message for state in self.states for message in state.outstanding.values()]
+        for state in self.states:
+            state.outstanding.clear()
+        with self.condition:
+            self.outbox.extendleft(reversed(unconfirmed))
+        if unconfirmed:
+            logger.warning(f"Requeued {len(unconfirmed)} unconfirmed messages in the outbox.")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        state = ChannelState(channel)
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=functools.partial(self._on_confirm, state))
+        for queue in self.queues:
+            channel.queue_declare(queue=queue)
+        self.states.append(state)
+        if len(self.states) == self.channel_count:
+            self.round_robin = itertools.cycle(self.states)
+            self.attempt = 0
+            self.ready.set()
+            self._drain()
+
+    def _on_channel_closed(self, channel, reason):
+        if self.closing:
+            return
+        logger.warning(f"Publisher channel closed: {reason}; reopening the connection.")
+        # The whole pool is rebuilt, which also puts this channel's unconfirmed messages back in the outbox
+        if self.connection.is_open:
+            self.connection.close()
+
+    def _drain(self):
+        """Publish everything in the outbox in one pass"""
+        if not self.ready.is_set():
+            return
+        with self.condition:
+            messages, self.outbox = list(self.outbox), deque()
+        for position, message in enumerate(messages):
+            state = self._channel_for(message)
+            try:
+                state.channel.basic_publish(exchange=message["exchange"], routing_key=message["routing_key"],
+                                            body=message["body"], properties=message["properties"])
+            except Exception as e:
+                logger.warning(f"Publishing stopped at {message['routing_key']}: {e}; keeping the rest in the outbox.")
+                with self.condition:
+                    self.outbox.extendleft(reversed(messages[position:]))
+                return
+            state.outstanding[state.next_tag] = message
+            state.next_tag += 1
+        if len(messages) > 1:
+            logger.debug(f"Flushed {len(messages)} messages from the outbox.")
+
+    def _channel_for(self, message: Dict) -> ChannelState:
+        if message["ordering_key"] is None:
+            return next(self.round_robin)
+        # A stable hash, so a key keeps its channel for as long as the pool has the same size
+        return self.states[zlib.crc32(message["ordering_key"].encode()) % len(self.states)]
+
+    def _on_confirm(self, state: ChannelState, frame):
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in state.outstanding if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in state.outstanding else []
+        ack = isinstance(method, pika.spec.Basic.Ack)
+        for tag in tags:
+            message = state.outstanding.pop(tag)
+            if ack:
+                message["confirmed"].set_result(True)
+            else:
+                message["confirmed"].set_exception(ConnectionError(f"Broker did not confirm message to {message['routing_key']}"))
+        self._release(len(tags))
+
+    def _release(self, count: int):
+        if count:
+            with self.condition:
+                self.pending -= count
+                self.condition.notify_all()
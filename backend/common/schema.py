@@ -0,0 +1,149 @@
+import json
+import logging
+from typing import Dict, Optional, Tuple
+import msgpack
+from common.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bumped when a field changes meaning or becomes required; adding an optional field keeps the version
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_HEADER = "x-schema-version"
+ENCODINGS = {"msgpack": "application/msgpack", "json": "application/json"}
+
+
+class SchemaError(ValueError):
+    """A message that does not match its schema."""
+
+
+class Schema:
+    """
+    The fields of one kind of message with their accepted types.
+    validate() checks a decoded dict in a single pass over the fields and returns only the
+    known ones, so unknown keys never travel further down the pipeline.
+    """
+
+    def __init__(self, name: str, fields: Dict[str, Tuple[type, ...]], required: Tuple[str, ...] = (),
+                 aliases: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.fields = fields
+        self.required = frozenset(required)
+        # Legacy field name -> current name, renamed when decoding old messages
+        self.aliases = aliases or {}
+
+    def validate(self, message: Dict) -> Dict:
+        if not isinstance(message, dict):
+            raise SchemaError(f"{self.name} must be an object, got {type(message).__name__}")
+        valid = {}
+        for field, types in self.fields.items():
+            value = message.get(field)
+            if value is None:
+                if field in self.required:
+                    raise SchemaError(f"{self.name} is missing '{field}'")
+                continue
+            if not isinstance(value, types):
+                raise SchemaError(f"{self.name} field '{field}' has type {type(value).__name__}")
+            valid[field] = value
+        return valid
+
+    def upgrade(self, message: Dict) -> Dict:
+        """Rename the legacy fields of a message from a producer that predates the schema, and stringify its id"""
+        if isinstance(message, dict):
+            for legacy, field in self.aliases.items():
+                if legacy in message and field not in message:
+                    message[field] = message.pop(legacy)
+            # The baseline gateway numbered its requests, e.g. {"id": 1, ...}
+            request_id = message.get("id")
+            if isinstance(request_id, int) and not isinstance(request_id, bool):
+                message["id"] = str(request_id)
+        return message
+
+
+LEGACY_ALIASES = {"source_language": "source_lang", "target_language": "target_lang"}
+
+# Gateway -> detection (ingestion queue) and detection or gateway -> translation (detection queue)
+TRANSLATION_REQUEST = Schema(
+    "TranslationRequest",
+    {
+        "id": (str,),
+        "text": (str,),
+        "source_lang": (str,),
+        "target_lang": (str,),
+        "target_langs": (list,),
+        "stream": (bool,),
+    },
+    required=("id", "text"),
+    aliases=LEGACY_ALIASES,
+)
+
+# Translation or detection -> gateway (translation queue): a result, a stream chunk or an error
+TRANSLATION_RESULT = Schema(
+    "TranslationResult",
+    {
+        "id": (str,),
+        "type": (str,),
+        "text": (str,),
+        "translation_text": (str,),
+        "translations": (dict,),
+        "source_lang": (str,),
+        "target_lang": (str,),
+        "detected_by": (str,),
+        "seq": (int,),
+        "final": (bool,),
+        "delta": (str,),
+        "error": (str,),
+    },
+    required=("id",),
+    aliases=LEGACY_ALIASES,
+)
+
+# Detection and translation -> gateway (status queue)
+STATUS = Schema(
+    "Status",
+    {
+        "id": (str,),
+        "type": (str,),
+        "message": (str,),
+    },
+    required=("message",),
+)
+
+
+class MessageCodec:
+    """
+    Encodes messages with a service's configured encoding, and decodes either encoding.
+    Bodies are self-describing: a JSON object starts with '{', which no msgpack map does,
+    so producers that still send JSON (with or without the version header) keep working.
+    """
+
+    def __init__(self, encoding: str = "msgpack") -> None:
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown message encoding {encoding!r}, expected one of {sorted(ENCODINGS)}")
+        self.encoding = encoding
+        self.content_type = ENCODINGS[encoding]
+
+    def encode(self, schema: Schema, message: Dict, headers: Optional[Dict] = None) -> Tuple[bytes, Dict]:
+        """Validate and serialize `message`; returns the body and `headers` stamped with the schema version"""
+        message = schema.validate(message)
+        if self.encoding == "msgpack":
+            body = msgpack.packb(message, use_bin_type=True)
+        else:
+            body = json.dumps(message, separators=(",", ":")).encode()
+        return body, {**(headers or {}), SCHEMA_VERSION_HEADER: SCHEMA_VERSION}
+
+    def decode(self, schema: Schema, body: bytes, headers: Optional[Dict] = None) -> Dict:
+        """Deserialize and validate a message in either encoding; raises SchemaError when it does not fit `schema`"""
+        version = (headers or {}).get(SCHEMA_VERSION_HEADER)
+        try:
+            if body[:1] == b"{":
+                message = json.loads(body)
+                # Once this stops growing every producer has moved to msgpack
+                metrics.inc("json_messages_decoded_total", schema=schema.name)
+            else:
+                message = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise SchemaError(f"Undecodable {schema.name}: {e!r}") from e
+        if version is None:
+            message = schema.upgrade(message)
+        return schema.validate(message)
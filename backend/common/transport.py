@@ -0,0 +1,82 @@
+import logging
+from typing import Dict, List, Tuple
+import pika
+from common.inprocess import AioConnection, BlockingConnection, InProcessBroker
+from common.inprocess import Publisher as InProcessPublisher
+from common.publisher import Publisher
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Transport:
+    """
+    How a service reaches the queues shared with the other services.
+    Consumers get a blocking connection (pika's BlockingConnection interface) or an
+    asyncio connection (aio-pika's), and producers get a Publisher whose publishes
+    return a Future resolved once the message is safely queued.
+    """
+
+    def blocking_connection(self):
+        raise NotImplementedError
+
+    async def aio_connect(self, url: str = None):
+        raise NotImplementedError
+
+    def publisher(self, queues: List[str] = None, **options):
+        raise NotImplementedError
+
+
+class RabbitMqTransport(Transport):
+    """Every hop goes through the broker at `url`; the services run as separate processes."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def blocking_connection(self) -> pika.BlockingConnection:
+        return pika.BlockingConnection(pika.URLParameters(self.url))
+
+    async def aio_connect(self, url: str = None):
+        import aio_pika  # Only the gateway consumes on its event loop
+        return await aio_pika.connect_robust(url or self.url)
+
+    def publisher(self, queues: List[str] = None, **options) -> Publisher:
+        return Publisher(self.url, queues=queues, **options)
+
+
+class InProcessTransport(Transport):
+    """
+    Queues live in this process, for running every service in one process (see backend/monolith.py).
+    A hop costs a thread or event loop wake-up instead of a broker round trip, and a publish is
+    confirmed as soon as it is queued. Nothing survives a restart of the process.
+    """
+
+    def __init__(self, broker: InProcessBroker = None) -> None:
+        self.broker = broker or InProcessBroker()
+
+    def blocking_connection(self) -> BlockingConnection:
+        return BlockingConnection(self.broker)
+
+    async def aio_connect(self, url: str = None) -> AioConnection:
+        return AioConnection(self.broker)
+
+    def publisher(self, queues: List[str] = None, **options) -> InProcessPublisher:
+        return InProcessPublisher(self.broker, queues=queues)
+
+
+TRANSPORTS = {"rabbitmq": RabbitMqTransport, "inprocess": InProcessTransport}
+_transports: Dict[Tuple[str, str], Transport] = {}
+
+
+def get_transport(kind: str, url: str = None) -> Transport:
+    """
+    The transport named by a service's TRANSPORT setting ("rabbitmq" or "inprocess").
+    Services asking for the same one share it, so every service in a process shares one in-process broker.
+    """
+    if kind not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {kind!r}, expected one of {sorted(TRANSPORTS)}")
+    key = (kind, url if kind == "rabbitmq" else None)
+    if key not in _transports:
+        _transports[key] = RabbitMqTransport(url) if kind == "rabbitmq" else InProcessTransport()
+        logger.info(f"Using the {kind} transport.")
+    return _transports[key]
@@ -1,22 +1,45 @@
-from fastapi import FastAPI
+import os
+import sys
+# Modules shared by the backend services live in backend/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from typing import Optional
+from fastapi import FastAPI, Header
+from fastapi.responses import PlainTextResponse
 import uvicorn
-# from models.request import Request
-# from models.response import Response
 from contextlib import asynccontextmanager
 from services.language_detection import language_detection
+from utils.utils import utility_service
+from common.metrics import metrics, DEADLINE_HEADER, RECEIVED_AT_HEADER
 
 @asynccontextmanager
 async def lifespan(app : FastAPI):
+    await utility_service.start_background_tasks()
     yield
+    utility_service.close_background_tasks()
     language_detection.close()
 
 
 app = FastAPI(title="Language Detection Service", lifespan=lifespan)
 
 @app.post("/detect-language")
-def detect_language(request : dict):
-    response = language_detection.process(request)
+def detect_language(request : dict, x_received_at: Optional[float] = Header(None),
+                    x_deadline: Optional[float] = Header(None)):
+    # The gateway's receive time and deadline ride along in the AMQP headers of the published request
+    headers = {}
+    if x_received_at is not None:
+        headers[RECEIVED_AT_HEADER] = x_received_at
+    if x_deadline is not None:
+        headers[DEADLINE_HEADER] = x_deadline
+    with metrics.timer("detection_request_seconds"):
+        response = language_detection.process(request, headers)
     return response
 
+@app.get("/metrics")
+def get_metrics(format: str = "json"):
+    """Latency histograms and counters; `?format=prometheus` for the text exposition format"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus())
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8081, reload=True)
\ No newline at end of file
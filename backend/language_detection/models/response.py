@@ -1,7 +0,0 @@
-from pydantic import BaseModel
-
-class Request(BaseModel):
-    source_lang: str
-    target_lang: str
-    text: str
-    id: str
\ No newline at end of file
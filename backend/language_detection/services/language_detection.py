@@ -2,12 +2,19 @@ import logging
 import pika.exceptions
 from transformers import pipeline
 # from langdetect import detect_langs, DetectorFactory
-from langid.langid import LanguageIdentifier, model
-from utils.model import model
+from utils.detectors import detector_chain
 from core.config import settings
 import pika
-from typing import Dict
-import json
+from typing import Dict, Optional, Tuple
+from concurrent.futures import Future
+import functools
+from threading import Event
+from common.transport import get_transport
+from common.metrics import metrics
+from common import deadline
+from common.languages import supported_hint
+from common.schema import MessageCodec, STATUS, TRANSLATION_REQUEST, TRANSLATION_RESULT
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,121 +23,217 @@ logger = logging.getLogger(__name__)
 class LanguageDetectionService:
     def __init__(self):
         logger.info("Initializing LanguageDetectionService...")
+        self.stop_event = Event()
+        self.transport = get_transport(settings.TRANSPORT, settings.RABBITMQ_URL)
+        self.codec = MessageCodec(settings.MESSAGE_ENCODING)
+        # Shared by the HTTP threadpool and the ingestion consumer thread
+        self.publisher = self.transport.publisher(
+            queues=[settings.DETECTION_QUEUE, settings.STATUS_QUEUE, settings.TRANSLATION_QUEUE],
+            channels=settings.PUBLISHER_CHANNELS,
+            max_pending=settings.PUBLISHER_MAX_PENDING,
+            publish_timeout=settings.PUBLISHER_PUBLISH_TIMEOUT,
+            backoff=settings.PUBLISHER_RECONNECT_BACKOFF,
+            max_backoff=settings.PUBLISHER_RECONNECT_MAX_BACKOFF,
+        )
         self.setup_rabbitmq()
     
     def setup_rabbitmq(self):
-        """Setup RabbitMQ connection and channel"""
+        """Setup the RabbitMQ publisher"""
         try:
             logger.info("Setting up RabbitMQ connection...")
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=settings.DETECTION_QUEUE)
+            self.publisher.start()
             logger.info("RabbitMQ setup complete.")
         except Exception as e:
             logger.error(f"Failed to set up RabbitMQ: {e}")
             raise
 
-    def process(self, request: Dict):
+    def process(self, request: Dict, headers: Optional[Dict] = None):
         """Perform the Language Detection Process with Retry Logic"""
+        response, _ = self.run(request, headers)
+        return response
+
+    def run(self, request: Dict, headers: Optional[Dict] = None) -> Tuple[Dict, Optional[Future]]:
+        """
+        Detect and publish, returning the response and the broker confirm of the published request.
+        `headers` are the ingested message's headers, whose timestamps travel on with the request.
+        """
         logger.info("Starting language detection process...")
+        if deadline.expired(headers, stage="detection"):
+            # The gateway has stopped waiting, so neither the model nor the translation stage is bothered
+            logger.info(f"Dropping expired detection request: {request.get('id')}")
+            return {"message": "Request expired before language detection."}, None
         max_retries = 3
         attempt = 0
 
         while attempt < max_retries:
             try:
-                logger.info(f"Attempt {attempt + 1} for Detection: {request}")
-                self.publish_status({"type": "status", "message": "Language detection started."})
+                logger.info(f"Attempt {attempt + 1} for Detection: {request.get('id')}")
+                logger.debug(f"Detection request: {request}")
+                self.publish_status({"type": "status", "message": "Language detection started.", "id": request.get('id')})
                 text = request.get('text')
 
-                source_lang = self.detect(text)
+                hint = supported_hint(request.get('source_lang'), settings.CLIENT_SOURCE_LANGUAGES)
+                if hint is not None:
+                    # The client already knows its language, no need to ask a model
+                    detection = {"source_lang": hint, "confidence": 1.0, "tier": "client"}
+                else:
+                    if request.get('source_lang'):
+                        logger.warning(f"Ignoring unsupported source_lang hint {request['source_lang']!r}")
+                    detection = self.detect(text)
+                source_lang = detection["source_lang"]
                 request['source_lang'] = source_lang
-                self.publish_lang(request)
-                self.publish_status({"type": "status", "message": "Language detection completed."})
+                metrics.inc("detections_total", tier=detection["tier"])
+                published = self.publish_lang(request, headers)
+                self.publish_status({"type": "status", "message": "Language detection completed.", "id": request.get('id')})
                 return {
                     "message": "Language detection process completed.",
-                    "source_lang": source_lang
-                }
+                    "source_lang": source_lang,
+                    "confidence": detection["confidence"],
+                    "detected_by": detection["tier"],
+                }, published
+            except ConnectionError:
+                # The publisher's outbox is full or closed; detecting again would only wait on it again
+                raise
             except Exception as e:
                 attempt += 1
                 if attempt >= max_retries:
                     logger.error("Max retries reached. Failing the process.")
-                    self.publish_status({"type": "status", "message": "Language detection failed."})
+                    metrics.inc("detection_failures_total")
+                    self.publish_status({"type": "status", "message": "Language detection failed.", "id": request.get('id')})
                     raise
                 else:
                     logger.info("Retrying language detection process...")
 
-    def detect(self, text: str) -> str:
-        """Detect language using lang_detect library"""
+    def detect(self, text: str) -> Dict:
+        """Detect language with the local classifier, escalating to the LLM on low confidence"""
         logger.info("Detecting language...")
         try:
             # DetectorFactory.seed = 0
             # detected_lang = detect_langs(text)[0]
             # parsed_lang = utility_service.extract_lang(str(detected_lang))
             # logger.info(f"Language detected: {parsed_lang}")
-            # identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
-            # # identifier.classify("This is a test")
-            # parsed_lang, confidence = identifier.classify(text.lower())
-            # logger.info(f"Language detected: {parsed_lang} with confidence {confidence}")
-            lang_code = model.detect(text)
-            logger.info(f"Language detected: {lang_code}")
+            start = time.perf_counter()
+            detection = detector_chain.detect(text)
+            metrics.observe("detection_model_seconds", time.perf_counter() - start, tier=detection["tier"])
+            logger.info(f"Language detected: {detection['source_lang']} "
+                        f"with confidence {detection['confidence']:.3f} by tier '{detection['tier']}'")
             
-            # ('en', 0.9999999909903544) #sample answer
-            return lang_code
+            # {'source_lang': 'en', 'confidence': 0.99, 'tier': 'langid'} #sample answer
+            return detection
         except Exception as e:
             logger.error(f"Error detecting language: {e}")
             raise
     
-    def publish_lang(self, request: Dict):
-        """Queue translation request in RabbitMQ"""
+    def publish(self, queue: str, schema, message: Dict, headers: Optional[Dict] = None) -> Future:
+        """Encode `message` with the shared schema and hand it to the publisher, keeping a request's messages in order"""
+        body, headers = self.codec.encode(schema, message, headers)
+        request_id = message.get('id')
+        return self.publisher.publish(queue, body, headers, content_type=self.codec.content_type,
+                                      ordering_key=str(request_id) if request_id is not None else None)
+
+    def publish_lang(self, request: Dict, headers: Optional[Dict] = None) -> Future:
+        """Queue translation request in RabbitMQ; raises when the publisher cannot take it"""
         logger.info("Publishing detected language to RabbitMQ...")
         try:
-            message = {
-                "id": request.get('id'),
-                "text": request.get('text'),
-                "source_lang": request.get('source_lang'),
-                "target_lang": request.get('target_lang'),
-            }
-            logger.info(f"Request to Detection Queue: {message}")
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=settings.DETECTION_QUEUE,
-                body=json.dumps(message)
-            )
-            logger.info("Message published to Detection Queue.")
-
-            # self.close()
-        except pika.exceptions.ChannelClosed as e:
-            logger.error(f"Channel is closed: {e}. Re-establishing connection...")
-            # self.setup_rabbitmq()  # Re-establish connection
-            # self.publish_lang(request)  # Retry publishing
+            logger.debug(f"Request to Detection Queue: {request}")
+            # Only the schema's fields are forwarded
+            return self.publish(settings.DETECTION_QUEUE, TRANSLATION_REQUEST, request, headers)
         except Exception as e:
             logger.error(f"Failed to publish message to RabbitMQ: {e}")
+            raise
     
     def publish_status(self, status):
+        """Publish a progress event; best effort, a status that cannot be published is only logged"""
         logger.info("Publishing status to RabbitMQ...")
         try:
-            logger.info(f"Request to Detection Queue: {status}")
-
-            self.channel.basic_publish(
-                    exchange='',
-                    routing_key=settings.STATUS_QUEUE,
-                    body=json.dumps(status)
-            )
-            logger.info("Message published to Status Queue.")
-        except pika.exceptions.ChannelClosed as e:
-            logger.error(f"Channel is closed: {e}. Re-establishing connection...")
-            # self.setup_rabbitmq()  # Re-establish connection
-            # self.publish_status(status)  # Retry publishing
+            logger.debug(f"Request to Status Queue: {status}")
+            return self.publish(settings.STATUS_QUEUE, STATUS, status)
         except Exception as e:
             logger.error(f"Failed to publish message to RabbitMQ: {e}")
 
+    def consume(self):
+        """
+        Consume gateway requests from the ingestion queue and run detection on each.
+        The consumer thread owns its connection, since pika channels cannot be shared across threads.
+        A request is acked once the broker confirms what was published for it, so a crash
+        in between redelivers the request instead of losing it.
+        """
+        attempt = 0
+        while not self.stop_event.is_set():
+            try:
+                connection = self.transport.blocking_connection()
+                channel = connection.channel()
+                channel.queue_declare(queue=settings.INGESTION_QUEUE)
+                channel.queue_declare(queue=settings.DETECTION_QUEUE)
+                channel.basic_qos(prefetch_count=settings.INGESTION_PREFETCH_COUNT)
+
+                def settle(ch, delivery_tag, published: Optional[Future]):
+                    if published is None:
+                        ch.basic_ack(delivery_tag=delivery_tag)
+                        return
+
+                    def on_confirm(future: Future):
+                        if future.exception() is None:
+                            action = functools.partial(ch.basic_ack, delivery_tag=delivery_tag)
+                        else:
+                            action = functools.partial(ch.basic_nack, delivery_tag=delivery_tag, requeue=True)
+                        # Confirms arrive on the publisher thread; acks must go out on this connection's thread
+                        try:
+                            connection.add_callback_threadsafe(action)
+                        except Exception as e:
+                            # The consumer connection is gone and the broker redelivers the request
+                            logger.warning(f"Could not settle delivery {delivery_tag}: {e}")
+
+                    published.add_done_callback(on_confirm)
+
+                def callback(ch, method, properties, body):
+                    request = {}
+                    try:
+                        metrics.observe_dwell(settings.INGESTION_QUEUE, properties.headers)
+                        request = self.codec.decode(TRANSLATION_REQUEST, body, properties.headers)
+                        _, published = self.run(request, properties.headers)
+                    except ConnectionError as e:
+                        published = self.requeue(method.delivery_tag, e)
+                    except Exception as e:
+                        logger.error(f"Error processing ingested request: {e}")
+                        published = None
+                        if request.get('id'):
+                            # Let the gateway answer the waiting socket instead of timing out
+                            try:
+                                published = self.publish(
+                                    settings.TRANSLATION_QUEUE, TRANSLATION_RESULT,
+                                    {"id": request['id'], "error": "Language detection failed."}, properties.headers
+                                )
+                            except ConnectionError as e:
+                                published = self.requeue(method.delivery_tag, e)
+                    settle(ch, method.delivery_tag, published)
+
+                logger.info("Starting to consume messages from the ingestion queue...")
+                channel.basic_consume(queue=settings.INGESTION_QUEUE, on_message_callback=callback)
+                attempt = 0
+                while not self.stop_event.is_set():
+                    connection.process_data_events(time_limit=1)
+                connection.close()
+            except Exception as e:
+                logger.error(f"Error in consume method: {e}")
+                delay = min(settings.PUBLISHER_RECONNECT_MAX_BACKOFF, settings.PUBLISHER_RECONNECT_BACKOFF * 2 ** attempt)
+                attempt += 1
+                logger.info(f"Reconnecting consumer in {delay:.2f}s...")
+                self.stop_event.wait(delay)
+
+    @staticmethod
+    def requeue(delivery_tag: int, error: Exception) -> Future:
+        """A failed confirm for a request whose outcome could not be published, so settling it requeues the request"""
+        logger.warning(f"Could not publish the outcome of delivery {delivery_tag}; requeueing it: {error}")
+        published = Future()
+        published.set_exception(error)
+        return published
+
     def close(self):
         """Close RabbitMQ connection"""
         logger.info("Closing RabbitMQ connection...")
         try:
-            self.connection.close()
+            self.publisher.close()
             logger.info("RabbitMQ connection closed.")
         except Exception as e:
             logger.error(f"Error closing RabbitMQ connection: {e}")
@@ -0,0 +1,79 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from langid.langid import LanguageIdentifier, model as langid_model
+from core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LangIdDetector:
+    """Local CPU classifier (langid's character n-gram model), answers in well under a millisecond."""
+
+    def __init__(self, languages: Optional[List[str]] = None):
+        self.identifier = LanguageIdentifier.from_modelstring(langid_model, norm_probs=True)
+        if languages:
+            self.identifier.set_languages(languages)
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        lang_code, confidence = self.identifier.classify(text)
+        return lang_code, float(confidence)
+
+
+class LlmDetector:
+    """Remote LLM detection; it reports no score so its answer is taken as final."""
+
+    def __init__(self):
+        # Imported lazily so a local-only chain does not need OpenAI credentials
+        from utils.model import model
+        self.model = model
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        return self.model.detect(text).strip().lower(), 1.0
+
+
+DETECTORS = {
+    "langid": lambda: LangIdDetector(settings.LOCAL_DETECTION_LANGUAGES),
+    "openai": LlmDetector,
+}
+
+
+class DetectorChain:
+    """
+    Try each tier in order and stop at the first one that is confident enough.
+    The last tier always answers; if it fails, the best earlier guess is used.
+    """
+
+    def __init__(self, tiers: List[str], threshold: float):
+        self.threshold = threshold
+        self.tiers: List[Tuple[str, object]] = []
+        for name in tiers:
+            if name not in DETECTORS:
+                raise ValueError(f"Unknown detection tier: {name}")
+            self.tiers.append((name, DETECTORS[name]()))
+        if not self.tiers:
+            raise ValueError("At least one detection tier is required")
+        logger.info(f"Detection tiers: {[name for name, _ in self.tiers]} (threshold {threshold})")
+
+    def detect(self, text: str) -> Dict:
+        """Return the language code, its confidence and the tier that answered."""
+        best = None
+        for position, (name, detector) in enumerate(self.tiers):
+            is_last = position == len(self.tiers) - 1
+            try:
+                lang_code, confidence = detector.classify(text)
+            except Exception as e:
+                logger.error(f"Detection tier '{name}' failed: {e}")
+                if is_last and best is None:
+                    raise
+                continue
+            result = {"source_lang": lang_code, "confidence": confidence, "tier": name}
+            if best is None or confidence > best["confidence"]:
+                best = result
+            if confidence >= self.threshold or is_last:
+                return result
+            logger.info(f"Tier '{name}' guessed {lang_code} at {confidence:.3f}, escalating")
+        return best
+
+
+detector_chain = DetectorChain(settings.DETECTION_TIERS, settings.DETECTION_CONFIDENCE_THRESHOLD)
@@ -1,6 +1,6 @@
 import logging
 import threading
-from openai import OpenAI
+from services.language_detection import language_detection
 # from core.config import 
 
 logging.basicConfig(level=logging.INFO)
@@ -11,8 +11,27 @@ class UtilityService:
         self.translation_thread = None
         self.processmessage_thread = None
         self.redis_subscriber_thread = None
+        self.detection_thread = None
         logger.info("UtilityService initialized.")
-    
+
+    def start_detection_consumer(self):
+        try:
+            logger.info("Starting ingestion consumer...")
+            language_detection.consume()
+        except Exception as e:
+            logger.error(f"Error in ingestion consumer: {e}")
+
+    async def start_background_tasks(self):
+        self.detection_thread = threading.Thread(
+            target=self.start_detection_consumer, daemon=True
+        )
+        self.detection_thread.start()
+
+    def close_background_tasks(self):
+        logger.info("Stopping background tasks...")
+        language_detection.stop_event.set()  # Signal the ingestion consumer to stop
+        self.detection_thread.join()  # Wait for the thread to finish
+        logger.info("'Ingestion' consumer thread closed.")
 
 
     # def start_translation_consumer(self):
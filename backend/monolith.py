@@ -0,0 +1,78 @@
+"""
+Run the gateway, language detection and translation pipelines in one process.
+
+The services talk over the in-process transport (common/inprocess.py) instead of
+RabbitMQ, so a hop costs a thread or event loop wake-up rather than a broker round
+trip. Meant for small deployments and tests. The gateway is served as usual, with
+the detection and translation apps mounted under /detection and /translation, and
+their consumers start and stop with the gateway.
+
+    cd backend && python monolith.py
+"""
+import importlib
+import os
+import sys
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict
+
+from fastapi import FastAPI
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Top-level names every service defines for itself
+SERVICE_PACKAGES = ("core", "services", "utils", "api", "main")
+BACKENDS = {"language_detection": "/detection", "translation": "/translation"}
+
+
+def load_service(name: str) -> Dict[str, object]:
+    """
+    Import backend/<name>/main.py with a private copy of the service's packages.
+    Returns the service's modules by name; they keep working after the next service replaces them in sys.modules.
+    """
+    for module in list(sys.modules):
+        if module.split(".")[0] in SERVICE_PACKAGES:
+            del sys.modules[module]
+    path = os.path.join(BACKEND_DIR, name)
+    sys.path.insert(0, path)
+    try:
+        importlib.import_module("main")
+        return {module: sys.modules[module] for module in list(sys.modules)
+                if module.split(".")[0] in SERVICE_PACKAGES}
+    finally:
+        sys.path.remove(path)
+
+
+def load_services() -> Dict[str, Dict[str, object]]:
+    """Import the three services over the in-process transport; settings are read from the environment on import"""
+    os.environ.setdefault("TRANSPORT", "inprocess")
+    # The gateway reaches detection through its queue, not over HTTP
+    os.environ.setdefault("DETECTION_INGESTION_MODE", "queue")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    services = {name: load_service(name) for name in BACKENDS}
+    services["app"] = load_service("app")
+    return services
+
+
+def create_app(services: Dict[str, Dict[str, object]]) -> FastAPI:
+    """The gateway app, starting the detection and translation pipelines before its own and stopping them after"""
+    gateway = services["app"]["main"].app
+    backends = {prefix: services[name]["main"].app for name, prefix in BACKENDS.items()}
+    gateway_lifespan = gateway.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with AsyncExitStack() as stack:
+            for backend in backends.values():
+                await stack.enter_async_context(backend.router.lifespan_context(backend))
+            await stack.enter_async_context(gateway_lifespan(app))
+            yield
+
+    gateway.router.lifespan_context = lifespan
+    for prefix, backend in backends.items():
+        gateway.mount(prefix, backend)
+    return gateway
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(load_services()), host="0.0.0.0", port=8000)
@@ -0,0 +1,35 @@
+"""
+The services share top-level package names (core, services, utils, ...), so each one is
+imported through monolith.load_service, which gives it a private copy of its packages.
+Tests reach a service's modules by name through its fixture, e.g. gateway["services.amqp"].
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read from the environment when a service is imported: no broker, no API, no files
+os.environ.setdefault("TRANSPORT", "inprocess")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TRANSLATION_CACHE_DB_PATH", "")
+
+import monolith  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def gateway():
+    return monolith.load_service("app")
+
+
+@pytest.fixture(scope="session")
+def translation():
+    return monolith.load_service("translation")
+
+
+@pytest.fixture(scope="session")
+def detection():
+    return monolith.load_service("language_detection")
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+
+@pytest.fixture
+def admission(gateway, monkeypatch):
+    """A fresh AdmissionController with small limits; returns its module"""
+    module = gateway["services.admission"]
+    for name, value in {
+        "ADMISSION_CONNECTION_RATE": 1.0, "ADMISSION_CONNECTION_BURST": 2,
+        "ADMISSION_ROOM_RATE": 1.0, "ADMISSION_ROOM_BURST": 3,
+        "ADMISSION_SOCKET_MAX_IN_FLIGHT": 2, "ADMISSION_MAX_IN_FLIGHT": 10,
+        "ADMISSION_MAX_QUEUE_DEPTH": 100, "ADMISSION_MAX_WAIT": 5.0,
+        "ADMISSION_WINDOW": 10.0, "ADMISSION_MIN_SAMPLES": 5, "ADMISSION_SAMPLE_INTERVAL": 0.01,
+    }.items():
+        monkeypatch.setattr(module.settings, name, value)
+    return module
+
+
+async def done():
+    return "done"
+
+
+def test_a_socket_bucket_rejects_once_its_burst_is_spent(admission, monkeypatch):
+    monkeypatch.setattr(admission.settings, "ADMISSION_SOCKET_MAX_IN_FLIGHT", 0)
+    controller = admission.AdmissionController()
+    socket = controller.connect()
+    assert controller.admit("room", socket) is None
+    assert controller.admit("room", socket) is None
+    busy = controller.admit("room", socket)
+    assert busy["type"] == "busy" and busy["reason"] == "connection_rate"
+    assert 0 < busy["retry_after"] <= 1.0
+
+
+def test_a_room_bucket_is_shared_by_its_sockets(admission):
+    controller = admission.AdmissionController()
+    assert [controller.admit("room", controller.connect()) for _ in range(3)] == [None, None, None]
+    assert controller.admit("room", controller.connect())["reason"] == "room_rate"
+    assert controller.admit("other room", controller.connect()) is None
+
+
+@pytest.mark.asyncio
+async def test_in_flight_slots_are_released_when_the_request_finishes(admission):
+    controller = admission.AdmissionController()
+    socket = controller.connect()
+    assert controller.admit("room", socket) is None
+    assert controller.admit("room", socket) is None
+    assert controller.admit("room", socket)["reason"] == "socket_in_flight"
+    assert (socket.in_flight, controller.in_flight) == (2, 2)
+
+    assert await controller.track(socket, done()) == "done"
+    assert (socket.in_flight, controller.in_flight) == (1, 1)
+    assert len(controller.finished) == 1
+
+
+@pytest.mark.asyncio
+async def test_a_failed_request_releases_its_slot_too(admission):
+    controller = admission.AdmissionController()
+    socket = controller.connect()
+    controller.admit("room", socket)
+
+    async def fail():
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        await controller.track(socket, fail())
+    assert (socket.in_flight, controller.in_flight) == (0, 0)
+
+
+def test_the_global_in_flight_cap_sheds_load(admission):
+    controller = admission.AdmissionController()
+    controller.in_flight = 10
+    assert controller.admit("room", controller.connect())["reason"] == "in_flight"
+
+
+def test_slow_requests_and_a_long_expected_wait_shed_load(admission):
+    controller = admission.AdmissionController()
+    now = time.monotonic()
+    # Six requests finished over the last 5s (about 1.2 per second), each taking 8s
+    controller.finished.extend((now - 5 + position, 8.0) for position in range(6))
+    controller.update_latency()
+    assert controller.latency == 8.0
+
+    controller.in_flight = 4  # about 3s of expected wait: still admitted
+    assert controller.admit("room", controller.connect()) is None
+    controller.in_flight = 9
+    busy = controller.admit("room", controller.connect())
+    assert busy["reason"] == "expected_wait" and busy["retry_after"] > 0
+
+
+def test_too_few_samples_do_not_shed(admission):
+    controller = admission.AdmissionController()
+    now = time.monotonic()
+    controller.finished.extend((now, 60.0) for _ in range(4))
+    controller.update_latency()
+    assert controller.throughput is None and controller.latency is None
+    controller.in_flight = 9
+    assert controller.admit("room", controller.connect()) is None
+
+
+@pytest.mark.asyncio
+async def test_deep_queues_shed_load_until_they_drain(admission, monkeypatch):
+    depth = {"value": 60}
+
+    class Amqp:
+        async def queue_depth(self, queue):
+            return depth["value"]
+
+    monkeypatch.setattr(admission, "amqp_client", Amqp())
+    controller = admission.AdmissionController()
+    controller.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert controller.queue_depth == 180
+        assert controller.admit("room", controller.connect())["reason"] == "queue_depth"
+
+        depth["value"] = 0
+        await asyncio.sleep(0.05)
+        assert controller.overload is None
+        assert controller.admit("room", controller.connect()) is None
+    finally:
+        await controller.stop()
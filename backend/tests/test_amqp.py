@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from common.inprocess import InProcessBroker
+from common.metrics import metrics
+from common.schema import STATUS, MessageCodec
+from common.transport import InProcessTransport
+
+QUEUE = "test_queue"
+
+
+@pytest.fixture
+def broker():
+    return InProcessBroker()
+
+
+@pytest.fixture
+def client(gateway, broker):
+    """An AsyncAmqpClient whose connect factory hands out connections to the in-process broker"""
+    return gateway["services.amqp"].AsyncAmqpClient(url="memory://", connect=InProcessTransport(broker).aio_connect)
+
+
+def publish(broker, *messages):
+    codec = MessageCodec()
+    for message in messages:
+        body, headers = codec.encode(STATUS, message)
+        broker.publish(QUEUE, body, headers)
+
+
+async def until(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+def counter(name: str, **labels) -> float:
+    series = metrics.snapshot()["counters"].get(name, [])
+    return sum(entry["value"] for entry in series if entry["labels"] == labels)
+
+
+@pytest.mark.asyncio
+async def test_deliveries_reach_the_handler_decoded(client, broker):
+    received = []
+
+    async def handler(message):
+        received.append(message)
+
+    await client.consume(QUEUE, STATUS, handler, prefetch_count=10)
+    publish(broker, {"id": "a", "message": "one"}, {"id": "b", "message": "two"})
+    await until(lambda: len(received) == 2)
+    assert received == [{"id": "a", "message": "one"}, {"id": "b", "message": "two"}]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_prefetch_bounds_messages_in_flight(client, broker):
+    release = asyncio.Event()
+    started, finished = [], []
+
+    async def handler(message):
+        started.append(message["id"])
+        await release.wait()
+        finished.append(message["id"])
+
+    await client.consume(QUEUE, STATUS, handler, prefetch_count=2)
+    queue, _ = client.consumers[0]
+    assert queue.channel.prefetch == 2
+    publish(broker, *({"id": str(i), "message": "m"} for i in range(5)))
+    await until(lambda: len(started) == 2)
+    await asyncio.sleep(0.05)
+    assert len(started) == 2
+    assert len(broker.queues[QUEUE]) == 3
+    release.set()
+    await until(lambda: len(finished) == 5)
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_failing_handler_rejects_the_message_without_requeue(client, broker):
+    handled = []
+
+    async def handler(message):
+        handled.append(message["id"])
+        if message["id"] == "bad":
+            raise RuntimeError("boom")
+
+    errors = counter("consumer_errors_total", queue=QUEUE)
+    await client.consume(QUEUE, STATUS, handler, prefetch_count=1)
+    publish(broker, {"id": "bad", "message": "m"}, {"id": "good", "message": "m"})
+    await until(lambda: handled == ["bad", "good"])
+    await asyncio.sleep(0.05)
+    # Counted, not redelivered, and the consumer keeps going
+    assert handled == ["bad", "good"]
+    assert counter("consumer_errors_total", queue=QUEUE) == errors + 1
+    assert not broker.queues[QUEUE]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_undecodable_message_is_dropped(client, broker):
+    handled = []
+
+    async def handler(message):
+        handled.append(message)
+
+    await client.consume(QUEUE, STATUS, handler, prefetch_count=1)
+    broker.publish(QUEUE, b"\xc1", {})
+    publish(broker, {"id": "ok", "message": "m"})
+    await until(lambda: len(handled) == 1)
+    assert handled[0]["id"] == "ok"
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_cancels_the_consumers(client, broker):
+    handled = []
+
+    async def handler(message):
+        handled.append(message)
+
+    await client.consume(QUEUE, STATUS, handler)
+    assert len(broker.consumers[QUEUE]) == 1
+    await client.close()
+    assert client.consumers == []
+    assert broker.consumers[QUEUE] == []
+    publish(broker, {"id": "late", "message": "m"})
+    await asyncio.sleep(0.05)
+    assert handled == []
+    assert len(broker.queues[QUEUE]) == 1
+
+
+@pytest.mark.asyncio
+async def test_publish_encodes_with_the_schema(client, broker):
+    await client.publish(QUEUE, STATUS, {"id": "x", "message": "hello", "unknown": 1})
+    body, headers = broker.queues[QUEUE][0]
+    assert MessageCodec().decode(STATUS, body, headers) == {"id": "x", "message": "hello"}
+    await client.close()
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def memory(translation):
+    """Build TranslationMemory instances, closing them after the test"""
+    created = []
+
+    def build(**options):
+        options = {"max_entries": 100, "max_bytes": 1 << 20, "ttl": 60.0, **options}
+        created.append(translation["utils.cache"].TranslationMemory(**options))
+        return created[-1]
+
+    yield build
+    for cache in created:
+        cache.close()
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return db.execute("SELECT model, text, translation FROM translation_memory ORDER BY text").fetchall()
+
+
+def test_spacing_within_a_line_is_folded(memory):
+    cache = memory()
+    cache.put("  Hello \t  world ", "en", "fr", "Bonjour le monde")
+    assert cache.get("Hello world", "en", "fr") == "Bonjour le monde"
+    # NFC and NFD spellings of é
+    cache.put("caf\u00e9", "fr", "en", "coffee")
+    assert cache.get("cafe\u0301", "fr", "en") == "coffee"
+
+
+@pytest.mark.parametrize("layout", ["Hello\nworld", "Hello\n\nworld", "Hello world\n"])
+def test_line_breaks_keep_their_own_entries(memory, layout):
+    cache = memory()
+    cache.put("Hello world", "en", "fr", "Bonjour le monde")
+    assert cache.get(layout, "en", "fr") is None
+    cache.put(layout, "en", "fr", layout.replace("Hello", "Bonjour"))
+    assert cache.get(layout, "en", "fr") == layout.replace("Hello", "Bonjour")
+    assert cache.get("Hello world", "en", "fr") == "Bonjour le monde"
+
+
+def test_entries_are_not_shared_across_models(memory, tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    first = memory(db_path=db_path, model="openai:gpt-4o-mini")
+    first.put("Hello", "en", "fr", "Bonjour")
+    first.close()
+    assert memory(db_path=db_path, model="local").get("Hello", "en", "fr") is None
+    assert memory(db_path=db_path, model="openai:gpt-4o-mini").get("Hello", "en", "fr") == "Bonjour"
+
+
+def test_disk_writes_are_batched_and_flushed_on_close(memory, tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    cache = memory(db_path=db_path, model="m", write_batch=3, write_interval=3600)
+    cache.put("a", "en", "fr", "A")
+    cache.put("b", "en", "fr", "B")
+    assert rows(db_path) == []
+    cache.put("c", "en", "fr", "C")
+    assert rows(db_path) == [("m", "a", "A"), ("m", "b", "B"), ("m", "c", "C")]
+    cache.put("d", "en", "fr", "D")
+    cache.close()
+    assert len(rows(db_path)) == 4
+    reopened = memory(db_path=db_path, model="m")
+    assert reopened.get("d", "en", "fr") == "D"
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_a_store_from_before_model_keys_is_dropped(memory, tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE translation_memory (source_lang TEXT, target_lang TEXT, text TEXT, translation TEXT, "
+                   "created_at REAL, PRIMARY KEY (source_lang, target_lang, text))")
+        db.execute("INSERT INTO translation_memory VALUES ('en', 'fr', 'Hello world', 'Bonjour', 1e12)")
+    cache = memory(db_path=db_path, model="m")
+    assert cache.get("Hello world", "en", "fr") is None
+    cache.put("Hello world", "en", "fr", "Bonjour le monde")
+    cache.flush()
+    assert rows(db_path) == [("m", "Hello world", "Bonjour le monde")]
+
+
+def test_least_recently_used_entries_are_evicted(memory):
+    cache = memory(max_entries=2)
+    cache.put("a", "en", "fr", "A")
+    cache.put("b", "en", "fr", "B")
+    cache.get("a", "en", "fr")
+    cache.put("c", "en", "fr", "C")
+    assert [cache.get(text, "en", "fr") for text in "abc"] == ["A", None, "C"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_not_served(memory):
+    cache = memory(ttl=-1)
+    cache.put("a", "en", "fr", "A")
+    assert cache.get("a", "en", "fr") is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from common.inprocess import InProcessBroker
+from common.schema import TRANSLATION_REQUEST, MessageCodec
+from common.transport import InProcessTransport
+
+
+class Chain:
+    def detect(self, text):
+        return {"source_lang": "fr", "confidence": 0.99, "tier": "langid"}
+
+
+def test_ingested_request_is_requeued_while_the_publisher_is_full(detection, monkeypatch):
+    module = detection["services.language_detection"]
+    settings = module.settings
+    broker = InProcessBroker()
+    transport = InProcessTransport(broker)
+    monkeypatch.setattr(module, "get_transport", lambda kind, url=None: transport)
+    monkeypatch.setattr(module, "detector_chain", Chain())
+    monkeypatch.setattr(settings, "PUBLISHER_RECONNECT_BACKOFF", 0.01)
+    service = module.LanguageDetectionService()
+    publish, refused = service.publisher.publish, []
+
+    def publish_unless_full(routing_key, body, headers=None, **options):
+        if routing_key == settings.DETECTION_QUEUE and len(refused) < 2:
+            refused.append(routing_key)
+            raise ConnectionError("Publisher outbox is full (10000 messages pending)")
+        return publish(routing_key, body, headers, **options)
+
+    service.publisher.publish = publish_unless_full
+    broker.publish(settings.INGESTION_QUEUE, *MessageCodec().encode(TRANSLATION_REQUEST, {"id": "1", "text": "Bonjour"}))
+    consumer = threading.Thread(target=service.consume, daemon=True)
+    consumer.start()
+    deadline = time.monotonic() + 3
+    while not broker.queues.get(settings.DETECTION_QUEUE):
+        assert time.monotonic() < deadline, "request was never forwarded"
+        time.sleep(0.01)
+    service.stop_event.set()
+    consumer.join(timeout=3)
+
+    # Redelivered until the publisher had room: forwarded once, no error result, nothing left behind
+    assert len(refused) == 2
+    body, headers = broker.queues[settings.DETECTION_QUEUE][0]
+    assert MessageCodec().decode(TRANSLATION_REQUEST, body, headers) == {"id": "1", "text": "Bonjour", "source_lang": "fr"}
+    assert len(broker.queues[settings.DETECTION_QUEUE]) == 1
+    assert not broker.queues.get(settings.TRANSLATION_QUEUE)
+    assert not broker.queues[settings.INGESTION_QUEUE]
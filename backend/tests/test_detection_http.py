@@ -0,0 +1,47 @@
+import httpx
+import pytest
+
+URL = "http://detection/detect-language"
+
+
+async def post(gateway, outcomes):
+    """POST through a fresh UtilityService whose transport plays `outcomes` in order; returns (response or error, calls)"""
+    calls = []
+
+    def handle(request):
+        calls.append(request)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={})
+
+    service = gateway["utils.utils"].UtilityService()
+    service.open_http_client(transport=httpx.MockTransport(handle))
+    try:
+        return await service.post_with_retry(URL, {"id": "1", "text": "hola"}), len(calls)
+    except httpx.HTTPError as e:
+        return e, len(calls)
+    finally:
+        await service.close_http_client()
+
+
+@pytest.mark.asyncio
+async def test_connect_errors_are_retried(gateway):
+    response, calls = await post(gateway, [httpx.ConnectError("refused"), httpx.ConnectTimeout("slow"), 200])
+    assert response.status_code == 200
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_read_timeout_is_not_retried(gateway):
+    # The service may already have published the request onward
+    error, calls = await post(gateway, [httpx.ReadTimeout("slow"), 200])
+    assert isinstance(error, httpx.ReadTimeout)
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_server_error_is_not_retried(gateway):
+    response, calls = await post(gateway, [503, 200])
+    assert response.status_code == 503
+    assert calls == 1
@@ -0,0 +1,70 @@
+import pytest
+
+
+class Tier:
+    """A detection tier answering `lang` at `confidence`, or raising `error`"""
+
+    def __init__(self, lang="en", confidence=1.0, error=None):
+        self.lang = lang
+        self.confidence = confidence
+        self.error = error
+        self.calls = 0
+
+    def classify(self, text):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.lang, self.confidence
+
+
+@pytest.fixture
+def chain(detection, monkeypatch):
+    """Build a DetectorChain over the given tiers, in order, at a 0.9 threshold"""
+    module = detection["utils.detectors"]
+
+    def build(*tiers):
+        detectors = {f"tier{position}": (lambda tier=tier: tier) for position, tier in enumerate(tiers)}
+        monkeypatch.setattr(module, "DETECTORS", detectors)
+        return module.DetectorChain(list(detectors), threshold=0.9)
+
+    return build
+
+
+def test_a_confident_first_tier_answers_alone(chain):
+    local, remote = Tier("es", 0.95), Tier("en")
+    assert chain(local, remote).detect("hola") == {"source_lang": "es", "confidence": 0.95, "tier": "tier0"}
+    assert remote.calls == 0
+
+
+def test_a_guess_below_the_threshold_escalates(chain):
+    local, remote = Tier("pt", 0.5), Tier("es", 1.0)
+    assert chain(local, remote).detect("hola")["tier"] == "tier1"
+    assert local.calls == remote.calls == 1
+
+
+def test_the_last_tier_answers_whatever_its_confidence(chain):
+    result = chain(Tier("pt", 0.5), Tier("es", 0.2)).detect("hola")
+    assert result == {"source_lang": "es", "confidence": 0.2, "tier": "tier1"}
+
+
+def test_a_failed_last_tier_falls_back_to_the_best_earlier_guess(chain):
+    result = chain(Tier("pt", 0.4), Tier("es", 0.6), Tier(error=ConnectionError("down"))).detect("hola")
+    assert result == {"source_lang": "es", "confidence": 0.6, "tier": "tier1"}
+
+
+def test_a_failed_middle_tier_is_skipped(chain):
+    result = chain(Tier("pt", 0.4), Tier(error=ConnectionError("down")), Tier("es", 1.0)).detect("hola")
+    assert result["tier"] == "tier2"
+
+
+def test_without_any_guess_the_last_tiers_error_is_raised(chain):
+    with pytest.raises(ConnectionError):
+        chain(Tier(error=ValueError("bad input")), Tier(error=ConnectionError("down"))).detect("hola")
+
+
+def test_unknown_and_missing_tiers_are_rejected(detection):
+    DetectorChain = detection["utils.detectors"].DetectorChain
+    with pytest.raises(ValueError, match="Unknown detection tier"):
+        DetectorChain(["langid", "fasttext"], threshold=0.9)
+    with pytest.raises(ValueError, match="At least one"):
+        DetectorChain([], threshold=0.9)
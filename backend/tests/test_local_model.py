@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+BUDGET = 250
+
+
+@pytest.fixture
+def cache(translation, tmp_path):
+    """A cache over models in tmp_path whose load() is stubbed: no torch, sizes chosen by the test"""
+    module = translation["utils.local_model"]
+    cache = module.LocalModelCache(str(tmp_path / "opus-mt-{src}-{tgt}"), BUDGET)
+    cache.loaded_sizes = {}
+    cache.loads = []
+
+    def load(path, multilingual):
+        cache.loads.append(path)
+        return module.LocalModel(path, None, None, cache.loaded_sizes[path], multilingual)
+
+    cache.load = load
+    return cache
+
+
+def install(cache, src, tgt, on_disk: int, loaded: int = None):
+    """Put a model for src-tgt on disk with `on_disk` bytes of weights, taking `loaded` bytes once loaded"""
+    path = cache.path(src, tgt)
+    os.makedirs(path)
+    with open(os.path.join(path, "model.safetensors"), "wb") as weights:
+        weights.truncate(on_disk)
+    with open(os.path.join(path, "config.json"), "w") as config:
+        config.write("{}" * 1000)
+    cache.loaded_sizes[path] = on_disk if loaded is None else loaded
+    return path
+
+
+def test_hits_are_served_from_memory_and_the_least_recently_used_is_evicted(cache):
+    ab, ac, ad = install(cache, "a", "b", 100), install(cache, "a", "c", 100), install(cache, "a", "d", 100)
+    cache.get("a", "b")
+    cache.get("a", "c")
+    assert cache.get("a", "b").path == ab
+    cache.get("a", "d")
+    assert list(cache.models) == [ab, ad]
+    assert cache.size_bytes == 200
+    assert cache.loads == [ab, ac, ad]
+
+
+def test_models_are_evicted_until_the_new_one_fits(cache):
+    paths = [install(cache, "a", tgt, 100) for tgt in "bc"] + [install(cache, "a", "d", 200)]
+    for tgt in "bcd":
+        cache.get("a", tgt)
+    assert list(cache.models) == [paths[2]]
+    assert cache.size_bytes == 200
+
+
+def test_missing_pair_raises_without_loading(cache):
+    with pytest.raises(FileNotFoundError):
+        cache.get("a", "z")
+    assert cache.loads == []
+
+
+def test_oversized_model_raises_and_keeps_the_loaded_ones(cache):
+    ab = install(cache, "a", "b", 100)
+    install(cache, "a", "c", BUDGET + 1)
+    cache.get("a", "b")
+    with pytest.raises(MemoryError):
+        cache.get("a", "c")
+    assert list(cache.models) == [ab]
+    assert cache.loads == [ab]
+
+
+def test_models_are_evicted_again_when_the_loaded_size_exceeds_the_estimate(cache):
+    install(cache, "a", "b", 100)
+    ac = install(cache, "a", "c", 100)
+    ad = install(cache, "a", "d", 10, loaded=150)
+    cache.get("a", "b")
+    cache.get("a", "c")
+    # The 10 byte estimate fits next to both; the 150 bytes it really takes push out the least recently used
+    cache.get("a", "d")
+    assert list(cache.models) == [ac, ad]
+    assert cache.size_bytes == 250
+
+
+def test_the_model_just_loaded_is_kept_even_above_the_budget(cache):
+    install(cache, "a", "b", 100)
+    ac = install(cache, "a", "c", 10, loaded=BUDGET + 50)
+    cache.get("a", "b")
+    assert cache.get("a", "c").path == ac
+    assert list(cache.models) == [ac]
+    assert cache.size_bytes == BUDGET + 50
@@ -0,0 +1,95 @@
+import itertools
+import threading
+from types import SimpleNamespace
+
+import pika.spec
+import pytest
+
+from common.publisher import ChannelState, Publisher
+
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append(body)
+
+
+class InlineLoop:
+    """Stands in for the I/O thread's ioloop: callbacks run at once, on the calling thread"""
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def stop(self):
+        pass
+
+
+def connected(channels: int = 4, **options) -> Publisher:
+    """A Publisher whose pool of fake channels is open, without a broker or an I/O thread"""
+    publisher = Publisher("amqp://unused", channels=channels, **options)
+    publisher.thread = threading.current_thread()
+    publisher.connection = SimpleNamespace(ioloop=InlineLoop())
+    publisher.states = [ChannelState(FakeChannel()) for _ in range(channels)]
+    publisher.round_robin = itertools.cycle(publisher.states)
+    publisher.ready.set()
+    return publisher
+
+
+def confirm(publisher: Publisher, state: ChannelState, tag: int, ack: bool = True, multiple: bool = False):
+    method = pika.spec.Basic.Ack if ack else pika.spec.Basic.Nack
+    publisher._on_confirm(state, SimpleNamespace(method=method(delivery_tag=tag, multiple=multiple)))
+
+
+def test_messages_sharing_a_key_stay_on_one_channel_in_order():
+    publisher = connected()
+    for seq in range(10):
+        for request_id in "abcdef":
+            publisher.publish("q", f"{request_id}{seq}".encode(), ordering_key=request_id)
+    for request_id in "abcdef":
+        channels = [state.channel for state in publisher.states
+                    if any(body.startswith(request_id.encode()) for body in state.channel.published)]
+        assert len(channels) == 1
+        assert [body for body in channels[0].published if body.startswith(request_id.encode())] == \
+            [f"{request_id}{seq}".encode() for seq in range(10)]
+
+
+def test_messages_without_a_key_are_spread_over_the_pool():
+    publisher = connected()
+    for position in range(8):
+        publisher.publish("q", str(position).encode())
+    assert [len(state.channel.published) for state in publisher.states] == [2, 2, 2, 2]
+
+
+def test_confirms_resolve_the_futures_in_batches():
+    publisher = connected(channels=1)
+    futures = [publisher.publish("q", b"m", ordering_key="a") for _ in range(3)]
+    state = publisher.states[0]
+    confirm(publisher, state, 2, multiple=True)
+    assert [future.done() for future in futures] == [True, True, False]
+    confirm(publisher, state, 3, ack=False)
+    assert isinstance(futures[2].exception(), ConnectionError)
+    assert publisher.pending == 0
+
+
+def test_full_outbox_raises_until_a_confirm_makes_room():
+    publisher = connected(channels=1, max_pending=2, publish_timeout=0.01)
+    publisher.publish("q", b"1")
+    publisher.publish("q", b"2")
+    with pytest.raises(ConnectionError):
+        publisher.publish("q", b"3")
+    confirm(publisher, publisher.states[0], 1)
+    publisher.publish("q", b"3")
+    assert publisher.pending == 2
+
+
+def test_unconfirmed_messages_go_back_to_the_front_of_the_outbox_in_order():
+    publisher = connected(channels=1)
+    for body in (b"1", b"2", b"3"):
+        publisher.publish("q", body, ordering_key="a")
+    confirm(publisher, publisher.states[0], 1)
+    publisher.ready.clear()
+    publisher.publish("q", b"4", ordering_key="a")
+    publisher._on_connection_closed(publisher.connection, "broker restarted")
+    assert [message["body"] for message in publisher.outbox] == [b"2", b"3", b"4"]
@@ -0,0 +1,95 @@
+import json
+
+import httpx
+import pytest
+
+from common.inprocess import InProcessBroker
+from common.schema import TRANSLATION_REQUEST, MessageCodec
+from common.transport import InProcessTransport
+
+
+@pytest.fixture
+def service(gateway):
+    return gateway["utils.utils"].UtilityService()
+
+
+def test_supported_client_hint_is_trusted(service):
+    assert service.resolve_language({"text": "hello", "source_lang": " EN "}) == {"source_lang": "en", "detected_by": "client"}
+
+
+@pytest.mark.parametrize("hint", ["xx", "english", "en; DROP", 42])
+def test_unsupported_client_hint_falls_back_to_detection(service, hint):
+    assert service.resolve_language({"text": "hello", "source_lang": hint}) is None
+
+
+def test_unsupported_client_hint_still_uses_the_script(service):
+    assert service.resolve_language({"text": "こんにちは", "source_lang": "xx"}) == {"source_lang": "ja", "detected_by": "script"}
+
+
+@pytest.fixture
+def detector(detection, monkeypatch):
+    """Stub the detection service's detector chain, recording the texts it is asked about"""
+    module = detection["services.language_detection"]
+    texts = []
+
+    class Chain:
+        def detect(self, text):
+            texts.append(text)
+            return {"source_lang": "fr", "confidence": 0.99, "tier": "langid"}
+
+    monkeypatch.setattr(module, "detector_chain", Chain())
+    return module.language_detection, texts
+
+
+REQUEST = {"id": "1", "text": "Bonjour tout le monde", "source_lang": "english", "target_lang": "en"}
+
+
+@pytest.mark.asyncio
+async def test_rejected_hint_is_not_queued_for_detection(gateway, service, detector, monkeypatch):
+    module = gateway["utils.utils"]
+    broker = InProcessBroker()
+    monkeypatch.setattr(module, "amqp_client", gateway["services.amqp"].AsyncAmqpClient(
+        url="memory://", connect=InProcessTransport(broker).aio_connect))
+    monkeypatch.setattr(module.settings, "DETECTION_INGESTION_MODE", "queue")
+    response = await service.start_langauge_detection(dict(REQUEST))
+    assert response["status"] == "success"
+    body, headers = broker.queues[module.settings.INGESTION_QUEUE][0]
+    ingested = MessageCodec().decode(TRANSLATION_REQUEST, body, headers)
+    assert "source_lang" not in ingested
+
+    language_detection, texts = detector
+    result, _ = language_detection.run(ingested, headers)
+    assert (result["source_lang"], result["detected_by"]) == ("fr", "langid")
+    assert texts == [REQUEST["text"]]
+    await module.amqp_client.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_hint_is_not_posted_for_detection(gateway, service, detector, monkeypatch):
+    module = gateway["utils.utils"]
+    language_detection, texts = detector
+    payloads = []
+
+    def handle(request):
+        payloads.append(json.loads(request.content))
+        result, _ = language_detection.run(dict(payloads[-1]))
+        return httpx.Response(200, json=result)
+
+    monkeypatch.setattr(module.settings, "DETECTION_INGESTION_MODE", "http")
+    service.open_http_client(transport=httpx.MockTransport(handle))
+    try:
+        response = await service.start_langauge_detection(dict(REQUEST))
+    finally:
+        await service.close_http_client()
+    assert "source_lang" not in payloads[0]
+    assert (response["data"]["source_lang"], response["data"]["detected_by"]) == ("fr", "langid")
+    assert texts == [REQUEST["text"]]
+
+
+def test_detection_rechecks_the_client_hint(detector):
+    language_detection, texts = detector
+    result, _ = language_detection.run(dict(REQUEST))
+    assert (result["source_lang"], result["detected_by"]) == ("fr", "langid")
+    result, _ = language_detection.run({**REQUEST, "source_lang": "ES"})
+    assert (result["source_lang"], result["detected_by"]) == ("es", "client")
+    assert texts == [REQUEST["text"]]
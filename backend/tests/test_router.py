@@ -0,0 +1,74 @@
+import pytest
+
+
+class Remote:
+    """A backend implementing every call, answering with its name"""
+
+    def __init__(self, name="remote", fail_stream_after=None):
+        self.name = name
+        self.fail_stream_after = fail_stream_after
+        self.calls = []
+
+    def translate(self, source_lang, target_lang, text, cancelled=None):
+        self.calls.append("translate")
+        return f"{self.name}:{text}"
+
+    def translate_stream(self, source_lang, target_lang, text):
+        self.calls.append("translate_stream")
+        for position, word in enumerate(text.split()):
+            if position == self.fail_stream_after:
+                raise ConnectionError("stream dropped")
+            yield word
+
+    def detect_and_translate(self, target_lang, text, cancelled=None):
+        self.calls.append("detect_and_translate")
+        return "es", f"{self.name}:{text}"
+
+
+@pytest.fixture
+def local(translation, tmp_path, monkeypatch):
+    """The real local backend, with no model on disk for any pair"""
+    module = translation["utils.local_model"]
+    monkeypatch.setattr(module, "local_models", module.LocalModelCache(str(tmp_path / "opus-mt-{src}-{tgt}"), 1 << 20))
+    return module.LocalSeq2SeqBackend()
+
+
+@pytest.fixture
+def router(translation):
+    return translation["utils.router"].ModelRouter
+
+
+def test_calls_skip_backends_without_the_capability(router, local):
+    remote = Remote()
+    assert router([local, remote]).detect_and_translate(target_lang="en", text="hola") == ("es", "remote:hola")
+    assert remote.calls == ["detect_and_translate"]
+
+
+def test_a_call_no_backend_implements_fails_clearly(router, local):
+    with pytest.raises(NotImplementedError, match="detect_and_translate"):
+        router([local]).detect_and_translate(target_lang="en", text="hola")
+
+
+def test_failed_primary_is_retried_on_the_secondary(router, local):
+    assert router([local, Remote()]).translate(source_lang="xx", target_lang="yy", text="hola") == "remote:hola"
+
+
+def test_stream_moves_to_the_next_backend_when_the_primary_fails_before_its_first_chunk(router, local):
+    remote = Remote()
+    assert list(router([local, remote]).translate_stream(source_lang="xx", target_lang="yy", text="hola mundo")) == \
+        ["hola", "mundo"]
+    assert remote.calls == ["translate_stream"]
+
+
+def test_stream_failure_after_the_first_chunk_is_raised(router):
+    secondary = Remote("secondary")
+    stream = router([Remote(fail_stream_after=1), secondary]).translate_stream(source_lang="es", target_lang="en", text="hola mundo")
+    assert next(stream) == "hola"
+    with pytest.raises(ConnectionError):
+        next(stream)
+    assert secondary.calls == []
+
+
+def test_stream_failure_of_the_last_backend_is_raised(router, local):
+    with pytest.raises(FileNotFoundError):
+        list(router([local]).translate_stream(source_lang="xx", target_lang="yy", text="hola"))
@@ -0,0 +1,58 @@
+import json
+
+import msgpack
+import pytest
+
+from common.schema import (SCHEMA_VERSION, SCHEMA_VERSION_HEADER, STATUS, TRANSLATION_REQUEST,
+                           TRANSLATION_RESULT, MessageCodec, SchemaError)
+
+
+def legacy(message) -> bytes:
+    """A body as the baseline services published it: unversioned JSON"""
+    return json.dumps(message).encode()
+
+
+def test_baseline_request_is_upgraded():
+    # Published by the baseline detection service onto the detection queue
+    body = legacy({"text": "Hola", "target_lang": "en", "id": 1, "source_lang": "es"})
+    assert MessageCodec().decode(TRANSLATION_REQUEST, body) == {"id": "1", "text": "Hola", "source_lang": "es", "target_lang": "en"}
+
+
+def test_baseline_result_is_upgraded():
+    # Published by the baseline translation service onto the translation queue
+    body = legacy({"id": 1, "text": "Hola", "translation_text": "Hello", "source_lang": "es", "target_lang": "en"})
+    assert MessageCodec().decode(TRANSLATION_RESULT, body) == {
+        "id": "1", "text": "Hola", "translation_text": "Hello", "source_lang": "es", "target_lang": "en",
+    }
+
+
+def test_baseline_status_without_an_id_is_accepted():
+    assert MessageCodec().decode(STATUS, legacy({"type": "status", "message": "Translation Started."})) == {
+        "type": "status", "message": "Translation Started.",
+    }
+
+
+def test_legacy_field_names_are_renamed():
+    body = legacy({"id": "a", "text": "Hola", "source_language": "es", "target_language": "en"})
+    assert MessageCodec().decode(TRANSLATION_REQUEST, body) == {"id": "a", "text": "Hola", "source_lang": "es", "target_lang": "en"}
+
+
+def test_versioned_messages_are_not_upgraded():
+    body = msgpack.packb({"id": 1, "text": "Hola"})
+    with pytest.raises(SchemaError):
+        MessageCodec().decode(TRANSLATION_REQUEST, body, {SCHEMA_VERSION_HEADER: SCHEMA_VERSION})
+
+
+@pytest.mark.parametrize("encoding", ["msgpack", "json"])
+def test_round_trip_keeps_known_fields_only(encoding):
+    codec = MessageCodec(encoding)
+    body, headers = codec.encode(TRANSLATION_RESULT, {"id": "1", "seq": 2, "delta": "Hel", "unknown": True}, {"x-deadline": 5.0})
+    assert headers == {"x-deadline": 5.0, SCHEMA_VERSION_HEADER: SCHEMA_VERSION}
+    # Consumers accept either encoding whatever their own is
+    assert MessageCodec("json" if encoding == "msgpack" else "msgpack").decode(TRANSLATION_RESULT, body, headers) == \
+        {"id": "1", "seq": 2, "delta": "Hel"}
+
+
+def test_missing_required_field_is_rejected():
+    with pytest.raises(SchemaError):
+        MessageCodec().encode(TRANSLATION_REQUEST, {"id": "1"})
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.mark.asyncio
+async def test_status_events_only_reach_their_own_request(gateway):
+    service = gateway["services.status"].StatusService()
+    mine, theirs = asyncio.Queue(), asyncio.Queue()
+    service.subscribe("1", mine)
+    service.subscribe("2", theirs)
+
+    service.publish({"id": "1", "type": "status", "message": "Translation Started."})
+
+    assert mine.get_nowait()["id"] == "1"
+    assert theirs.empty()
+
+
+@pytest.mark.asyncio
+async def test_events_without_a_subscriber_are_not_kept(gateway):
+    service = gateway["services.status"].StatusService()
+    service.publish({"id": "1", "type": "status", "message": "Translation Started."})
+    assert service.subscribers == {}
+
+
+def test_status_stream_requires_a_request_id(gateway):
+    client = TestClient(gateway["main"].app)
+    assert client.get("/status/stream").status_code == 422
+
+
+def test_there_is_no_global_status_endpoint(gateway):
+    client = TestClient(gateway["main"].app)
+    assert client.get("/status").status_code == 404
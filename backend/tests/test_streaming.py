@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from common.schema import TRANSLATION_RESULT, MessageCodec
+
+
+def wire(message) -> dict:
+    """`message` as the gateway's consumer receives it: encoded by a producer, decoded against the result schema"""
+    codec = MessageCodec()
+    return codec.decode(TRANSLATION_RESULT, *codec.encode(TRANSLATION_RESULT, message))
+
+
+def chunk(seq, delta) -> dict:
+    return wire({"id": "1", "type": "translation_chunk", "seq": seq, "delta": delta})
+
+
+async def forward(gateway, *messages):
+    """Deliver `messages` to a streaming request and run forward_stream; returns (returned frame, frames sent on)"""
+    response_service = gateway["services.response"].response_service
+    frames = response_service.register("1", stream=True)
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    try:
+        for message in messages:
+            await response_service.on_message(message)
+        return await gateway["main"].forward_stream(send, frames), sent
+    finally:
+        response_service.discard("1")
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_forwarded_until_the_final_frame(gateway):
+    final = wire({"id": "1", "type": "translation", "seq": 2, "translation_text": "Hola", "final": True,
+                  "text": "Hello", "source_lang": "en", "target_lang": "es"})
+    returned, sent = await forward(gateway, chunk(0, "Hol"), chunk(1, "a"), final)
+    assert [(frame["seq"], frame["delta"]) for frame in sent] == [(0, "Hol"), (1, "a")]
+    assert returned["translation_text"] == "Hola"
+    assert returned["final"] is True
+
+
+@pytest.mark.asyncio
+async def test_a_failed_translation_closes_the_stream(gateway):
+    # publish_error marks a streamed failure final, numbered after the last chunk
+    failed = wire({"id": "1", "error": "Translation failed.", "type": "translation", "seq": 1, "final": True})
+    returned, sent = await forward(gateway, chunk(0, "Hol"), failed)
+    assert [frame["delta"] for frame in sent] == ["Hol"]
+    assert returned["error"] == "Translation failed."
+
+
+@pytest.mark.asyncio
+async def test_an_error_frame_ends_the_stream(gateway):
+    # The detection service answers a failed detection without marking it final
+    returned, sent = await forward(gateway, wire({"id": "1", "error": "Language detection failed."}))
+    assert returned == {"id": "1", "error": "Language detection failed."}
+    assert sent == []
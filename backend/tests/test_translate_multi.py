@@ -0,0 +1,22 @@
+import threading
+
+
+def test_languages_fan_out_on_the_shared_pool(translation, monkeypatch):
+    module = translation["services.translation"]
+    service = module.translation_service
+    threads = []
+
+    def translate_segmented(text, source_lang, target_lang):
+        threads.append(threading.current_thread().name)
+        return f"{text}-{target_lang}"
+
+    monkeypatch.setattr(module.settings, "TRANSLATION_CACHE_ENABLED", False)
+    monkeypatch.setattr(service, "translate_segmented", translate_segmented)
+    target_langs = ["de", "es", "fr", "it", "nl", "pt"]
+    assert len(target_langs) > module.settings.TRANSLATION_MULTI_TARGET_MAX
+    for _ in range(2):
+        translations = service.translate_multi({"text": "hi", "source_lang": "en", "target_langs": target_langs + ["en"]})
+        assert translations == {"en": "hi", **{lang: f"hi-{lang}" for lang in target_langs}}
+    # No pool per message: every language ran on the long-lived one
+    assert all(name.startswith("translation-multi") for name in threads)
+    assert len(set(threads)) <= module.settings.TRANSLATION_MULTI_TARGET_WORKERS
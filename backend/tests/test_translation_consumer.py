@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import Future
+import time
+
+from common.transport import InProcessTransport
+
+
+class FlakyTransport(InProcessTransport):
+    """In-process transport whose first `failures` consumer connections are refused"""
+
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def blocking_connection(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("broker down")
+        return super().blocking_connection()
+
+
+def test_service_builds_without_the_broker_and_consume_connects_later(translation, monkeypatch):
+    module = translation["services.translation"]
+    transport = FlakyTransport(failures=2)
+    monkeypatch.setattr(module, "get_transport", lambda kind, url=None: transport)
+    monkeypatch.setattr(module.settings, "TRANSLATION_WORKERS", 1)
+    monkeypatch.setattr(module.settings, "PUBLISHER_RECONNECT_BACKOFF", 0.01)
+
+    service = module.TranslationService()
+    assert transport.attempts == 0
+    assert service.connection is None
+
+    consumer = threading.Thread(target=service.consume, daemon=True)
+    consumer.start()
+    deadline = time.monotonic() + 2
+    while not transport.broker.consumers.get(module.settings.DETECTION_QUEUE):
+        assert time.monotonic() < deadline, "consumer never connected"
+        time.sleep(0.01)
+    assert transport.attempts == 3
+    service.stop_event.set()
+    consumer.join(timeout=3)
+    assert not consumer.is_alive()
+
+
+class Channel:
+    """Records how deliveries are settled; queued callbacks run at once"""
+
+    def __init__(self):
+        self.acked, self.nacked = [], []
+        self.connection = self
+
+    def add_callback_threadsafe(self, action):
+        action()
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.nacked.append((delivery_tag, requeue))
+
+
+class FullPublisher:
+    """Confirms every publish except the results of requests in `refused`, as if the outbox were full"""
+
+    def __init__(self, refused):
+        self.refused = refused
+
+    def publish(self, routing_key, body, headers=None, ordering_key=None, **options):
+        if ordering_key in self.refused and routing_key != "status_queue":
+            raise ConnectionError("Publisher outbox is full (10000 messages pending)")
+        confirmed = Future()
+        confirmed.set_result(True)
+        return confirmed
+
+
+def test_results_the_publisher_cannot_take_are_requeued(translation, monkeypatch):
+    service = translation["services.translation"].translation_service
+    monkeypatch.setattr(service, "publisher", FullPublisher({"full"}))
+    ch = Channel()
+    batch = [(1, {"id": "ok", "text": "a"}), (2, {"id": "full", "text": "b"}), (3, {"id": "ok2", "text": "c"})]
+    service.complete_batch(ch, batch, ["A", "B", "C"])
+    assert ch.acked == [1, 3]
+    assert ch.nacked == [(2, True)]
+
+
+def test_failure_results_the_publisher_cannot_take_are_requeued(translation, monkeypatch):
+    service = translation["services.translation"].translation_service
+    monkeypatch.setattr(service, "publisher", FullPublisher({"full"}))
+    ch = Channel()
+    service.complete_batch(ch, [(1, {"id": "ok", "text": "a"}), (2, {"id": "full", "text": "b"})], None)
+    assert ch.acked == [1]
+    assert ch.nacked == [(2, True)]
@@ -1,8 +1,13 @@
+import os
+import sys
+# Modules shared by the backend services live in backend/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import FastAPI
-# from models.request import Request
-# from models.response import Response
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from utils.utils import utility_service
+from utils.cache import translation_memory
+from common.metrics import metrics
 
 @asynccontextmanager
 async def lifespan(app : FastAPI):
@@ -18,6 +23,17 @@ app = FastAPI(title="Translation Service",lifespan=lifespan)
 def enter():
     return {"message": "Welcome to the Translation Service!"}
 
+@app.get("/cache/stats")
+def cache_stats():
+    return translation_memory.stats()
+
+@app.get("/metrics")
+def get_metrics(format: str = "json"):
+    """Latency histograms and counters; `?format=prometheus` for the text exposition format"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus())
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8082)
\ No newline at end of file
@@ -2,10 +2,20 @@ import logging
 # from transformers import pipeline
 import requests
 from utils.model import model
+from utils.local_model import local_models
+from utils.cache import translation_memory
+from utils.segmenter import segmenter
 from core.config import settings
 import pika
 import json
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
 from threading import Event
+from typing import Dict, List, Optional, Tuple
+from common.transport import get_transport
+from common.metrics import metrics
+from common import deadline
+from common.schema import MessageCodec, STATUS, TRANSLATION_REQUEST, TRANSLATION_RESULT
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,44 +24,56 @@ logger = logging.getLogger(__name__)
 class TranslationService:
     def __init__(self):
         self.stop_event = Event()
-        self.models = {}
-        self.request = {}
-        self.setup_rabbitmq()
+        # Pending micro-batches per (source_lang, target_lang): delivery tags with their messages
+        self.batches: Dict[Tuple[str, str], List[Tuple[int, Dict]]] = {}
+        self.batch_timers = {}
+        self.executor = None
+        # Separate pool for segments of long inputs, so a worker waiting on its segments never starves them
+        self.segment_executor = ThreadPoolExecutor(max_workers=settings.TRANSLATION_SEGMENT_WORKERS,
+                                                   thread_name_prefix="translation-segment")
+        # Languages of a multi-target message fan out here; their segments still go to segment_executor
+        self.multi_executor = ThreadPoolExecutor(max_workers=settings.TRANSLATION_MULTI_TARGET_WORKERS,
+                                                 thread_name_prefix="translation-multi")
+        self.transport = get_transport(settings.TRANSPORT, settings.RABBITMQ_URL)
+        self.codec = MessageCodec(settings.MESSAGE_ENCODING)
+        # Workers publish results themselves; the consumer connection only receives and acks
+        self.publisher = self.transport.publisher(
+            queues=[settings.TRANSLATION_QUEUE, settings.STATUS_QUEUE],
+            channels=settings.PUBLISHER_CHANNELS,
+            max_pending=settings.PUBLISHER_MAX_PENDING,
+            publish_timeout=settings.PUBLISHER_PUBLISH_TIMEOUT,
+            backoff=settings.PUBLISHER_RECONNECT_BACKOFF,
+            max_backoff=settings.PUBLISHER_RECONNECT_MAX_BACKOFF,
+        )
+        self.publisher.start()
+        # The consumer connection is opened by consume(), which retries it with backoff,
+        # so the service can be built while the broker is down
+        self.connection = None
+        self.channel = None
         logger.info("TranslationService initialized.")
     
     def setup_rabbitmq(self):
         """Setup RabbitMQ connection and channel"""
         try:
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(settings.RABBITMQ_URL)
-            )
+            self.connection = self.transport.blocking_connection()
             # Create Connection to Translation Queue
             self.channel = self.connection.channel()
             # self.channel.exchange_declare(exchange='translation_exchange', exchange_type='direct')
             # self.channel.queue_bind(exchange='translation_exchange', queue=settings.TRANSLATION_QUEUE)
-            self.channel.queue_declare(queue=settings.TRANSLATION_QUEUE)
+            self.channel.queue_declare(queue=settings.DETECTION_QUEUE)
             logger.info("RabbitMQ connection and channel setup completed.")
         except Exception as e:
             logger.error(f"Error setting up RabbitMQ: {e}")
             raise
 
     def get_model(self, source_lang: str = settings.DEFAULT_SOURCE_LANG, target_lang: str = settings.DEFAULT_TARGET_LANG):
-        """Get or create translation model for language pair"""
-        model_key = f"{source_lang}-{target_lang}"
-        logger.info(f"Fetching model for language pair: {model_key}")
-        if model_key not in self.models:
-            model_name = settings.HUGGINGFACE_MODEL_URL
-            model_name = settings.HUGGINGFACE_MODEL_URL.format(
-                src=source_lang,
-                tgt=target_lang
-            )
-            logger.info(f"Model not found in cache. Loading model for {model_key}: {model_name}")
-            self.models[model_key] = model_name
-            logger.info("After setting model key-value")
-        else:
-            logger.info(f"Model for {model_key} found in cache.")
-        
-        return self.models[model_key]
+        """
+        Get the local translation model for a language pair, loading it into the memory-budgeted cache on first use.
+        Raises FileNotFoundError when LOCAL_MODEL_PATH has no model for the pair, and MemoryError when its
+        weights alone exceed LOCAL_MODEL_MEMORY_BUDGET_MB.
+        """
+        logger.info(f"Fetching model for language pair: {source_lang}-{target_lang}")
+        return local_models.get(source_lang, target_lang)
     
     def translate(self, text: str, source_lang: str, target_lang: str) -> str:
         try:
@@ -75,8 +97,16 @@ class TranslationService:
                 logger.info("Source and target languages are the same. Returning original text.")
                 return text
 
+            if settings.TRANSLATION_CACHE_ENABLED:
+                cached = translation_memory.get(text, source_lang, target_lang)
+                if cached is not None:
+                    logger.info(f"Translation memory hit for {source_lang}-{target_lang}.")
+                    return cached
+
             logger.info(f"Translating text from {source_lang} to {target_lang} using OpenAI API.")
-            translation = model.translate(source_lang=source_lang, target_lang=target_lang, text=text)
+            translation = self.translate_segmented(text, source_lang, target_lang)
+            if settings.TRANSLATION_CACHE_ENABLED:
+                translation_memory.put(text, source_lang, target_lang, translation)
             
             
             
@@ -86,7 +116,7 @@ class TranslationService:
             
             # response_json = response.json()  # Parse the response
             # translation = response_json.get('choices', [{}])[0].get('text', '').strip()
-            logger.info(f"Translation completed: {translation}")
+            logger.debug(f"Translation completed: {translation}")
             return translation
         
         # except requests.exceptions.RequestException as e:
@@ -102,108 +132,443 @@ class TranslationService:
             logger.error(f"An error occurred during translation: {e}")
             raise
 
-    
-    def publish_translation(self):
+
+    def translate_segmented(self, text: str, source_lang: str, target_lang: str) -> str:
+        """
+        Translate long text as sentence/paragraph segments in parallel and reassemble them in order,
+        keeping the original whitespace between segments. Short text goes to the model whole.
+        """
+        if len(text) < settings.TRANSLATION_SEGMENT_MIN_CHARS:
+            return model.translate(source_lang=source_lang, target_lang=target_lang, text=text)
+        chunks = segmenter.segment(text, source_lang, settings.TRANSLATION_SEGMENT_MAX_CHARS)
+        if len(chunks) == 1:
+            return model.translate(source_lang=source_lang, target_lang=target_lang, text=text)
+
+        def translate_content(content: str) -> str:
+            translation = None
+            if settings.TRANSLATION_CACHE_ENABLED:
+                translation = translation_memory.get(content, source_lang, target_lang)
+            if translation is None:
+                translation = model.translate(source_lang=source_lang, target_lang=target_lang, text=content)
+                if settings.TRANSLATION_CACHE_ENABLED:
+                    translation_memory.put(content, source_lang, target_lang, translation)
+            return translation.strip()
+
+        pieces = [segmenter.strip_edges(chunk) for chunk in chunks]
+        # Repeated segments are translated once
+        contents = list(dict.fromkeys(content for _, content, _ in pieces if content))
+        logger.info(f"Translating {len(contents)} segments from {source_lang} to {target_lang} in parallel.")
+        translated = dict(zip(contents, self.segment_executor.map(translate_content, contents)))
+        return "".join(leading + translated.get(content, "") + trailing for leading, content, trailing in pieces)
+
+    def translate_batch(self, messages: List[Dict]) -> List[str]:
+        """Translate messages sharing one language pair, sending all cache misses to the model in a single call"""
+        if len(messages[0].get('target_langs') or []) > 1:
+            return [self.translate_multi(message) for message in messages]
+        source_lang = messages[0].get('source_lang')
+        target_lang = messages[0].get('target_lang')
+        if not source_lang:
+            return [self.detect_and_translate(message) for message in messages]
+        translations = [None] * len(messages)
+        misses = []
+        for position, message in enumerate(messages):
+            text = message.get('text')
+            if source_lang == target_lang:
+                translations[position] = text
+            elif settings.TRANSLATION_CACHE_ENABLED and \
+                    (cached := translation_memory.get(text, source_lang, target_lang)) is not None:
+                translations[position] = cached
+            else:
+                misses.append(position)
+        if not misses:
+            return translations
+
+        # Long inputs are segmented on their own rather than packed into the batch request
+        long_inputs = [position for position in misses
+                       if len(messages[position].get('text') or "") >= settings.TRANSLATION_SEGMENT_MIN_CHARS]
+        for position in long_inputs:
+            text = messages[position].get('text')
+            translations[position] = self.translate_segmented(text, source_lang, target_lang)
+            if settings.TRANSLATION_CACHE_ENABLED:
+                translation_memory.put(text, source_lang, target_lang, translations[position])
+        misses = [position for position in misses if position not in long_inputs]
+        if not misses:
+            return translations
+
+        texts = [messages[position].get('text') for position in misses]
+        try:
+            if len(texts) == 1:
+                results = [model.translate(source_lang=source_lang, target_lang=target_lang, text=texts[0])]
+            else:
+                logger.info(f"Translating batch of {len(texts)} messages from {source_lang} to {target_lang}.")
+                try:
+                    results = model.translate_batch(source_lang=source_lang, target_lang=target_lang, texts=texts)
+                except ValueError as e:
+                    logger.warning(f"{e}; translating the batch one message at a time.")
+                    results = [model.translate(source_lang=source_lang, target_lang=target_lang, text=text)
+                               for text in texts]
+        except Exception as e:
+            logger.error(f"An error occurred during batch translation: {e}")
+            raise
+
+        for position, text, translation in zip(misses, texts, results):
+            translations[position] = translation
+            if settings.TRANSLATION_CACHE_ENABLED:
+                translation_memory.put(text, source_lang, target_lang, translation)
+        return translations
+
+    def translate_multi(self, message: Dict) -> Dict[str, str]:
+        """
+        Translate one message into every language of its target_langs.
+        Up to TRANSLATION_MULTI_TARGET_MAX languages share one structured model call; larger lists,
+        long inputs or malformed replies are translated per language in parallel.
+        """
+        text = message.get('text')
+        target_langs = list(dict.fromkeys(message.get('target_langs')))
+        translations = {}
+        if not message.get('source_lang'):
+            message['target_lang'] = target_langs[0]
+            translations[target_langs[0]] = self.detect_and_translate(message)
+        source_lang = message.get('source_lang')
+
+        missing = []
+        for target_lang in target_langs:
+            if target_lang in translations:
+                continue
+            if target_lang == source_lang:
+                translations[target_lang] = text
+            elif settings.TRANSLATION_CACHE_ENABLED and \
+                    (cached := translation_memory.get(text, source_lang, target_lang)) is not None:
+                translations[target_lang] = cached
+            else:
+                missing.append(target_lang)
+        if not missing:
+            return translations
+
+        results = None
+        if 1 < len(missing) <= settings.TRANSLATION_MULTI_TARGET_MAX and len(text) < settings.TRANSLATION_SEGMENT_MIN_CHARS:
+            logger.info(f"Translating from {source_lang} into {missing} in one call.")
+            try:
+                results = model.translate_multi(source_lang=source_lang, target_langs=missing, text=text)
+            except ValueError as e:
+                logger.warning(f"{e}; translating one language at a time.")
+        if results is None:
+            results = dict(zip(missing, self.multi_executor.map(
+                lambda target_lang: self.translate_segmented(text, source_lang, target_lang), missing
+            )))
+        for target_lang, translation in results.items():
+            translations[target_lang] = translation
+            if settings.TRANSLATION_CACHE_ENABLED:
+                translation_memory.put(text, source_lang, target_lang, translation)
+        return translations
+
+    def detect_and_translate(self, message: Dict) -> str:
+        """Combined pipeline mode: one model call reports the source language and the translation"""
+        text = message.get('text')
+        target_lang = message.get('target_lang')
+        logger.info(f"Detecting language and translating to {target_lang} in one call.")
+        source_lang, translation = model.detect_and_translate(target_lang=target_lang, text=text)
+        message['source_lang'] = source_lang
+        message['detected_by'] = "translation"
+        if source_lang == target_lang:
+            return text
+        if settings.TRANSLATION_CACHE_ENABLED:
+            translation_memory.put(text, source_lang, target_lang, translation)
+        return translation
+
+    def enqueue_batch(self, ch, delivery_tag: int, message: Dict):
+        """Hold a message until its language pair has a full batch or the batch window closes"""
+        pair = (message.get('source_lang'), message.get('target_lang'))
+        batch = self.batches.setdefault(pair, [])
+        batch.append((delivery_tag, message))
+        if len(batch) >= settings.TRANSLATION_BATCH_MAX_SIZE:
+            self.flush_batch(ch, pair)
+        elif len(batch) == 1:
+            self.batch_timers[pair] = self.connection.call_later(
+                settings.TRANSLATION_BATCH_MAX_WAIT_MS / 1000, lambda: self.flush_batch(ch, pair)
+            )
+
+    def flush_batch(self, ch, pair: Tuple[str, str]):
+        """Send a pending batch off for translation"""
+        timer = self.batch_timers.pop(pair, None)
+        if timer is not None:
+            self.connection.remove_timeout(timer)
+        batch = self.batches.pop(pair, [])
+        if batch:
+            self.dispatch(ch, batch)
+
+    def dispatch(self, ch, batch: List[Tuple[int, Dict]]):
+        """Translate on the worker pool when there is one, inline on the connection thread otherwise"""
+        if self.executor is not None:
+            self.executor.submit(self.run_batch, ch, batch)
+        else:
+            self.run_batch(ch, batch)
+
+    def drop_expired(self, ch, batch: List[Tuple[int, Dict]]) -> List[Tuple[int, Dict]]:
+        """Ack the requests whose deadline has passed, untranslated, and return the rest"""
+        live = []
+        for delivery_tag, message in batch:
+            if deadline.expired(message.get('headers'), stage="translation"):
+                logger.info(f"Dropping expired translation request: {message.get('id')}")
+                self.settle(ch, delivery_tag)
+            else:
+                live.append((delivery_tag, message))
+        return live
+
+    def run_batch(self, ch, batch: List[Tuple[int, Dict]]):
+        """Translate with retries, then publish the results and ack once they are confirmed"""
+        # Checked on the worker, after any wait for a batch or a free worker
+        batch = self.drop_expired(ch, batch)
+        if not batch:
+            return
+        messages = [message for _, message in batch]
+        translations = None
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                translations = self.translate_batch(messages)
+                break
+            except Exception as e:
+                logger.error(f"Attempt {attempt + 1} failed: {e}")
+                if attempt + 1 == max_retries:
+                    logger.error("Max retries reached. Failing the batch.")
+                else:
+                    logger.info("Retrying translation...")
+        self.complete_batch(ch, batch, translations)
+
+    def run_stream(self, ch, delivery_tag: int, message: Dict):
+        """Translate with the model's streaming API, publishing each partial chunk as it arrives"""
+        if not self.drop_expired(ch, [(delivery_tag, message)]):
+            return
+        text = message.get('text')
+        source_lang = message.get('source_lang')
+        target_lang = message.get('target_lang')
+        seq = 0
+        translations = None
+        try:
+            if not source_lang:
+                # Combined mode needs the structured reply, so only the final frame is sent
+                translation = self.detect_and_translate(message)
+            elif source_lang == target_lang:
+                translation = text
+            elif settings.TRANSLATION_CACHE_ENABLED and \
+                    (cached := translation_memory.get(text, source_lang, target_lang)) is not None:
+                translation = cached
+            else:
+                parts = []
+                for delta in model.translate_stream(source_lang=source_lang, target_lang=target_lang, text=text):
+                    parts.append(delta)
+                    self.publish_chunk(message.get('id'), seq, delta, message.get('headers'))
+                    seq += 1
+                translation = "".join(parts)
+                if settings.TRANSLATION_CACHE_ENABLED:
+                    translation_memory.put(text, source_lang, target_lang, translation)
+            translations = [translation]
+        except Exception as e:
+            # Chunks may already be on their way, so a failed stream is not retried
+            logger.error(f"An error occurred during streamed translation: {e}")
+        message['seq'] = seq
+        self.complete_batch(ch, [(delivery_tag, message)], translations)
+
+    def settle(self, ch, delivery_tag: int, published: Optional[Future] = None):
+        """
+        Ack a delivery once the broker has confirmed its result, or requeue it if the result was lost.
+        Confirms arrive on the publisher thread and pika channels are not thread-safe,
+        so the ack itself is queued onto the consumer connection.
+        """
+        def on_confirm(future: Optional[Future] = None):
+            if future is not None and future.exception() is not None:
+                logger.error(f"Result of delivery {delivery_tag} was not confirmed; requeueing it.")
+                action = functools.partial(ch.basic_nack, delivery_tag=delivery_tag, requeue=True)
+            else:
+                action = functools.partial(ch.basic_ack, delivery_tag=delivery_tag)
+            try:
+                ch.connection.add_callback_threadsafe(action)
+            except Exception as e:
+                # The consumer connection is gone and the broker redelivers the message
+                logger.warning(f"Could not settle delivery {delivery_tag}: {e}")
+
+        if published is None:
+            on_confirm()
+        else:
+            published.add_done_callback(on_confirm)
+
+    def complete_batch(self, ch, batch: List[Tuple[int, Dict]], translations):
+        """
+        Publish each result and ack each delivery once its result is confirmed.
+        A result the publisher cannot take (its outbox is full or closed) requeues the delivery instead.
+        """
+        if translations is None:
+            metrics.inc("translations_total", len(batch), outcome="failed")
+        else:
+            metrics.inc("translations_total", len(batch), outcome="translated")
+        for position, (delivery_tag, message) in enumerate(batch):
+            published = None
+            try:
+                if translations is None:
+                    self.publish_status({"type": "status", "message": "Translation Failed.", "id": message.get('id')}, message.get('headers'))
+                    published = self.publish_error(message)
+                    continue
+                translated_text = translations[position]
+                if message.get('detected_by') == "translation":
+                    self.publish_status({"type": "status", "message": "Language detection completed.", "id": message.get('id')}, message.get('headers'))
+                if isinstance(translated_text, dict):
+                    message['translations'] = translated_text
+                    translated_text = translated_text.get(message.get('target_lang'))
+                message['translation_text'] = translated_text
+                published = self.produce(message)
+            except ConnectionError as e:
+                logger.warning(f"Could not publish the result of delivery {delivery_tag}; requeueing it: {e}")
+                published = Future()
+                published.set_exception(e)
+            except Exception as e:
+                logger.error(f"Error processing batch: {e}")
+            finally:
+                self.settle(ch, delivery_tag, published)
+        if translations is not None:
+            logger.info(f"Published {len(batch)} translations.")
+
+    def publish(self, queue: str, schema, message: Dict, headers: Optional[Dict] = None) -> Future:
+        """Encode `message` with the shared schema and hand it to the publisher, keeping a request's messages in order"""
+        body, headers = self.codec.encode(schema, message, headers)
+        request_id = message.get('id')
+        return self.publisher.publish(queue, body, headers, content_type=self.codec.content_type,
+                                      ordering_key=str(request_id) if request_id is not None else None)
+
+    def publish_chunk(self, request_id, seq: int, delta: str, headers: Optional[Dict] = None):
+        """Publish one partial translation of a streamed request"""
+        try:
+            self.publish(
+                settings.TRANSLATION_QUEUE, TRANSLATION_RESULT,
+                {"id": request_id, "type": "translation_chunk", "seq": seq, "delta": delta}, headers
+            )
+        except Exception as e:
+            logger.error(f"Error publishing translation chunk: {e}")
+
+    def publish_translation(self, request: Dict) -> Future:
         """Queue translation request in RabbitMQ"""
         message = {
-            "id": self.request.get('id'),
-            "text": self.request.get('text'),
-            "translation_text": self.request.get('translation_text'),
-            "source_lang": self.request.get('source_lang'),
-            "target_lang": self.request.get('target_lang'),
+            "id": request.get('id'),
+            "text": request.get('text'),
+            "translation_text": request.get('translation_text'),
+            "source_lang": request.get('source_lang'),
+            "target_lang": request.get('target_lang'),
         }
+        if request.get('translations'):
+            message["translations"] = request.get('translations')
+        if request.get('detected_by'):
+            message["detected_by"] = request.get('detected_by')
+        if request.get('stream'):
+            # Closes the stream: the full text, numbered after the last chunk
+            message.update({"type": "translation", "seq": request.get('seq'), "final": True})
         try:
-            try:
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key=settings.TRANSLATION_QUEUE,
-                    body=json.dumps(message)
-                )
-                logger.info("Translation request published to RabbitMQ.")
-            except pika.exceptions.ChannelClosed as e:
-                logger.error(f"Channel is closed: {e}. Re-establishing connection...")
-                self.setup_rabbitmq()  # Re-establish connection
-                self.publish_translation()  # Retry publishing
+            published = self.publish(settings.TRANSLATION_QUEUE, TRANSLATION_RESULT, message, request.get('headers'))
+            logger.info("Translation request published to RabbitMQ.")
+            return published
         except Exception as e:
             logger.error(f"Error publishing translation request: {e}")
             raise
     
-    def publish_status(self, status):
-        logger.info("Publishing status to RabbitMQ...")
+    def publish_error(self, request: Dict) -> Future:
+        """Answer a request that could not be translated, so its socket is not left waiting for a result"""
+        message = {"id": request.get('id'), "error": "Translation failed."}
+        if request.get('stream'):
+            # Closes the stream like a translation would, numbered after the last chunk
+            message.update({"type": "translation", "seq": request.get('seq'), "final": True})
         try:
-            logger.info(f"Request to Detection Queue: {status}")
+            return self.publish(settings.TRANSLATION_QUEUE, TRANSLATION_RESULT, message, request.get('headers'))
+        except Exception as e:
+            logger.error(f"Error publishing translation failure: {e}")
+            raise
 
-            self.channel.basic_publish(
-                    exchange='',
-                    routing_key=settings.STATUS_QUEUE,
-                    body=json.dumps(status)
-            )
-            logger.info("Message published to Status Queue.")
-        except pika.exceptions.ChannelClosed as e:
-            logger.error(f"Channel is closed: {e}. Re-establishing connection...")
-            self.setup_rabbitmq()  # Re-establish connection
-            self.publish_status(status)  # Retry publishing
+    def publish_status(self, status, headers: Optional[Dict] = None):
+        """Publish a progress event; best effort, a status that cannot be published is only logged"""
+        logger.info("Publishing status to RabbitMQ...")
+        try:
+            logger.debug(f"Request to Status Queue: {status}")
+            return self.publish(settings.STATUS_QUEUE, STATUS, status, headers)
         except Exception as e:
             logger.error(f"Failed to publish message to RabbitMQ: {e}")
 
 
-    def produce(self):
-        try:
-            logger.info("Producing translation request.")
-            self.publish_status({"type": "status", "message": "Translation Started."})
-            self.publish_translation()
-            self.publish_status({"type": "status", "message": "Translation Completed."})
-        except Exception as e:
-            logger.error(f"Error in produce method: {e}")
+    def produce(self, request: Dict) -> Future:
+        """
+        Publish a finished translation with its status events; returns the translation's broker confirm.
+        Raises when the translation cannot be published, so its delivery is not acked.
+        """
+        logger.info("Producing translation request.")
+        self.publish_status({"type": "status", "message": "Translation Started.", "id": request.get('id')}, request.get('headers'))
+        published = self.publish_translation(request)
+        self.publish_status({"type": "status", "message": "Translation Completed.", "id": request.get('id')}, request.get('headers'))
+        return published
 
     def consume(self):
+        if settings.TRANSLATION_WORKERS > 1:
+            self.executor = ThreadPoolExecutor(max_workers=settings.TRANSLATION_WORKERS,
+                                               thread_name_prefix="translation-worker")
+        attempt = 0
         while not self.stop_event.is_set():
             try:
+                self.setup_rabbitmq()
                 def callback(ch, method, properties, body):
-                    logger.info(f"Received message from RabbitMQ: {body}")
+                    logger.debug(f"Received message from RabbitMQ: {body}")
+                    metrics.observe_dwell(settings.DETECTION_QUEUE, properties.headers)
                     try:
-                        message = json.loads(body.decode())
-                        logger.info(f"Processing message: {message}")
-                        text = message.get('text')
-                        source_lang = message.get('source_lang')
-                        target_lang = message.get('target_lang')
-                        
-                        # Retry logic for translation
-                        max_retries = 3
-                        for attempt in range(max_retries):
-                            try:
-                                translated_text = self.translate(text=text, source_lang=source_lang, target_lang=target_lang)
-                                message['translation_text'] = translated_text
-                                self.request = message  # Store the request for later use
-                                logger.info(f"Translation result: {translated_text}")
-                                self.produce()
-                                logger.info("Updated message published with translation.")
-                                break
-                            except Exception as e:
-                                logger.error(f"Attempt {attempt + 1} failed: {e}")
-                                if attempt + 1 == max_retries:
-                                    logger.error("Max retries reached. Failing the message.")
-                                    raise
-                                else:
-                                    logger.info("Retrying translation...")
-                        
+                        message = self.codec.decode(TRANSLATION_REQUEST, body, properties.headers)
+                        # Pipeline timestamps travel on with the result
+                        message['headers'] = properties.headers or {}
                     except Exception as e:
                         logger.error(f"Error processing message: {e}")
-                    finally:
                         ch.basic_ack(delivery_tag=method.delivery_tag)
+                        return
+                    if message.get('stream'):
+                        if self.executor is not None:
+                            self.executor.submit(self.run_stream, ch, method.delivery_tag, message)
+                        else:
+                            self.run_stream(ch, method.delivery_tag, message)
+                    elif settings.TRANSLATION_BATCH_MAX_SIZE > 1 and message.get('source_lang') \
+                            and len(message.get('target_langs') or []) <= 1:
+                        self.enqueue_batch(ch, method.delivery_tag, message)
+                    else:
+                        self.dispatch(ch, [(method.delivery_tag, message)])
 
                 logger.info("Starting to consume messages from RabbitMQ...")
+                # Bounds the deliveries that are unacked at once, i.e. in flight on the worker pool or waiting in a batch
+                self.channel.basic_qos(prefetch_count=settings.TRANSLATION_PREFETCH_COUNT)
                 self.channel.basic_consume(queue=settings.DETECTION_QUEUE, on_message_callback=callback)
                 logger.info("Waiting for messages...")
+                attempt = 0
                 while not self.stop_event.is_set():
                     self.connection.process_data_events(time_limit=1)
             except Exception as e:
                 logger.error(f"Error in consume method: {e}")
+                # Held batches belong to the dead channel; the broker redelivers their messages
+                self.batches.clear()
+                self.batch_timers.clear()
+                delay = min(settings.PUBLISHER_RECONNECT_MAX_BACKOFF, settings.PUBLISHER_RECONNECT_BACKOFF * 2 ** attempt)
+                attempt += 1
+                logger.info(f"Reconnecting consumer in {delay:.2f}s...")
+                self.stop_event.wait(delay)
+        if self.executor is not None:
+            # Let in-flight translations finish before their acks are flushed
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        # Acks wait for broker confirms, so drain those first and then run the queued acks
+        self.publisher.flush(timeout=settings.PUBLISH_CONFIRM_TIMEOUT)
+        if self.connection is None:
+            return
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except Exception as e:
+            logger.error(f"Error flushing acks on shutdown: {e}")
 
     def close(self):
         """Close RabbitMQ connection"""
+        translation_memory.close()
         try:
-            self.connection.close()
+            self.publisher.close()
+            if self.connection is not None:
+                self.connection.close()
             logger.info("RabbitMQ connection closed.")
         except Exception as e:
             logger.error(f"Error closing RabbitMQ connection: {e}")
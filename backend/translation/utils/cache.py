@@ -0,0 +1,203 @@
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str, str]
+
+# Whitespace other than line breaks
+SPACES = re.compile(r"[^\S\r\n]+")
+
+
+class TranslationMemory:
+    """
+    Translation memory keyed by (model, source_lang, target_lang, normalized text), where `model`
+    names the models that produce the translations, so changing them does not serve the old ones'.
+    Entries live in a bounded in-process LRU (by entry count, bytes and age) and,
+    when `db_path` is set, in a SQLite file that survives restarts. Disk writes are batched:
+    a put() writes the pending entries once there are `write_batch` of them or `write_interval`
+    seconds have passed since the last write, and close() writes the rest.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, db_path: str = "", model: str = "",
+                 write_batch: int = 1, write_interval: float = 0.0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.model = model
+        self.write_batch = write_batch
+        self.write_interval = write_interval
+        self.entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self.size_bytes = 0
+        self.lock = Lock()
+        # SQLite is only touched under its own lock, never while holding the LRU's
+        self.db_lock = Lock()
+        self.writes: List[Tuple] = []
+        self.last_write = time.monotonic()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self.db = None
+        if db_path:
+            self.setup_store(db_path)
+
+    def setup_store(self, db_path: str):
+        """Open (or create) the on-disk store."""
+        try:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(translation_memory)")]
+            if columns and "model" not in columns:
+                # Rows from before entries were keyed by model, and by line breaks; none of them can be trusted
+                self.db.execute("DROP TABLE translation_memory")
+                logger.info("Dropped translation memory rows stored without their model")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS translation_memory ("
+                "model TEXT, source_lang TEXT, target_lang TEXT, text TEXT, translation TEXT, created_at REAL, "
+                "PRIMARY KEY (model, source_lang, target_lang, text))"
+            )
+            # Expired rows are never served, drop them so the file does not grow forever
+            self.db.execute("DELETE FROM translation_memory WHERE created_at < ?", (time.time() - self.ttl,))
+            self.db.commit()
+            logger.info(f"Translation memory store opened at {db_path}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open translation memory store, continuing in memory only: {e}")
+            self.db = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Fold Unicode forms, and runs of spaces within each line, so trivially different inputs share an entry.
+        Line breaks are kept: texts laid out differently get translations laid out differently.
+        """
+        lines = unicodedata.normalize("NFC", text).split("\n")
+        return "\n".join(SPACES.sub(" ", line).strip(" ") for line in lines)
+
+    def key(self, text: str, source_lang: str, target_lang: str) -> CacheKey:
+        return (self.model, source_lang, target_lang, self.normalize(text))
+
+    @staticmethod
+    def entry_size(key: CacheKey, translation: str) -> int:
+        return len(key[3].encode()) + len(translation.encode())
+
+    def get(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        key = self.key(text, source_lang, target_lang)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                translation, created_at = entry
+                if now - created_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return translation
+                self._remove(key)
+                self.counters["expirations"] += 1
+            if self.db is None:
+                self.counters["misses"] += 1
+                return None
+
+        row = self._select(key)
+        with self.lock:
+            if row is not None and now - row[1] <= self.ttl:
+                if key not in self.entries:
+                    self._insert(key, row[0], row[1])
+                self.counters["disk_hits"] += 1
+                return row[0]
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, text: str, source_lang: str, target_lang: str, translation: str):
+        key = self.key(text, source_lang, target_lang)
+        created_at = time.time()
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self._insert(key, translation, created_at)
+            if self.db is None:
+                return
+            self.writes.append((*key, translation, created_at))
+            if len(self.writes) < self.write_batch and time.monotonic() - self.last_write < self.write_interval:
+                return
+            writes, self.writes = self.writes, []
+            self.last_write = time.monotonic()
+        self._write(writes)
+
+    def flush(self):
+        """Write the entries still waiting for their batch"""
+        with self.lock:
+            writes, self.writes = self.writes, []
+            self.last_write = time.monotonic()
+        self._write(writes)
+
+    def _select(self, key: CacheKey) -> Optional[Tuple[str, float]]:
+        with self.db_lock:
+            if self.db is None:
+                return None
+            try:
+                return self.db.execute(
+                    "SELECT translation, created_at FROM translation_memory "
+                    "WHERE model = ? AND source_lang = ? AND target_lang = ? AND text = ?", key
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read translation memory entry: {e}")
+                return None
+
+    def _write(self, writes: List[Tuple]):
+        if not writes:
+            return
+        with self.db_lock:
+            if self.db is None:
+                return
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO translation_memory VALUES (?, ?, ?, ?, ?, ?)", writes)
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to persist {len(writes)} translation memory entries: {e}")
+
+    def _insert(self, key: CacheKey, translation: str, created_at: float):
+        self.entries[key] = (translation, created_at)
+        self.size_bytes += self.entry_size(key, translation)
+        while self.entries and (len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: CacheKey):
+        translation, _ = self.entries.pop(key)
+        self.size_bytes -= self.entry_size(key, translation)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "size_bytes": self.size_bytes,
+                "hit_ratio": (lookups - self.counters["misses"]) / lookups if lookups else 0.0,
+                "persistent": self.db is not None,
+            }
+
+    def close(self):
+        self.flush()
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+translation_memory = TranslationMemory(
+    max_entries=settings.TRANSLATION_CACHE_MAX_ENTRIES,
+    max_bytes=settings.TRANSLATION_CACHE_MAX_BYTES,
+    ttl=settings.TRANSLATION_CACHE_TTL,
+    db_path=settings.TRANSLATION_CACHE_DB_PATH,
+    model=",".join(settings.TRANSLATION_MODELS),
+    write_batch=settings.TRANSLATION_CACHE_WRITE_BATCH,
+    write_interval=settings.TRANSLATION_CACHE_WRITE_INTERVAL,
+)
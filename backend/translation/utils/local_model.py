@@ -0,0 +1,205 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Dict, Iterator, List, Optional
+from core.config import settings
+from common.metrics import metrics
+from utils.router import CallCancelled
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WEIGHT_FILES = (".safetensors", ".bin")
+
+# ISO 639-1 codes to the FLORES-200 codes multilingual (NLLB) models are prompted with
+NLLB_CODES = {
+    "ar": "arb_Arab", "de": "deu_Latn", "en": "eng_Latn", "es": "spa_Latn", "fr": "fra_Latn",
+    "hi": "hin_Deva", "it": "ita_Latn", "ja": "jpn_Jpan", "ko": "kor_Hang", "nl": "nld_Latn",
+    "pl": "pol_Latn", "pt": "por_Latn", "ru": "rus_Cyrl", "tr": "tur_Latn", "uk": "ukr_Cyrl",
+    "zh": "zho_Hans",
+}
+
+
+class StopWhenCancelled:
+    """Generation stopping criterion that ends every sequence once `cancelled` is set."""
+
+    def __init__(self, cancelled: Event) -> None:
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class LocalModel:
+    """A seq2seq model and its tokenizer, loaded for CPU inference."""
+
+    def __init__(self, path: str, tokenizer, model, size_bytes: int, multilingual: bool) -> None:
+        self.path = path
+        self.tokenizer = tokenizer
+        self.model = model
+        self.size_bytes = size_bytes
+        self.multilingual = multilingual
+        # One generate() at a time gets all the intra-op threads, which keeps its latency predictable
+        self.lock = Lock()
+
+    def generate(self, texts: List[str], source_lang: str, target_lang: str,
+                 cancelled: Optional[Event] = None) -> List[str]:
+        """Translate `texts` in batches of LOCAL_MODEL_BATCH_SIZE, similar lengths together to keep padding small"""
+        import torch
+        from transformers import StoppingCriteriaList
+        options = {"max_new_tokens": settings.LOCAL_MODEL_MAX_NEW_TOKENS, "num_beams": settings.LOCAL_MODEL_NUM_BEAMS}
+        if cancelled is not None:
+            options["stopping_criteria"] = StoppingCriteriaList([StopWhenCancelled(cancelled)])
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        results: List[Optional[str]] = [None] * len(texts)
+        with self.lock, torch.inference_mode():
+            if self.multilingual:
+                self.tokenizer.src_lang = self.language_code(source_lang)
+                options["forced_bos_token_id"] = self.tokenizer.convert_tokens_to_ids(self.language_code(target_lang))
+            for start in range(0, len(order), settings.LOCAL_MODEL_BATCH_SIZE):
+                batch = order[start:start + settings.LOCAL_MODEL_BATCH_SIZE]
+                inputs = self.tokenizer([texts[index] for index in batch], return_tensors="pt",
+                                        padding=True, truncation=True)
+                output = self.model.generate(**inputs, **options)
+                if cancelled is not None and cancelled.is_set():
+                    raise CallCancelled(self.path)
+                for index, translation in zip(batch, self.tokenizer.batch_decode(output, skip_special_tokens=True)):
+                    results[index] = translation
+        return results
+
+    @staticmethod
+    def language_code(lang: str) -> str:
+        if lang not in NLLB_CODES:
+            raise ValueError(f"No multilingual model language code for '{lang}'")
+        return NLLB_CODES[lang]
+
+
+class LocalModelCache:
+    """
+    Models loaded from LOCAL_MODEL_PATH, kept in an LRU whose total size stays within a RAM budget.
+    Per-pair (Marian) paths give one entry per language pair; a multilingual (NLLB) path is one
+    entry shared by every pair. Before a model is loaded, the least recently used ones are unloaded
+    until its weights fit. An unloaded model still serving a call is freed once that call returns.
+    """
+
+    def __init__(self, path_pattern: str, budget_bytes: int) -> None:
+        self.path_pattern = path_pattern
+        self.budget_bytes = budget_bytes
+        self.models: "OrderedDict[str, LocalModel]" = OrderedDict()
+        self.size_bytes = 0
+        self.lock = Lock()
+        # Models load one at a time, so two loads never both count on the same free memory
+        self.load_lock = Lock()
+
+    def path(self, source_lang: str, target_lang: str) -> str:
+        return self.path_pattern.format(src=source_lang, tgt=target_lang)
+
+    def get(self, source_lang: str, target_lang: str) -> LocalModel:
+        """The model for a language pair, loading it on first use; raises FileNotFoundError for a pair without one"""
+        path = self.path(source_lang, target_lang)
+        model = self.lookup(path)
+        if model is not None:
+            return model
+        with self.load_lock:
+            model = self.lookup(path)
+            if model is not None:
+                return model
+            if not os.path.isdir(path):
+                raise FileNotFoundError(f"No local model for {source_lang}-{target_lang} at {path}")
+            estimate = self.weights_size(path)
+            if estimate > self.budget_bytes:
+                raise MemoryError(f"Model at {path} ({estimate >> 20} MB) exceeds the local model budget")
+            with self.lock:
+                self.evict(self.budget_bytes - estimate)
+            model = self.load(path, multilingual="{src}" not in self.path_pattern)
+            with self.lock:
+                self.models[path] = model
+                self.size_bytes += model.size_bytes
+                # The estimate came from the files on disk; make room for what the model really takes
+                self.evict(self.budget_bytes, keep=path)
+            return model
+
+    def lookup(self, path: str) -> Optional[LocalModel]:
+        with self.lock:
+            model = self.models.get(path)
+            if model is not None:
+                self.models.move_to_end(path)
+            return model
+
+    def evict(self, budget_bytes: int, keep: Optional[str] = None):
+        """Unload the least recently used models until the rest fit in `budget_bytes`; call with the lock held"""
+        for path in list(self.models):
+            if self.size_bytes <= budget_bytes:
+                return
+            if path == keep:
+                continue
+            model = self.models.pop(path)
+            self.size_bytes -= model.size_bytes
+            metrics.inc("local_model_evictions_total")
+            logger.info(f"Unloaded local model {path} ({model.size_bytes >> 20} MB)")
+
+    @staticmethod
+    def weights_size(path: str) -> int:
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(WEIGHT_FILES))
+
+    @staticmethod
+    def load(path: str, multilingual: bool) -> LocalModel:
+        # Imported lazily so deployments without local models do not need torch
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        start = time.perf_counter()
+        if settings.LOCAL_MODEL_THREADS:
+            torch.set_num_threads(settings.LOCAL_MODEL_THREADS)
+        tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+        model = AutoModelForSeq2SeqLM.from_pretrained(path, local_files_only=True).eval()
+        if settings.LOCAL_MODEL_QUANTIZE:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        size_bytes = 0
+        for value in model.state_dict().values():
+            # Quantized layers keep their weights as (weight, bias) tuples of packed tensors
+            for tensor in value if isinstance(value, tuple) else (value,):
+                if isinstance(tensor, torch.Tensor):
+                    size_bytes += tensor.numel() * tensor.element_size()
+        metrics.inc("local_model_loads_total")
+        metrics.observe("local_model_load_seconds", time.perf_counter() - start)
+        logger.info(f"Loaded local model {path} ({size_bytes >> 20} MB) in {time.perf_counter() - start:.1f}s")
+        return LocalModel(path, tokenizer, model, size_bytes, multilingual)
+
+
+local_models = LocalModelCache(settings.LOCAL_MODEL_PATH, settings.LOCAL_MODEL_MEMORY_BUDGET_MB << 20)
+
+
+class LocalSeq2SeqBackend:
+    """
+    Model backend translating on this machine's CPU with the models in LOCAL_MODEL_PATH.
+    A pair without a local model fails at once, so the router moves the call to the next backend.
+    It has no detect_and_translate: seq2seq models do not detect languages, so the router sends
+    combined-mode calls to the other backends.
+    """
+
+    name = "local"
+
+    def translate(self, source_lang: str = "en", target_lang: str = "fr", text: str = None,
+                  cancelled: Optional[Event] = None) -> str:
+        with metrics.timer("translation_model_seconds", call="translate"):
+            return local_models.get(source_lang, target_lang).generate([text], source_lang, target_lang, cancelled)[0]
+
+    def translate_stream(self, source_lang: str = "en", target_lang: str = "fr", text: str = None) -> Iterator[str]:
+        """Local generation is not streamed; the whole translation arrives as one chunk"""
+        yield self.translate(source_lang=source_lang, target_lang=target_lang, text=text)
+
+    def translate_multi(self, source_lang: str = "en", target_langs: List[str] = None, text: str = None,
+                        cancelled: Optional[Event] = None) -> Dict[str, str]:
+        with metrics.timer("translation_model_seconds", call="translate_multi"):
+            return {
+                target_lang: local_models.get(source_lang, target_lang).generate([text], source_lang, target_lang, cancelled)[0]
+                for target_lang in target_langs
+            }
+
+    def translate_batch(self, source_lang: str = "en", target_lang: str = "fr", texts: List[str] = None,
+                        cancelled: Optional[Event] = None) -> List[str]:
+        with metrics.timer("translation_model_seconds", call="translate_batch"):
+            return local_models.get(source_lang, target_lang).generate(texts, source_lang, target_lang, cancelled)
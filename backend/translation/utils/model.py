@@ -1,22 +1,134 @@
+import json
+import time
+from threading import Event
+from typing import Dict, Iterator, List, Optional, Tuple
+from core.config import settings
+from common.metrics import metrics
+from utils.router import CallCancelled, ModelRouter
+from utils.local_model import LocalSeq2SeqBackend
 from openai import OpenAI
 from dotenv import load_dotenv
 
 class OpenAiUtilityService:
-    def __init__(self, model : str = "gpt-4o-mini"):
+    def __init__(self, model : str = "gpt-4o-mini", base_url : Optional[str] = None):
         load_dotenv()
         self.model = model
-        self.client = OpenAI()
-        
-    
-    def translate(self, source_lang : str = "en", target_lang : str = "fr", text : str = None):
-        response = self.client.chat.completions.create(
+        # Any OpenAI-compatible endpoint, e.g. a self-hosted model server
+        self.client = OpenAI(base_url=base_url) if base_url else OpenAI()
+        self.name = f"openai:{model}" + (f"@{base_url}" if base_url else "")
+
+    def complete(self, messages : List[Dict], cancelled : Optional[Event] = None, **options) -> str:
+        """
+        The content of one chat completion.
+        A call that can be cancelled (see utils/router.py) streams, so it can hang up as soon as
+        `cancelled` is set instead of paying for the rest of the answer.
+        """
+        if cancelled is None:
+            response = self.client.chat.completions.create(model=self.model, messages=messages, **options)
+            return response.choices[0].message.content
+        stream = self.client.chat.completions.create(model=self.model, messages=messages, stream=True, **options)
+        parts = []
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    raise CallCancelled(self.name)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            stream.close()
+        return "".join(parts)
+
+    def prompt(self, source_lang : str, target_lang : str, text : str):
+        return [
+            {"role": "system", "content": f"You will be provided with a user input in language_code: {source_lang}.\nTranslate the text into language_code: {target_lang}.\nOnly output the translated text, without any additional text."},
+            {"role": "user", "content": f"{text}"}
+        ]
+
+    def translate(self, source_lang : str = "en", target_lang : str = "fr", text : str = None, cancelled : Optional[Event] = None):
+        with metrics.timer("translation_model_seconds", call="translate"):
+            return self.complete(self.prompt(source_lang, target_lang, text), cancelled)
+
+    def translate_stream(self, source_lang : str = "en", target_lang : str = "fr", text : str = None) -> Iterator[str]:
+        """Yield the translation piece by piece as the model produces it."""
+        start = time.perf_counter()
+        stream = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": f"You will be provided with a user input in language_code: {source_lang}.\nTranslate the text into language_code: {target_lang}.\nOnly output the translated text, without any additional text."},
-                {"role": "user", "content": f"{text}"}
-            ]
+            messages=self.prompt(source_lang, target_lang, text),
+            stream=True
         )
-        return response.choices[0].message.content
+        first = True
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    metrics.observe("translation_model_first_token_seconds", time.perf_counter() - start)
+                    first = False
+                yield chunk.choices[0].delta.content
+        metrics.observe("translation_model_seconds", time.perf_counter() - start, call="translate_stream")
+
+    def translate_multi(self, source_lang : str = "en", target_langs : List[str] = None, text : str = None,
+                        cancelled : Optional[Event] = None) -> Dict[str, str]:
+        """Translate one text into several languages in a single request; returns {language_code: translation}."""
+        with metrics.timer("translation_model_seconds", call="translate_multi"):
+            content = self.complete(
+                cancelled=cancelled,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": f"You will be provided with a user input in language_code: {source_lang}.\nTranslate the text into each of these language_codes: {', '.join(target_langs)}.\nRespond with a JSON object {{\"translations\": {{\"<language_code>\": \"...\"}}}} with exactly one entry per requested language_code."},
+                    {"role": "user", "content": f"{text}"}
+                ]
+            )
+        translations = json.loads(content).get("translations")
+        if not isinstance(translations, dict) or set(translations) != set(target_langs) \
+                or not all(isinstance(t, str) for t in translations.values()):
+            raise ValueError(f"Multi-target translation returned a malformed result for {target_langs}")
+        return translations
+
+    def detect_and_translate(self, target_lang : str = "fr", text : str = None,
+                             cancelled : Optional[Event] = None) -> Tuple[str, str]:
+        """Identify the source language and translate in a single request; returns (source_lang, translation)."""
+        with metrics.timer("translation_model_seconds", call="detect_and_translate"):
+            content = self.complete(
+                cancelled=cancelled,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": f"You will be provided with a user input in an unknown language.\nIdentify the language_code of the input (i.e. en, fr etc) and translate the text into language_code: {target_lang}.\nRespond with a JSON object {{\"source_lang\": \"...\", \"translation\": \"...\"}} and nothing else."},
+                    {"role": "user", "content": f"{text}"}
+                ]
+            )
+        result = json.loads(content)
+        source_lang, translation = result.get("source_lang"), result.get("translation")
+        if not isinstance(source_lang, str) or not isinstance(translation, str):
+            raise ValueError("Combined detection and translation returned a malformed result")
+        return source_lang.strip().lower(), translation
+
+    def translate_batch(self, source_lang : str = "en", target_lang : str = "fr", texts : List[str] = None,
+                        cancelled : Optional[Event] = None) -> List[str]:
+        """Translate several segments in one request; segments travel as a JSON array so they cannot bleed into each other."""
+        with metrics.timer("translation_model_seconds", call="translate_batch"):
+            content = self.complete(
+                cancelled=cancelled,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": f"You will be provided with a JSON object whose \"segments\" array holds texts in language_code: {source_lang}.\nTranslate every segment into language_code: {target_lang}.\nRespond with a JSON object {{\"translations\": [...]}} containing exactly one translated string per segment, in the same order. Never merge, split or omit segments."},
+                    {"role": "user", "content": json.dumps({"segments": texts}, ensure_ascii=False)}
+                ]
+            )
+        translations = json.loads(content).get("translations")
+        if not isinstance(translations, list) or len(translations) != len(texts) \
+                or not all(isinstance(t, str) for t in translations):
+            raise ValueError(f"Batch translation returned a malformed result for {len(texts)} segments")
+        return translations
     
 
-model = OpenAiUtilityService()
\ No newline at end of file
+def create_backend(spec : str):
+    """A model backend from its TRANSLATION_MODELS entry, `openai:<model>[@<base_url>]` or `local`"""
+    kind, _, target = spec.partition(":")
+    if kind == "local":
+        return LocalSeq2SeqBackend()
+    if kind == "openai":
+        name, _, base_url = target.partition("@")
+        return OpenAiUtilityService(name or "gpt-4o-mini", base_url or None)
+    raise ValueError(f"Unknown model backend {spec!r}")
+
+
+model = ModelRouter([create_backend(spec) for spec in settings.TRANSLATION_MODELS])
\ No newline at end of file
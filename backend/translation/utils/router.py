@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from core.config import settings
+from common.metrics import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Model calls a backend may implement; a backend without one of these methods is skipped for that call
+CALLS = ("translate", "translate_stream", "translate_multi", "detect_and_translate", "translate_batch")
+
+
+class CallCancelled(Exception):
+    """Raised inside a backend call that lost its hedge race and hung up."""
+
+
+class LatencyWindow:
+    """The last `size` latencies of one backend for one kind of call and language pair."""
+
+    def __init__(self, size: int) -> None:
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """None until the window holds TRANSLATION_LATENCY_MIN_SAMPLES latencies"""
+        if len(self.samples) < settings.TRANSLATION_LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Sends model calls to the first of several backends, hedging slow ones on another.
+    Every backend gets a rolling latency window per kind of call and language pair. When the
+    primary has not answered within its TRANSLATION_HEDGE_QUANTILE latency, the same call goes to
+    the secondary (the fastest of the others for that pair), the first answer wins and the loser
+    is cancelled. A primary that fails is retried on the secondary right away. Hedges are capped
+    at TRANSLATION_HEDGE_BUDGET of all calls, so a primary that slows down across the board costs
+    at most that much extra. With a single backend calls go straight to it.
+    Each kind of call only goes to the backends that implement it, in their configured order,
+    e.g. detect_and_translate skips the local backend, which cannot detect languages.
+    """
+
+    def __init__(self, backends: List) -> None:
+        if not backends:
+            raise ValueError("The model router needs at least one backend")
+        self.backends = backends
+        self.capable: Dict[str, List] = {call: [backend for backend in backends if hasattr(backend, call)] for call in CALLS}
+        for call, capable in self.capable.items():
+            if not capable:
+                logger.warning(f"No model backend implements {call}; those calls will fail")
+        self.lock = threading.Lock()
+        self.windows: Dict[Tuple[str, str, str, str], LatencyWindow] = {}
+        # Calls and hedges so far, halved every 1000 calls so the budget follows recent traffic
+        self.calls = 0
+        self.hedges = 0
+        self.executor = ThreadPoolExecutor(max_workers=settings.TRANSLATION_HEDGE_WORKERS,
+                                           thread_name_prefix="model-hedge") if len(backends) > 1 else None
+        logger.info(f"Model backends: {[backend.name for backend in backends]}")
+
+    def window(self, backend, call: str, pair: Tuple[str, str]) -> LatencyWindow:
+        key = (backend.name, call) + pair
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = LatencyWindow(settings.TRANSLATION_LATENCY_WINDOW)
+            return window
+
+    def secondary(self, call: str, pair: Tuple[str, str]):
+        """The backend with the lowest median latency for the pair, after the primary; configured order until measured"""
+        def rank(indexed):
+            index, backend = indexed
+            median = self.window(backend, call, pair).quantile(0.5)
+            return (median if median is not None else float("inf"), index)
+        return min(enumerate(self.capable[call][1:]), key=rank)[1]
+
+    def hedge_delay(self, call: str, pair: Tuple[str, str]) -> float:
+        delay = self.window(self.capable[call][0], call, pair).quantile(settings.TRANSLATION_HEDGE_QUANTILE)
+        return delay if delay is not None else settings.TRANSLATION_HEDGE_INITIAL_DELAY
+
+    def take_hedge(self) -> bool:
+        """Whether the hedging budget has room for one more hedge"""
+        with self.lock:
+            if self.hedges >= settings.TRANSLATION_HEDGE_BUDGET * self.calls + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    def count_call(self):
+        with self.lock:
+            self.calls += 1
+            if self.calls >= 1000:
+                self.calls //= 2
+                self.hedges //= 2
+
+    def timed(self, backend, call: str, pair: Tuple[str, str], invoke: Callable, cancelled: Optional[threading.Event]):
+        """Run one backend call, recording its latency when it completes"""
+        start = time.perf_counter()
+        try:
+            result = invoke(backend, cancelled)
+        except CallCancelled:
+            raise
+        except Exception:
+            metrics.inc("model_backend_failures_total", backend=backend.name, call=call)
+            raise
+        seconds = time.perf_counter() - start
+        self.window(backend, call, pair).add(seconds)
+        metrics.observe("model_backend_seconds", seconds, backend=backend.name, call=call)
+        return result
+
+    def route(self, call: str, pair: Tuple[str, str], invoke: Callable):
+        """
+        Run `invoke(backend, cancelled)` on the primary, hedged on the secondary when it is slow or fails.
+        `cancelled` is set on the call that lost, which then stops and raises CallCancelled.
+        """
+        backends = self.capable[call]
+        if not backends:
+            raise NotImplementedError(f"None of the model backends {[backend.name for backend in self.backends]} "
+                                      f"implements {call}; add one to TRANSLATION_MODELS")
+        primary = backends[0]
+        if len(backends) == 1:
+            return self.timed(primary, call, pair, invoke, None)
+        self.count_call()
+        attempts: Dict[Future, Tuple[object, threading.Event]] = {}
+
+        def start(backend, reason: str) -> Future:
+            if backend is not primary:
+                logger.info(f"Hedging {call} {pair[0]}-{pair[1]} on {backend.name}: {reason}")
+            cancelled = threading.Event()
+            future = self.executor.submit(self.timed, backend, call, pair, invoke, cancelled)
+            attempts[future] = (backend, cancelled)
+            return future
+
+        done, pending = wait({start(primary, "")}, timeout=self.hedge_delay(call, pair))
+        if not done:
+            if self.take_hedge():
+                pending.add(start(self.secondary(call, pair), "primary is slow"))
+            else:
+                metrics.inc("model_hedges_total", outcome="over_budget")
+        error = None
+        while True:
+            for future in done:
+                backend, _ = attempts[future]
+                if future.exception() is None:
+                    for loser in pending:
+                        attempts[loser][1].set()
+                        loser.cancel()
+                    if len(attempts) > 1:
+                        metrics.inc("model_hedges_total", outcome="won" if backend is not primary else "lost")
+                    return future.result()
+                error = future.exception()
+                logger.warning(f"Model call {call} on {backend.name} failed: {error!r}")
+            if error is not None and len(attempts) == 1:
+                # A failed primary is retried on the secondary whatever the budget says
+                pending.add(start(self.secondary(call, pair), "primary failed"))
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def translate(self, source_lang: str = "en", target_lang: str = "fr", text: str = None) -> str:
+        return self.route("translate", (source_lang, target_lang), lambda backend, cancelled: backend.translate(
+            source_lang=source_lang, target_lang=target_lang, text=text, cancelled=cancelled))
+
+    def translate_stream(self, source_lang: str = "en", target_lang: str = "fr", text: str = None) -> Iterator[str]:
+        """
+        Streams are not hedged: their first chunks are on their way to the client before a hedge could win.
+        A backend that fails before its first chunk is replaced by the next one; a failure after that is raised.
+        """
+        backends = self.capable["translate_stream"]
+        for position, backend in enumerate(backends):
+            stream = backend.translate_stream(source_lang=source_lang, target_lang=target_lang, text=text)
+            try:
+                first = next(stream)
+            except StopIteration:
+                return
+            except Exception as e:
+                metrics.inc("model_backend_failures_total", backend=backend.name, call="translate_stream")
+                if position + 1 == len(backends):
+                    raise
+                logger.warning(f"Stream {source_lang}-{target_lang} on {backend.name} failed before its first chunk, "
+                               f"moving to {backends[position + 1].name}: {e!r}")
+                continue
+            yield first
+            yield from stream
+            return
+        raise NotImplementedError("No model backend implements translate_stream")
+
+    def translate_multi(self, source_lang: str = "en", target_langs: List[str] = None, text: str = None) -> Dict[str, str]:
+        return self.route("translate_multi", (source_lang, ",".join(target_langs)), lambda backend, cancelled: backend.translate_multi(
+            source_lang=source_lang, target_langs=target_langs, text=text, cancelled=cancelled))
+
+    def detect_and_translate(self, target_lang: str = "fr", text: str = None) -> Tuple[str, str]:
+        return self.route("detect_and_translate", ("auto", target_lang), lambda backend, cancelled: backend.detect_and_translate(
+            target_lang=target_lang, text=text, cancelled=cancelled))
+
+    def translate_batch(self, source_lang: str = "en", target_lang: str = "fr", texts: List[str] = None) -> List[str]:
+        return self.route("translate_batch", (source_lang, target_lang), lambda backend, cancelled: backend.translate_batch(
+            source_lang=source_lang, target_lang=target_lang, texts=texts, cancelled=cancelled))
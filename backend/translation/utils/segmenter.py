@@ -0,0 +1,64 @@
+import re
+from typing import List, Tuple
+
+
+class Segmenter:
+    """Language-aware sentence and paragraph splitter for long translation inputs."""
+
+    # Scripts that end sentences without a following space
+    NO_SPACE_LANGUAGES = {"zh", "ja"}
+
+    PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+    # Terminal punctuation, optional closing quotes/brackets, then the whitespace that follows
+    SENTENCE_END = re.compile(r"[.!?…؟۔।]+['\"”’»)\]]*\s+")
+    SENTENCE_END_NO_SPACE = re.compile(r"[。！？.!?]+['\"”’」』)\]]*\s*")
+
+    def split_sentences(self, text: str, lang: str = "") -> List[str]:
+        """Split a paragraph after each sentence end, keeping the trailing whitespace with the sentence."""
+        no_space = (lang or "").split("-")[0].lower() in self.NO_SPACE_LANGUAGES
+        pattern = self.SENTENCE_END_NO_SPACE if no_space else self.SENTENCE_END
+        sentences, start = [], 0
+        for match in pattern.finditer(text):
+            sentences.append(text[start:match.end()])
+            start = match.end()
+        if start < len(text):
+            sentences.append(text[start:])
+        return sentences
+
+    def segment(self, text: str, lang: str = "", max_chars: int = 1000) -> List[str]:
+        """
+        Cut text into chunks of whole sentences up to `max_chars` long, never spanning a paragraph.
+        Joining the chunks gives back the original text exactly.
+        """
+        chunks = []
+        for paragraph in self.PARAGRAPH_BREAK.split(text):
+            if not paragraph:
+                continue
+            if self.PARAGRAPH_BREAK.fullmatch(paragraph):
+                # Paragraph separators ride along with the previous chunk
+                if chunks:
+                    chunks[-1] += paragraph
+                else:
+                    chunks.append(paragraph)
+                continue
+            current = ""
+            for sentence in self.split_sentences(paragraph, lang):
+                if current and len(current) + len(sentence) > max_chars:
+                    chunks.append(current)
+                    current = ""
+                current += sentence
+            if current:
+                chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def strip_edges(chunk: str) -> Tuple[str, str, str]:
+        """Split a chunk into (leading whitespace, content, trailing whitespace)."""
+        content = chunk.strip()
+        if not content:
+            return chunk, "", ""
+        start = chunk.index(content)
+        return chunk[:start], content, chunk[start + len(content):]
+
+
+segmenter = Segmenter()
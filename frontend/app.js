@@ -2,12 +2,11 @@ class ChatApp {
     constructor() {
         this.socket = null;
         this.roomId = 'default-room';
-        this.lastStatusResponse = null; // Track the last status to avoid duplicate notifications
-        this.statusCheckInterval = null; // Store interval reference
+        this.lastStatusResponse = null; // Latest status event received for this client's requests
         this.initializeElements();
         this.setupEventListeners();
         this.connectWebSocket();
-        this.startAutoStatusCheck();
+        // Status events are pushed over the WebSocket; the server keeps no global status to poll
     }
 
     initializeElements() {
@@ -26,86 +25,16 @@ class ChatApp {
                 this.sendMessage();
             }
         });
-        this.statusButton.addEventListener('click', () => this.getStatus(true)); // Force notification when manually clicked
+        this.statusButton.addEventListener('click', () => this.getStatus());
     }
 
-    // Start automatic status check every second
-    startAutoStatusCheck() {
-        // Clear any existing interval
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
+    // Show the latest status event pushed over this client's WebSocket
+    getStatus() {
+        if (!this.lastStatusResponse) {
+            this.showNotification('info', 'No status message available.');
+            return;
         }
-        
-        // Set up the new interval
-        this.statusCheckInterval = setInterval(() => {
-            this.getStatus(false); // Don't force notification on auto-check
-        }, 1000); // Check every 1000ms (1 second)
-    }
-
-    // Stop automatic status check
-    stopAutoStatusCheck() {
-        if (this.statusCheckInterval) {
-            clearInterval(this.statusCheckInterval);
-            this.statusCheckInterval = null;
-        }
-    }
-
-    getStatus(forceNotification = false) {
-        const protocol = window.location.protocol
-        const host = window.location.hostname;
-        const port = '8000'; // Match your FastAPI server port
-        // Only show checking notification when manually clicked
-        if (forceNotification) {
-            this.showNotification('info', 'Checking server status...');
-        }
-        
-        fetch(`${protocol}//${host}:${port}/status`, {
-            method: 'GET',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Network response was not ok');
-            }
-            return response.json();
-        })
-        .then(data => {
-            console.log('Status Response:', data);
-            
-            // Determine if we should show a notification
-            const shouldNotify = forceNotification || 
-                                 !this.lastStatusResponse || 
-                                 JSON.stringify(data) !== JSON.stringify(this.lastStatusResponse);
-            
-            // Update the last status response
-            this.lastStatusResponse = data;
-            
-            // If status changed or notification is forced, show it
-            if (shouldNotify) {
-                // Determine the notification type based on status
-                let type = 'info';
-                if (data.status === 'online' || data.status === 'ok') {
-                    type = 'success';
-                } else if (data.status === 'offline' || data.status === 'error') {
-                    type = 'error';
-                } else if (data.status === 'warning') {
-                    type = 'warning';
-                }
-                
-                // Display the notification with the message from the server
-                this.showNotification(type, data.message || `Server status: ${data.status}`);
-            }
-        })
-        .catch(error => {
-            console.error('There was a problem with the fetch operation:', error);
-            // Only show error notification on forced check or when status changes
-            if (forceNotification || (this.lastStatusResponse !== null)) {
-                this.showNotification('error', 'Failed to fetch server status');
-                this.lastStatusResponse = null;
-            }
-        });
+        this.showNotification('info', this.lastStatusResponse.message);
     }
 
     // New method to show notification
@@ -172,7 +101,7 @@ class ChatApp {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
         const host = window.location.hostname;
         const port = '8000'; // Match your FastAPI server port
-        const wsUrl = `${protocol}//${host}:${port}/ws/chat/${this.roomId}`;
+        const wsUrl = `${protocol}//${host}:${port}/ws/chat/${this.roomId}?lang=${this.targetLang.value}`;
 
         this.socket = new WebSocket(wsUrl);
 
@@ -221,8 +150,13 @@ class ChatApp {
         if (data.type === 'system') {
             this.addSystemMessage(data.message);
         } else if (data.type === 'status') {
+            this.lastStatusResponse = data;
             this.addStatusMessage(data.message);
             this.showNotification('info', data.message);
+        } else if (data.type === 'busy') {
+            // Not translated: the server turned the message away, it can be sent again after data.retry_after seconds
+            this.addSystemMessage(`${data.message} Try again in ${Math.ceil(data.retry_after)}s.`);
+            this.showNotification('warning', data.message);
         } else {
             this.addMessage(data.text, 'received', data.translation_text);
         }